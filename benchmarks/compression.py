@@ -0,0 +1,139 @@
+"""Bytes on the wire and CPU cost of websocket compression for terminal output.
+
+Typical workloads run in terminals served by :class:`~terminado.TermSocket`
+with different compression options, and a websocket client offering
+permessage-deflate reads their output: a build log, a long directory listing,
+numbers from ``seq``, and keystrokes echoed by ``cat``. For each, the size of
+the messages and of what went over the wire are measured, with the CPU time
+of the process (server and client) per MB of output. For typing, the echo
+round trip time is measured as well. Results are printed as JSON.
+
+    python benchmarks/compression.py --configs off level1 level6 low_memory
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from typing import Any
+
+import tornado.httpserver
+import tornado.web
+import tornado.websocket
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+
+from stats import percentile
+from terminado import TermSocket, UniqueTermManager
+
+BUILD_LOG = (
+    "for i in range(20000): print(f'[{i:5d}/20000] \\x1b[32mCC\\x1b[0m "
+    "src/module_{i % 97}/file_{i}.c -o build/obj/module_{i % 97}/file_{i}.o')"
+)
+
+WORKLOADS = {
+    "build_log": [sys.executable, "-c", BUILD_LOG],
+    "listing": ["sh", "-c", "ls -lR /usr | head -n 50000"],
+    "numbers": ["seq", "1", "300000"],
+    "typing": ["cat"],
+}
+
+CONFIGS: dict[str, dict[str, Any] | None] = {
+    "off": None,
+    "level1": {},
+    "level6": {"compression_level": 6},
+    "level9": {"compression_level": 9},
+    "low_memory": {"mem_level": 1},
+}
+
+
+async def read_until_exit(ws: tornado.websocket.WebSocketClientConnection) -> None:
+    while True:
+        message = await ws.read_message()
+        if message is None or (isinstance(message, str) and '"disconnect"' in message):
+            return
+
+
+async def type_keys(ws: tornado.websocket.WebSocketClientConnection, keys: int) -> list[float]:
+    rtts = []
+    for i in range(keys):
+        key = "abcdefghijklmnopqrstuvwxyz"[i % 26]
+        start = time.perf_counter()
+        await ws.write_message(json.dumps(["stdin", key]))
+        while True:
+            message = await ws.read_message()
+            assert message is not None
+            if key in message:
+                break
+        rtts.append(time.perf_counter() - start)
+    return rtts
+
+
+async def measure(workload: str, config: str, args: argparse.Namespace) -> dict[str, object]:
+    tm = UniqueTermManager(shell_command=WORKLOADS[workload])
+    app = tornado.web.Application(
+        [(r"/websocket", TermSocket, {"term_manager": tm, "compression_options": CONFIGS[config]})]
+    )
+    sock, port = bind_unused_port()
+    server = tornado.httpserver.HTTPServer(app)
+    server.add_sockets([sock])
+
+    ws = await tornado.websocket.websocket_connect(
+        f"ws://127.0.0.1:{port}/websocket", compression_options={}
+    )
+    # The setup message
+    await ws.read_message()
+    start_cpu = time.process_time()
+    result: dict[str, object] = {"workload": workload, "config": config}
+    if workload == "typing":
+        rtts = await type_keys(ws, args.keys)
+        result["echo_rtt_ms"] = {
+            "p50": percentile(rtts, 50) * 1000,
+            "p99": percentile(rtts, 99) * 1000,
+        }
+    else:
+        await read_until_exit(ws)
+    cpu = time.process_time() - start_cpu
+    protocol: Any = ws.protocol
+    message_bytes = protocol._message_bytes_in
+    wire_bytes = protocol._wire_bytes_in
+    ws.close()
+    server.stop()
+    await tm.shutdown()
+
+    result.update(
+        {
+            "message_bytes": message_bytes,
+            "wire_bytes": wire_bytes,
+            "ratio": wire_bytes / message_bytes,
+            "cpu_ms_per_mb": cpu * 1000 / (message_bytes / 1e6),
+        }
+    )
+    return result
+
+
+async def run(args: argparse.Namespace) -> dict[str, object]:
+    results = [
+        await measure(workload, config, args)
+        for workload in args.workloads
+        for config in args.configs
+    ]
+    return {"benchmark": "compression", "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workloads", nargs="+", choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--keys", type=int, default=300, help="keystrokes typed")
+    args = parser.parse_args()
+    result = IOLoop.current().run_sync(lambda: run(args))
+    print(json.dumps(result, indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
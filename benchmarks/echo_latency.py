@@ -0,0 +1,170 @@
+"""Keystroke echo latency, and read-related system calls per pty wakeup.
+
+A terminal running ``cat`` is sent one character at a time, and the time until
+the pty's echo reaches a client of the terminal manager is measured, while
+other terminals run ``yes`` to keep the event loop busy, along with how that
+time splits into the stages traced by the manager. How late a timer on the
+event loop fires is measured too. Results are printed as JSON.
+
+    python benchmarks/echo_latency.py --samples 500 --noisy 4
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import select
+import statistics
+import sys
+import time
+from collections import Counter
+
+from tornado.ioloop import IOLoop
+
+from stats import percentile
+from terminado import UniqueTermManager
+from terminado.management import PtyWithClients
+
+# C functions which make one read-related system call each
+SYSCALL_WRAPPERS = {"read", "read1", "readinto", "readv", "poll", "select"}
+
+
+class EchoClient:
+    """A terminal client resolving a future when output arrives."""
+
+    size = (None, None)
+
+    def __init__(self) -> None:
+        self.waiter: asyncio.Future[float] | None = None
+
+    def on_pty_read(self, text: str) -> None:
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(time.perf_counter())
+
+    def on_pty_died(self) -> None:
+        pass
+
+
+class CountingManager(UniqueTermManager):
+    """Count the event loop wakeups for pty reads, and the calls they make."""
+
+    wakeups = 0
+    in_pty_read = False
+
+    def pty_read(self, fd: int, events: object = None) -> None:
+        self.wakeups += 1
+        self.in_pty_read = True
+        try:
+            super().pty_read(fd, events)
+        finally:
+            self.in_pty_read = False
+
+
+async def keystroke(
+    tm: UniqueTermManager, term: PtyWithClients, client: EchoClient, data: str
+) -> float:
+    client.waiter = asyncio.get_running_loop().create_future()
+    start = time.perf_counter()
+    tm.write_input(term, data)
+    return await asyncio.wait_for(client.waiter, 5) - start
+
+
+async def run(args: argparse.Namespace) -> dict[str, object]:
+    tm = CountingManager(
+        shell_command=["cat"],
+        io_threads=args.io_threads,
+        read_budget=args.read_budget or None,
+        trace_latency=True,
+    )
+    echo = tm.new_terminal()
+    tm.start_reading(echo)
+    client = EchoClient()
+    echo.clients.append(client)
+    for _ in range(args.noisy):
+        tm.start_reading(tm.new_terminal(shell_command=["yes"]))
+    await asyncio.sleep(0.5)
+
+    latencies = []
+    # How late timers fire, as a measure of what other work on the loop sees
+    lags = []
+    for _ in range(args.samples):
+        latencies.append(await keystroke(tm, echo, client, "x"))
+        # Erase the character again so cat's line buffer never fills up
+        await keystroke(tm, echo, client, "\x7f")
+        start = time.perf_counter()
+        await asyncio.sleep(args.interval)
+        lags.append(time.perf_counter() - start - args.interval)
+
+    # Count system calls separately: profiling slows everything down.
+    calls: Counter[str] = Counter()
+
+    def profile(frame: object, event: str, arg: object) -> None:
+        name = getattr(arg, "__name__", "")
+        # select.poll() only creates the poll object
+        if (
+            event == "c_call"
+            and tm.in_pty_read
+            and name in SYSCALL_WRAPPERS
+            and arg is not select.poll
+        ):
+            calls[name] += 1
+
+    tm.wakeups = 0
+    sys.setprofile(profile)
+    try:
+        await asyncio.sleep(args.profile_time)
+    finally:
+        sys.setprofile(None)
+    wakeups = tm.wakeups
+
+    assert echo.latency is not None
+    stages = echo.latency.percentiles()
+    await tm.kill_all()
+    return {
+        "benchmark": "echo_latency",
+        "samples": args.samples,
+        "noisy_terminals": args.noisy,
+        "io_threads": args.io_threads,
+        "read_budget": args.read_budget,
+        "echo_latency_ms": {
+            "mean": statistics.mean(latencies) * 1000,
+            "p50": percentile(latencies, 50) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000,
+        },
+        # Where the time goes on the server, from the manager's trace. It
+        # includes the erasing keystrokes.
+        "server_stages_ms": {
+            stage: {key: value * 1000 for key, value in stats.items() if key != "count"}
+            for stage, stats in stages.items()
+        },
+        "timer_lag_ms": {
+            "p50": percentile(lags, 50) * 1000,
+            "p99": percentile(lags, 99) * 1000,
+        },
+        "pty_read_wakeups": wakeups,
+        "read_syscalls": dict(calls),
+        "read_syscalls_per_wakeup": sum(calls.values()) / max(wakeups, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--noisy", type=int, default=4, help="terminals running yes")
+    parser.add_argument("--interval", type=float, default=0.01, help="between keystrokes, in s")
+    parser.add_argument("--profile-time", type=float, default=1.0, help="in s")
+    parser.add_argument("--io-threads", type=int, default=0, help="read ptys in threads")
+    parser.add_argument(
+        "--read-budget", type=int, default=262144, help="bytes per loop iteration, 0 for none"
+    )
+    args = parser.parse_args()
+    result = IOLoop.current().run_sync(lambda: run(args))
+    print(json.dumps(result, indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
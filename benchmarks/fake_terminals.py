@@ -0,0 +1,129 @@
+"""Cost of many terminals producing output at a steady rate.
+
+The terminals are fakes from :class:`terminado.backends.FakePtyBackend`, so
+thousands of them can run without a process each. Every terminal writes
+``--rate`` bytes per second, in chunks of ``--chunk-size`` bytes, to one
+client counting what it is sent. For each number of terminals, the output
+delivered is compared with the output written, and the CPU used and how late
+a timer on the event loop fires are measured. The CPU time includes the
+backend's thread writing the output. Results are printed as JSON.
+
+    python benchmarks/fake_terminals.py --terminals 100 1000 2000 --rate 2000
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import time
+
+from tornado.ioloop import IOLoop
+
+from stats import percentile
+from terminado import UniqueTermManager
+from terminado.backends import FakePtyBackend
+from terminado.websocket import OutputFrames
+
+LINE = b"terminado fake output \xe2\x80\x94 \xc3\xbcn\xc3\xafc\xc3\xb6d\xc3\xa9\r\n"
+
+
+class FramesClient:
+    """A terminal client counting the output it is sent."""
+
+    size = (None, None)
+
+    def __init__(self) -> None:
+        self.bytes = 0
+
+    def on_pty_frames(self, frames: OutputFrames) -> None:
+        self.bytes += len(frames.binary) - 1
+
+    def on_pty_read(self, text: str) -> None:
+        self.bytes += len(text.encode("utf-8"))
+
+    def on_pty_died(self) -> None:
+        pass
+
+
+async def measure(terminals: int, args: argparse.Namespace) -> dict[str, object]:
+    script = LINE * (args.chunk_size // len(LINE) + 1)
+    backend = FakePtyBackend(
+        output=script[: args.chunk_size], rate=args.rate, chunk_size=args.chunk_size, repeat=None
+    )
+    tm = UniqueTermManager(shell_command=["fake"], pty_backend=backend)
+    clients = []
+    spawn_start = time.perf_counter()
+    for _ in range(terminals):
+        term = await tm.async_new_terminal()
+        client = FramesClient()
+        term.clients.append(client)
+        clients.append(client)
+        tm.start_reading(term)
+    spawn_seconds = time.perf_counter() - spawn_start
+    # Let the output reach its steady rate
+    await asyncio.sleep(1)
+
+    start_bytes = sum(client.bytes for client in clients)
+    start_cpu = os.times()
+    start = time.perf_counter()
+    lags = []
+    while time.perf_counter() - start < args.duration:
+        before = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - before - 0.01)
+    elapsed = time.perf_counter() - start
+    end_cpu = os.times()
+    delivered = sum(client.bytes for client in clients) - start_bytes
+
+    await tm.shutdown()
+    backend.close()
+    return {
+        "terminals": terminals,
+        "spawn_ms_per_terminal": spawn_seconds / terminals * 1000,
+        "expected_mb_s": terminals * args.rate / 1e6,
+        "delivered_mb_s": delivered / elapsed / 1e6,
+        "cpu_s_per_s": ((end_cpu.user + end_cpu.system) - (start_cpu.user + start_cpu.system))
+        / elapsed,
+        "timer_lag_ms": {
+            "p50": percentile(lags, 50) * 1000,
+            "p99": percentile(lags, 99) * 1000,
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, object]:
+    results = [await measure(terminals, args) for terminals in args.terminals]
+    return {
+        "benchmark": "fake_terminals",
+        "cpus": os.cpu_count(),
+        "rate_bytes_s": args.rate,
+        "chunk_size": args.chunk_size,
+        "duration_s": args.duration,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--terminals", type=int, nargs="+", default=[100, 1000, 2000])
+    parser.add_argument("--rate", type=float, default=2000, help="in bytes/s per terminal")
+    parser.add_argument("--chunk-size", type=int, default=200, help="in bytes")
+    parser.add_argument("--duration", type=float, default=3.0, help="in s")
+    args = parser.parse_args()
+    # Each terminal takes two file descriptors
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = 2 * max(args.terminals) + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+    result = IOLoop.current().run_sync(lambda: run(args))
+    print(json.dumps(result, indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Terminal spawn latency against the size of the server process.
+
+The benchmark grows its own memory to each of the given sizes, then times
+``new_terminal()`` with and without the spawn helper. Forking in the server
+copies its page tables, so the direct spawn gets slower as the process grows,
+while the helper's doesn't. Results are printed as JSON.
+
+    python benchmarks/spawn_latency.py --rss-mb 0 512 1536 --samples 20
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import argparse
+import json
+import resource
+import signal
+import statistics
+import time
+
+from stats import percentile
+from terminado import UniqueTermManager
+
+PAGE_SIZE = resource.getpagesize()
+
+
+def grow(ballast: list[bytearray], total_mb: int) -> None:
+    """Allocate and touch memory until ``ballast`` holds ``total_mb`` MiB."""
+    while len(ballast) < total_mb:
+        block = bytearray(1 << 20)
+        # Write to every page, so that it is really mapped
+        block[::PAGE_SIZE] = b"\1" * len(range(0, len(block), PAGE_SIZE))
+        ballast.append(block)
+
+
+def max_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_spawns(tm: UniqueTermManager, samples: int) -> list[float]:
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        term = tm.new_terminal()
+        latencies.append(time.perf_counter() - start)
+        term.kill(signal.SIGKILL)
+        term.ptyproc.close()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rss-mb", type=int, nargs="+", default=[0, 512, 1536])
+    parser.add_argument("--samples", type=int, default=20)
+    args = parser.parse_args()
+
+    managers = {
+        "direct": UniqueTermManager(shell_command=["sleep", "60"]),
+        # Started while the process is small, as at server startup
+        "helper": UniqueTermManager(shell_command=["sleep", "60"], spawn_helper=True),
+    }
+    ballast: list[bytearray] = []
+    results = []
+    for size in sorted(args.rss_mb):
+        grow(ballast, size)
+        for mode, tm in managers.items():
+            latencies = time_spawns(tm, args.samples)
+            results.append(
+                {
+                    "ballast_mb": size,
+                    "max_rss_mb": round(max_rss_mb()),
+                    "mode": mode,
+                    "spawn_ms": {
+                        "mean": statistics.mean(latencies) * 1000,
+                        "p50": percentile(latencies, 50) * 1000,
+                        "p90": percentile(latencies, 90) * 1000,
+                    },
+                }
+            )
+    helper = managers["helper"].spawn_helper
+    assert helper is not None
+    helper.close()
+    print(json.dumps({"benchmark": "spawn_latency", "results": results}, indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+"""Statistics shared by the benchmark scripts.
+
+The scripts are run directly, e.g. ``python benchmarks/suite.py``, so this
+module is imported from the scripts' directory rather than as a package.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """The sample at ``pct`` percent of the sorted ``samples``, by nearest rank."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,390 @@
+"""Throughput, latency and scale of terminals served over websockets.
+
+An in-process Tornado app serves terminals with each kind of manager, and
+websocket clients in the same process, using the binary protocol like
+``terminado.js``, measure:
+
+- ``throughput``: MB/s of a bulk producer's output reaching a client.
+- ``echo``: p50/p99 time for a keystroke to be echoed by ``cat``, typing a
+  key every ``--typing-interval`` seconds.
+- ``connect``: p50/p99 time from opening a websocket to the terminal being
+  set up, which includes spawning it unless the manager shares one.
+- ``replay``: time and size of the replay for a client connecting to a
+  terminal with a full output history, for each history size.
+- ``fanout``: throughput and time spent sending each chunk of output to all
+  clients, for each number of viewers of one terminal.
+- ``idle``: memory and file descriptors of the server per idle terminal.
+
+Results are written as JSON. With ``--compare``, the relative change of every
+number from an earlier run is printed as well.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --only echo connect --compare results.json
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable
+
+import tornado.httpserver
+import tornado.web
+import tornado.websocket
+from tornado.ioloop import IOLoop
+from tornado.testing import bind_unused_port
+
+from stats import percentile
+from terminado import NamedTermManager, SingleTermManager, TermSocket, UniqueTermManager
+from terminado.management import TermManagerBase
+from terminado.metrics import TermMetrics
+from terminado.websocket import BINARY_SUBPROTOCOL, OPCODE_STDIN, OPCODE_STDOUT
+
+MANAGERS: dict[str, type[TermManagerBase]] = {
+    "single": SingleTermManager,
+    "unique": UniqueTermManager,
+    "named": NamedTermManager,
+}
+
+BENCHMARKS = ("throughput", "echo", "connect", "replay", "fanout", "idle")
+
+
+def producer(nbytes: int) -> list[str]:
+    """A command writing ``nbytes`` of text lines, then exiting."""
+    return ["sh", "-c", f"yes 'terminado benchmark output line' | head -c {nbytes}"]
+
+
+class Client:
+    """A websocket client of a terminal, using the binary protocol."""
+
+    def __init__(self, ws: tornado.websocket.WebSocketClientConnection) -> None:
+        self.ws = ws
+        self.stdout_bytes = 0
+
+    async def read(self) -> tuple[str, Any]:
+        """The next message: ``("stdout", bytes)``, a JSON message, or ``("closed", None)``."""
+        message = await self.ws.read_message()
+        if message is None:
+            return "closed", None
+        if isinstance(message, bytes):
+            assert message[0] == OPCODE_STDOUT
+            self.stdout_bytes += len(message) - 1
+            return "stdout", message[1:]
+        content = json.loads(message)
+        return content[0], content[1:]
+
+    async def read_until(self, kind: str) -> Any:
+        while True:
+            got, data = await self.read()
+            if got == kind:
+                return data
+            if got in ("closed", "disconnect"):
+                msg = f"Connection closed while waiting for {kind!r}"
+                raise RuntimeError(msg)
+
+    async def read_to_end(self) -> None:
+        while (await self.read())[0] not in ("closed", "disconnect"):
+            pass
+
+    async def write_stdin(self, text: str) -> None:
+        await self.ws.write_message(bytes((OPCODE_STDIN,)) + text.encode(), binary=True)
+
+    def close(self) -> None:
+        self.ws.close()
+
+
+class Server:
+    """An app serving the terminals of a manager on a local port."""
+
+    def __init__(self, manager: TermManagerBase) -> None:
+        self.manager = manager
+        route = r"/ws/(\w+)" if isinstance(manager, NamedTermManager) else r"/ws"
+        app = tornado.web.Application([(route, TermSocket, {"term_manager": manager})])
+        sock, self.port = bind_unused_port()
+        self.http_server = tornado.httpserver.HTTPServer(app)
+        self.http_server.add_sockets([sock])
+
+    async def connect(self, name: str = "bench", query: str = "") -> Client:
+        path = f"/ws/{name}" if isinstance(self.manager, NamedTermManager) else "/ws"
+        ws = await tornado.websocket.websocket_connect(
+            f"ws://127.0.0.1:{self.port}{path}{query}", subprotocols=[BINARY_SUBPROTOCOL]
+        )
+        return Client(ws)
+
+
+@contextlib.asynccontextmanager
+async def serve(kind: str, **kwargs: Any) -> AsyncIterator[Server]:
+    server = Server(MANAGERS[kind](**kwargs))
+    try:
+        yield server
+    finally:
+        server.http_server.stop()
+        await server.manager.shutdown()
+
+
+async def bench_throughput(kind: str, args: argparse.Namespace) -> dict[str, Any]:
+    async with serve(kind, shell_command=producer(args.bulk_bytes)) as server:
+        start = time.perf_counter()
+        client = await server.connect()
+        await client.read_to_end()
+        elapsed = time.perf_counter() - start
+        client.close()
+    return {
+        "bytes": client.stdout_bytes,
+        "mb_s": client.stdout_bytes / elapsed / 1e6,
+    }
+
+
+async def bench_echo(kind: str, args: argparse.Namespace) -> dict[str, Any]:
+    async with serve(kind, shell_command=["cat"]) as server:
+        client = await server.connect()
+        await client.read_until("offset")
+        latencies = []
+        for _ in range(args.keystrokes):
+            for key in ("x", "\x7f"):
+                # Typing speed, not to wait for the coalescing of output
+                await asyncio.sleep(args.typing_interval)
+                start = time.perf_counter()
+                await client.write_stdin(key)
+                await client.read_until("stdout")
+                if key == "x":
+                    latencies.append(time.perf_counter() - start)
+        client.close()
+    return {
+        "samples": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def bench_connect(kind: str, args: argparse.Namespace) -> dict[str, Any]:
+    async with serve(kind, shell_command=["cat"]) as server:
+        latencies = []
+        for i in range(args.connects):
+            start = time.perf_counter()
+            client = await server.connect(name=f"term{i}")
+            await client.read_until("setup")
+            latencies.append(time.perf_counter() - start)
+            client.close()
+    return {
+        "samples": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def bench_replay(args: argparse.Namespace) -> list[dict[str, Any]]:
+    results = []
+    for size in args.history_sizes:
+        command = ["sh", "-c", f"yes 'terminado replay line' | head -c {size}; exec cat"]
+        async with serve(
+            "named", shell_command=command, term_settings={"scrollback_bytes": size}
+        ) as server:
+            # Fill the history
+            writer = await server.connect()
+            while writer.stdout_bytes < size:
+                await writer.read()
+            times = []
+            replayed = 0
+            for _ in range(args.replays):
+                start = time.perf_counter()
+                client = await server.connect()
+                await client.read_until("offset")
+                times.append(time.perf_counter() - start)
+                replayed = client.stdout_bytes
+                client.close()
+            writer.close()
+        results.append(
+            {
+                "history_bytes": size,
+                "replay_bytes": replayed,
+                "p50_ms": percentile(times, 50) * 1000,
+                "p99_ms": percentile(times, 99) * 1000,
+            }
+        )
+    return results
+
+
+async def bench_fanout(args: argparse.Namespace) -> list[dict[str, Any]]:
+    results = []
+    for viewers in args.viewers:
+        metrics = TermMetrics()
+        # The producer waits for all viewers to connect
+        command = [
+            "sh",
+            "-c",
+            f"read go; yes 'terminado fanout line' | head -c {args.fanout_bytes}",
+        ]
+        async with serve("named", shell_command=command, metrics=metrics) as server:
+            clients = [await server.connect() for _ in range(viewers)]
+            for client in clients:
+                await client.read_until("offset")
+            start_cpu = time.process_time()
+            start = time.perf_counter()
+            await clients[0].write_stdin("\r")
+            await asyncio.gather(*(client.read_to_end() for client in clients))
+            elapsed = time.perf_counter() - start
+            cpu = time.process_time() - start_cpu
+            for client in clients:
+                client.close()
+        fanout = metrics.fanout_seconds
+        delivered = sum(client.stdout_bytes for client in clients)
+        results.append(
+            {
+                "viewers": viewers,
+                "delivered_mb_s": delivered / elapsed / 1e6,
+                "cpu_ms_per_mb_delivered": cpu * 1000 / (delivered / 1e6),
+                "fanout_mean_us": fanout.sum / max(fanout.count, 1) * 1e6,
+                "chunks": fanout.count,
+            }
+        )
+    return results
+
+
+def rss_bytes() -> int:
+    for line in Path("/proc/self/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) * 1024
+    return 0
+
+
+def open_fds() -> int:
+    return len(list(Path("/proc/self/fd").iterdir()))
+
+
+async def bench_idle(args: argparse.Namespace) -> dict[str, Any]:
+    if not Path("/proc/self/fd").is_dir():
+        return {"skipped": "needs /proc"}
+    tm = UniqueTermManager(shell_command=["cat"])
+    rss_before = rss_bytes()
+    fds_before = open_fds()
+    start = time.perf_counter()
+    for _ in range(args.idle_terminals // 50):
+        terms = await asyncio.gather(*(tm.async_new_terminal() for _ in range(50)))
+        for term in terms:
+            tm.start_reading(term)
+    elapsed = time.perf_counter() - start
+    count = len(tm.ptys_by_fd)
+    rss = rss_bytes() - rss_before
+    fds = open_fds() - fds_before
+    await tm.shutdown()
+    return {
+        "terminals": count,
+        "spawn_s": elapsed,
+        "rss_mb": rss / 1e6,
+        "rss_kb_per_terminal": rss / count / 1000,
+        "fds_per_terminal": fds / count,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    per_manager: dict[str, Callable[[str, argparse.Namespace], Any]] = {
+        "throughput": bench_throughput,
+        "echo": bench_echo,
+        "connect": bench_connect,
+    }
+    results: dict[str, Any] = {}
+    for name in args.only:
+        print(f"Running {name}...", file=sys.stderr)  # noqa: T201
+        if name in per_manager:
+            results[name] = {kind: await per_manager[name](kind, args) for kind in MANAGERS}
+        elif name == "replay":
+            results[name] = await bench_replay(args)
+        elif name == "fanout":
+            results[name] = await bench_fanout(args)
+        else:
+            results[name] = await bench_idle(args)
+    return {
+        "benchmark": "suite",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+
+
+def flatten(value: Any, prefix: str = "") -> dict[str, float]:
+    """The numbers in nested results, by their path; lists are keyed by their first entry."""
+    if isinstance(value, bool):
+        return {}
+    if isinstance(value, (int, float)):
+        return {prefix: value}
+    items: list[tuple[str, Any]] = []
+    if isinstance(value, dict):
+        items = list(value.items())
+    elif isinstance(value, list):
+        items = [(f"{next(iter(item.items()))[1]}", item) for item in value if item]
+    flat = {}
+    for key, item in items:
+        flat.update(flatten(item, f"{prefix}.{key}" if prefix else key))
+    return flat
+
+
+def compare(baseline: dict[str, Any], result: dict[str, Any]) -> list[str]:
+    before = flatten(baseline["results"])
+    after = flatten(result["results"])
+    lines = []
+    for key, value in after.items():
+        old = before.get(key)
+        if old:
+            lines.append(f"{key:60} {old:12.3f} -> {value:12.3f} ({(value - old) / old:+.1%})")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--output", help="file to write the JSON results to, or stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--bulk-bytes", type=int, default=32 << 20)
+    parser.add_argument("--keystrokes", type=int, default=200)
+    parser.add_argument("--typing-interval", type=float, default=0.02, help="in s")
+    parser.add_argument("--connects", type=int, default=50)
+    parser.add_argument(
+        "--history-sizes", type=int, nargs="+", default=[64 << 10, 1 << 20, 8 << 20]
+    )
+    parser.add_argument("--replays", type=int, default=10)
+    parser.add_argument("--viewers", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--fanout-bytes", type=int, default=4 << 20, help="output per viewer")
+    parser.add_argument("--idle-terminals", type=int, default=1000)
+    args = parser.parse_args()
+
+    result = IOLoop.current().run_sync(lambda: run(args))
+    text = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)  # noqa: T201
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        print("\n".join(compare(baseline, result)), file=sys.stderr)  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Output throughput of busy terminals against the number of worker processes.
+
+Terminals running ``yes`` send output to one client each, which takes the
+JSON encoding of every chunk, the binary one, or both, as websockets of the
+two protocols would. The output delivered in a fixed time is measured without
+worker processes, where the server reads and encodes everything itself, and
+with each of the given numbers of workers. How late a timer on the event loop
+fires is measured too. Results are printed as JSON.
+
+    python benchmarks/worker_scaling.py --workers 0 1 2 4 8 --terminals 16
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from tornado.ioloop import IOLoop
+
+from stats import percentile
+from terminado import UniqueTermManager
+from terminado.websocket import OutputFrames
+
+# Not only ASCII, so that decoding and JSON escaping have some work to do
+LINE = "terminado throughput — ünïcödé output " * 2
+
+
+class FramesClient:
+    """A terminal client counting the output it is sent."""
+
+    size = (None, None)
+
+    def __init__(self, protocol: str) -> None:
+        self.bytes = 0
+        self.protocol = protocol
+        # Like TermSocket: workers only encode JSON for clients taking it
+        self.binary = protocol == "binary"
+
+    def on_pty_frames(self, frames: OutputFrames) -> None:
+        if self.protocol != "json":
+            self.bytes += len(frames.binary) - 1
+        if self.protocol != "binary":
+            payload = frames.json
+            if self.protocol == "json":
+                self.bytes += len(payload)
+
+    def on_pty_read(self, text: str) -> None:
+        self.bytes += len(text.encode("utf-8"))
+
+    def on_pty_died(self) -> None:
+        pass
+
+
+async def measure(workers: int, args: argparse.Namespace) -> dict[str, object]:
+    tm = UniqueTermManager(shell_command=["yes", LINE], worker_processes=workers)
+    clients = []
+    for _ in range(args.terminals):
+        term = await tm.async_new_terminal()
+        client = FramesClient(args.protocol)
+        term.clients.append(client)
+        clients.append(client)
+        tm.start_reading(term)
+    # Let the workers start
+    await asyncio.sleep(1)
+
+    start_bytes = sum(client.bytes for client in clients)
+    start_cpu = os.times()
+    start = time.perf_counter()
+    lags = []
+    while time.perf_counter() - start < args.duration:
+        before = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - before - 0.01)
+    elapsed = time.perf_counter() - start
+    end_cpu = os.times()
+    delivered = sum(client.bytes for client in clients) - start_bytes
+
+    await tm.shutdown()
+    return {
+        "workers": workers,
+        "throughput_mb_s": delivered / elapsed / 1e6,
+        "server_cpu_s": (end_cpu.user + end_cpu.system) - (start_cpu.user + start_cpu.system),
+        "timer_lag_ms": {
+            "p50": percentile(lags, 50) * 1000,
+            "p99": percentile(lags, 99) * 1000,
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, object]:
+    results = [await measure(workers, args) for workers in args.workers]
+    return {
+        "benchmark": "worker_scaling",
+        "cpus": os.cpu_count(),
+        "terminals": args.terminals,
+        "protocol": args.protocol,
+        "duration_s": args.duration,
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4, 8])
+    parser.add_argument("--terminals", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=3.0, help="in s")
+    parser.add_argument("--protocol", choices=["json", "binary", "both"], default="both")
+    args = parser.parse_args()
+    result = IOLoop.current().run_sync(lambda: run(args))
+    print(json.dumps(result, indent=2))  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -2,45 +2,228 @@
 // Copyright (c) 2014, Ramalingam Saravanan <sarava@sarava.net>
 // Distributed under the terms of the Simplified BSD License.
 
-function make_terminal(element, size, ws_url) {
-  var ws = new WebSocket(ws_url);
+// Binary framing negotiated with the server, see terminado/websocket.py
+var BINARY_SUBPROTOCOL = "terminado.binary";
+var OPCODE_STDOUT = 0x01;
+var OPCODE_STDIN = 0x02;
+
+// Delay before reconnecting after the websocket was lost, in ms. It doubles
+// after each failed attempt, up to RECONNECT_MAX_DELAY, and reconnecting
+// stops after RECONNECT_ATTEMPTS failures in a row.
+var RECONNECT_DELAY = 1000;
+var RECONNECT_MAX_DELAY = 30000;
+var RECONNECT_ATTEMPTS = 10;
+
+// Input larger than this is sent in slices, with at most PASTE_WINDOW slices
+// waiting for the server to acknowledge them at any time
+var PASTE_CHUNK_SIZE = 16384;
+var PASTE_WINDOW = 4;
+
+// options.ping_interval: if set, the interval between pings measuring the
+// round trip time to the server, in ms. No pings are sent by default.
+function make_terminal(element, size, ws_url, options) {
+  var ping_interval = (options && options.ping_interval) || 0;
+  var encoder = new TextEncoder();
+  var decoder = new TextDecoder();
   var term = new Terminal({
     cols: size.cols,
     rows: size.rows,
     screenKeys: true,
     useStyle: true,
   });
-  ws.onopen = function (event) {
-    ws.send(
-      JSON.stringify([
-        "set_size",
-        size.rows,
-        size.cols,
-        window.innerHeight,
-        window.innerWidth,
-      ]),
-    );
-    term.on("data", function (data) {
+  // rtt: the round trip time of the last ping, in ms
+  var result = { socket: null, term: term, rtt: null };
+  // Position reached in the terminal output and the session it belongs to,
+  // to resume from on reconnect
+  var offset = null;
+  var session = null;
+  var reconnect_attempts = 0;
+  var finished = false;
+  var opened = false;
+  // Input waiting to be sent behind a large paste, and the slices sent but
+  // not yet acknowledged
+  var paste_queue = [];
+  var paste_unacked = 0;
+  var paste_next_id = 0;
+  // The ping waiting for its pong, and when it was sent
+  var ping_timer = null;
+  var ping_id = 0;
+  var ping_sent = null;
+
+  function send_stdin(data) {
+    var ws = result.socket;
+    if (ws.readyState !== WebSocket.OPEN) {
+      return;
+    }
+    if (data.length > PASTE_CHUNK_SIZE || paste_queue.length || paste_unacked) {
+      // Keep the order of anything typed after a paste
+      queue_paste(data);
+      send_paste();
+      return;
+    }
+    if (ws.protocol === BINARY_SUBPROTOCOL) {
+      var payload = encoder.encode(data);
+      var frame = new Uint8Array(payload.length + 1);
+      frame[0] = OPCODE_STDIN;
+      frame.set(payload, 1);
+      ws.send(frame);
+    } else {
       ws.send(JSON.stringify(["stdin", data]));
-    });
+    }
+  }
+
+  function queue_paste(data) {
+    var start = 0;
+    while (start < data.length) {
+      var end = Math.min(start + PASTE_CHUNK_SIZE, data.length);
+      // Don't split a surrogate pair between slices
+      var code = data.charCodeAt(end - 1);
+      if (end < data.length && code >= 0xd800 && code < 0xdc00) {
+        end -= 1;
+      }
+      paste_queue.push(data.slice(start, end));
+      start = end;
+    }
+  }
+
+  function send_paste() {
+    var ws = result.socket;
+    while (paste_queue.length && paste_unacked < PASTE_WINDOW) {
+      paste_unacked += 1;
+      ws.send(JSON.stringify(["stdin", paste_queue.shift(), paste_next_id++]));
+    }
+  }
 
-    term.on("title", function (title) {
-      document.title = title;
-    });
+  function send_ping() {
+    var ws = result.socket;
+    if (ws.readyState !== WebSocket.OPEN) {
+      return;
+    }
+    ping_id += 1;
+    ping_sent = performance.now();
+    // The previous round trip time goes along, for the server to record
+    ws.send(JSON.stringify(["ping", ping_id, result.rtt]));
+  }
 
-    term.open(element);
+  function connect() {
+    var url = ws_url;
+    if (offset !== null) {
+      url += (url.indexOf("?") === -1 ? "?" : "&") + "offset=" + offset;
+      if (session !== null) {
+        url += "&session=" + encodeURIComponent(session);
+      }
+    }
+    var ws = new WebSocket(url, [BINARY_SUBPROTOCOL]);
+    ws.binaryType = "arraybuffer";
+    result.socket = ws;
+
+    ws.onopen = function (event) {
+      send_paste();
+      if (ping_interval > 0) {
+        ping_timer = setInterval(send_ping, ping_interval);
+      }
+      ws.send(
+        JSON.stringify([
+          "set_size",
+          size.rows,
+          size.cols,
+          window.innerHeight,
+          window.innerWidth,
+        ]),
+      );
+      if (!opened) {
+        opened = true;
+        term.on("data", send_stdin);
+
+        term.on("title", function (title) {
+          document.title = title;
+        });
+
+        term.open(element);
+      }
+    };
 
     ws.onmessage = function (event) {
+      if (event.data instanceof ArrayBuffer) {
+        var frame = new Uint8Array(event.data);
+        if (frame[0] === OPCODE_STDOUT) {
+          if (offset !== null) {
+            offset += frame.length - 1;
+          }
+          term.write(decoder.decode(frame.subarray(1), { stream: true }));
+        }
+        return;
+      }
       json_msg = JSON.parse(event.data);
       switch (json_msg[0]) {
+        case "setup":
+          // Connected to the terminal: reconnecting worked
+          reconnect_attempts = 0;
+          break;
         case "stdout":
+          if (json_msg.length > 2) {
+            offset = json_msg[2];
+          }
           term.write(json_msg[1]);
           break;
+        case "offset":
+          offset = json_msg[1];
+          if (json_msg.length > 2) {
+            session = json_msg[2];
+          }
+          break;
+        case "suppressed":
+          // Output beyond the terminal's rate limit was left out
+          offset = json_msg[2];
+          term.write(
+            "\r\n\x1b[2m[" + json_msg[1] + " bytes of output suppressed]\x1b[0m\r\n",
+          );
+          break;
+        case "reset":
+          term.reset();
+          break;
+        case "pong":
+          if (json_msg[1] === ping_id && ping_sent !== null) {
+            result.rtt = performance.now() - ping_sent;
+            ping_sent = null;
+          }
+          break;
+        case "stdin_ack":
+          paste_unacked -= 1;
+          send_paste();
+          break;
+        case "stdin_rejected":
+          paste_unacked = Math.max(0, paste_unacked - 1);
+          send_paste();
+          break;
         case "disconnect":
+          finished = true;
           term.write("\r\n\r\n[Finished... Terminado]\r\n");
           break;
       }
     };
-  };
-  return { socket: ws, term: term };
+
+    ws.onclose = function (event) {
+      // Acknowledgements for slices in flight won't come, nor the pong
+      paste_unacked = 0;
+      clearInterval(ping_timer);
+      ping_sent = null;
+      if (finished || offset === null) {
+        return;
+      }
+      if (reconnect_attempts >= RECONNECT_ATTEMPTS) {
+        term.write("\r\n\r\n[Connection lost... Terminado]\r\n");
+        return;
+      }
+      var delay = Math.min(
+        RECONNECT_DELAY * Math.pow(2, reconnect_attempts),
+        RECONNECT_MAX_DELAY,
+      );
+      reconnect_attempts += 1;
+      setTimeout(connect, delay);
+    };
+  }
+
+  connect();
+  return result;
 }
@@ -0,0 +1,373 @@
+"""Pluggable backends spawning the processes of terminals.
+
+A terminal manager spawns each terminal by calling the ``spawn(argv, env,
+cwd)`` method of its ``pty_backend``, which must return an object providing
+the parts of :class:`ptyprocess.PtyProcess` which terminado uses: ``fd``,
+``pid``, ``isalive()``, ``kill(sig)``, ``getwinsize()``, ``setwinsize(rows,
+cols)``, ``close(force)``, and the ``flag_eof``, ``decoder`` and
+``delayafterterminate`` attributes. ``fd`` is read and written by the event
+loop, and reads return nothing once the process is gone. If it has a
+``killpg(sig)`` method, it is used to signal the process group. By default,
+this is a :class:`PtyProcessBackend`, spawning the processes with ptyprocess,
+or pywinpty on Windows; :class:`~terminado.spawnhelper.SpawnHelper` and
+:class:`~terminado.workers.PtyWorkerPool` are backends as well.
+
+:class:`FakePtyBackend` spawns no processes at all. Its terminals are ends of
+socket pairs, fed scripted output at a controlled rate by a single thread, so
+that tests and benchmarks can run thousands of terminals cheaply and with the
+same output every time. It only works on POSIX.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import contextlib
+import heapq
+import itertools
+import selectors
+import signal
+import socket
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Protocol
+
+try:
+    from ptyprocess import PtyProcessUnicode  # type:ignore[import-untyped]
+
+    def preexec_fn() -> None:
+        """A prexec function to set up a signal handler."""
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+except ImportError:
+    try:
+        from winpty import PtyProcess as PtyProcessUnicode  # type:ignore[import-not-found]
+    except ImportError:
+        PtyProcessUnicode = object
+    preexec_fn = None  # type:ignore[assignment]
+
+# The size ptyprocess gives new ptys
+DEFAULT_DIMENSIONS = (24, 80)
+
+# Signals which don't end a fake process, and 0, which checks that it runs
+_HARMLESS_SIGNALS = frozenset(
+    getattr(signal, name, 0) for name in ("SIGCONT", "SIGWINCH", "SIGCHLD")
+) | {0}
+
+
+class PtyBackend(Protocol):
+    """Spawns the processes of terminals; see the module docstring."""
+
+    def spawn(self, argv: list[str], env: dict[str, str] | None, cwd: str | None) -> Any:
+        """Start ``argv`` in a new pty, and return its process."""
+
+
+class PtyProcessBackend:
+    """Spawns the processes with ptyprocess, or pywinpty on Windows."""
+
+    def spawn(self, argv: list[str], env: dict[str, str] | None, cwd: str | None) -> Any:
+        """Start ``argv`` in a new pty, and return its ``PtyProcessUnicode``."""
+        kwargs: dict[str, Any] = {"argv": argv, "env": env or [], "cwd": cwd}
+        if preexec_fn is not None:
+            kwargs["preexec_fn"] = preexec_fn
+        return PtyProcessUnicode.spawn(**kwargs)
+
+
+class FakePtyProcess:
+    """A fake process in a pty, spawned by a :class:`FakePtyBackend`.
+
+    ``fd`` is one end of a socket pair. The backend's thread writes the
+    scripted output to the other end, as fast as it is read or at the
+    backend's rate, and echoes any input back. The process ends when it is
+    sent a signal (other than e.g. ``SIGCONT``), when it is closed, or, with
+    ``exit_when_done``, once all of its output has been read.
+    """
+
+    # Fake processes end as soon as they get a signal
+    delayafterterminate = 0.0
+
+    def __init__(self, backend: FakePtyBackend, argv: list[str], dimensions: tuple[int, int]):
+        """Initialize the process. Use :meth:`FakePtyBackend.spawn` instead."""
+        self.backend = backend
+        self.argv = argv
+        self.pid = None
+        self.exitstatus: int | None = None
+        self.signalstatus: int | None = None
+        self.flag_eof = False
+        self.closed = False
+        self.decoder: Any = None
+        self._sock, self._peer = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._peer.setblocking(False)
+        self.fd = self._sock.fileno()
+        self._alive = True
+        self._size = dimensions
+        # Owned by the backend's thread: output not written yet, and where
+        # the script is up to.
+        self._pending = bytearray()
+        self._position = 0
+        self._repeats_left = backend.repeat
+        self._due = 0.0
+        self._hung_up = False
+
+    def isalive(self) -> bool:
+        """Whether the process is still running."""
+        return self._alive
+
+    def kill(self, sig: int) -> None:
+        """Send a signal to the process, which ends it unless it is harmless."""
+        if self._alive and sig not in _HARMLESS_SIGNALS:
+            self._alive = False
+            self.signalstatus = sig
+            self.backend._call(self._hang_up)
+
+    def killpg(self, sig: int) -> None:
+        """Send a signal to the process group, which is just the process."""
+        self.kill(sig)
+
+    def getwinsize(self) -> tuple[int, int]:
+        """The size of the pty, as (rows, cols)."""
+        return self._size
+
+    def setwinsize(self, rows: int, cols: int) -> None:
+        """Change the size of the pty."""
+        self._size = (rows, cols)
+
+    def close(self, force: bool = True) -> None:
+        """Close the pty. This ends the process."""
+        if not self.closed:
+            self._sock.close()
+            self.closed = True
+            if self._alive:
+                self._alive = False
+                self.signalstatus = signal.SIGHUP
+
+    # The rest runs on the backend's thread
+
+    def _start(self) -> None:
+        self.backend._selector.register(self._peer, selectors.EVENT_READ, self)
+        self._due = time.monotonic()
+        if self.backend.rate is not None:
+            self._on_timer(self._due)
+        else:
+            self._flush()
+
+    def _next_chunk(self) -> int:
+        """Queue the next chunk of the script, and return its size."""
+        backend = self.backend
+        script = backend.output
+        if self._hung_up or self._position >= len(script):
+            return 0
+        chunk = script[self._position : self._position + backend.chunk_size]
+        self._pending += chunk
+        self._position += len(chunk)
+        if self._position >= len(script) and self._repeats_left != 1:
+            self._position = 0
+            if self._repeats_left is not None:
+                self._repeats_left -= 1
+        return len(chunk)
+
+    def _on_timer(self, now: float) -> None:
+        backend = self.backend
+        assert backend.rate is not None
+        if self._pending:
+            # Blocked on its writes: fall behind, rather than catch up later
+            self._due = now + backend.chunk_size / backend.rate
+        else:
+            size = self._next_chunk()
+            self._flush()
+            self._due = max(self._due + size / backend.rate, now)
+        if not self._hung_up and self._position < len(backend.output):
+            backend._schedule(self._due, self)
+
+    def _flush(self) -> None:
+        backend = self.backend
+        while True:
+            if self._pending:
+                try:
+                    sent = self._peer.send(self._pending)
+                except BlockingIOError:
+                    sent = 0
+                except OSError:
+                    # The pty was closed
+                    self._hang_up()
+                    return
+                del self._pending[:sent]
+            if self._pending or backend.rate is not None or not self._next_chunk():
+                break
+        if self._hung_up:
+            return
+        if not self._pending and backend.exit_when_done and self._position >= len(backend.output):
+            self._alive = False
+            self.exitstatus = 0
+            self._hang_up()
+            return
+        events = selectors.EVENT_READ
+        if self._pending:
+            events |= selectors.EVENT_WRITE
+        backend._selector.modify(self._peer, events, self)
+
+    def _on_input(self) -> None:
+        try:
+            data = self._peer.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            # The pty was closed
+            self._alive = False
+            self._close_peer()
+        elif self.backend.echo and not self._hung_up:
+            self._pending += data
+            self._flush()
+
+    def _hang_up(self) -> None:
+        """Stop producing output, so that reading the pty returns EOF.
+
+        Input is still read, and dropped, until the pty is closed.
+        """
+        if self._hung_up or self._peer.fileno() < 0:
+            return
+        self._hung_up = True
+        self._pending.clear()
+        with contextlib.suppress(OSError):
+            self._peer.shutdown(socket.SHUT_WR)
+        self.backend._selector.modify(self._peer, selectors.EVENT_READ, self)
+
+    def _close_peer(self) -> None:
+        self.backend._selector.unregister(self._peer)
+        # Closing with input unread would make reading the pty fail with
+        # ECONNRESET instead of returning EOF.
+        with contextlib.suppress(OSError):
+            while self._peer.recv(65536):
+                pass
+        self._peer.close()
+
+
+class FakePtyBackend:
+    """Spawns :class:`FakePtyProcess` instead of real processes.
+
+    Each process writes ``output`` (bytes as a program would write them to a
+    pty, in UTF-8), ``chunk_size`` bytes at a time, ``repeat`` times, or
+    forever if ``repeat`` is None. With a ``rate``, the output is written at
+    that many bytes per second; without, as fast as it is read. With
+    ``echo``, input is written back as output. With ``exit_when_done``, the
+    process ends once its output has been read; otherwise it stays idle.
+
+    One thread serves all the processes of the backend. It is started by
+    the first :meth:`spawn`, and stopped by :meth:`close`.
+    """
+
+    def __init__(
+        self,
+        output: bytes = b"",
+        rate: float | None = None,
+        chunk_size: int = 4096,
+        repeat: int | None = 1,
+        echo: bool = True,
+        exit_when_done: bool = False,
+    ) -> None:
+        """Initialize the backend."""
+        if chunk_size <= 0:
+            msg = f"Invalid chunk_size: {chunk_size}"
+            raise ValueError(msg)
+        if repeat is not None and repeat <= 0:
+            msg = f"Invalid repeat: {repeat}"
+            raise ValueError(msg)
+        if rate is not None and rate <= 0:
+            msg = f"Invalid rate: {rate}"
+            raise ValueError(msg)
+        self.output = bytes(output)
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.repeat = repeat
+        self.echo = echo
+        self.exit_when_done = exit_when_done
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._selector = selectors.DefaultSelector()
+        self._calls: deque[Callable[[], None]] = deque()
+        self._wakeup, self._waker = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._wakeup.setblocking(False)
+        self._waker.setblocking(False)
+        # (due, sequence, process) of the processes writing at the rate
+        self._timers: list[tuple[float, int, FakePtyProcess]] = []
+        self._sequence = itertools.count()
+        self._stopping = False
+
+    def spawn(
+        self,
+        argv: list[str],
+        env: dict[str, str] | None = None,
+        cwd: str | None = None,
+        dimensions: tuple[int, int] = DEFAULT_DIMENSIONS,
+    ) -> FakePtyProcess:
+        """Start a fake process; ``env`` and ``cwd`` are ignored."""
+        with self._lock:
+            if self._stopping:
+                msg = "The backend is closed"
+                raise RuntimeError(msg)
+            if self._thread is None:
+                self._selector.register(self._wakeup, selectors.EVENT_READ, None)
+                self._thread = threading.Thread(
+                    target=self._run, name="terminado-fake-pty", daemon=True
+                )
+                self._thread.start()
+        proc = FakePtyProcess(self, list(argv), dimensions)
+        self._call(proc._start)
+        return proc
+
+    def close(self) -> None:
+        """Stop the thread. Processes still running stop producing output."""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._call(lambda: None)
+        if thread is not None:
+            thread.join()
+
+    def _call(self, func: Callable[[], None]) -> None:
+        """Run ``func`` on the backend's thread."""
+        self._calls.append(func)
+        # Fails if enough wakeups are pending already, or the backend is closed
+        with contextlib.suppress(OSError):
+            self._waker.send(b"\0")
+
+    def _schedule(self, due: float, proc: FakePtyProcess) -> None:
+        heapq.heappush(self._timers, (due, next(self._sequence), proc))
+
+    def _run(self) -> None:
+        selector = self._selector
+        while not self._stopping:
+            timeout = None
+            if self._timers:
+                timeout = max(0.0, self._timers[0][0] - time.monotonic())
+            for key, mask in selector.select(timeout):
+                proc = key.data
+                if proc is None:
+                    while True:
+                        try:
+                            if not self._wakeup.recv(4096):
+                                break
+                        except BlockingIOError:
+                            break
+                    continue
+                if mask & selectors.EVENT_READ:
+                    proc._on_input()
+                if mask & selectors.EVENT_WRITE and proc._peer.fileno() >= 0:
+                    proc._flush()
+            while self._calls:
+                self._calls.popleft()()
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, _, proc = heapq.heappop(self._timers)
+                if proc._peer.fileno() >= 0:
+                    proc._on_timer(now)
+        for key in list(selector.get_map().values()):
+            if key.data is not None:
+                key.data._hang_up()
+                key.data._close_peer()
+        selector.close()
+        self._wakeup.close()
+        self._waker.close()
@@ -0,0 +1,177 @@
+"""Threads reading ptys away from the event loop.
+
+Each :class:`PtyReaderThread` watches a set of ptys with its own selector
+(epoll on Linux). Whenever some are readable, it reads their output, and
+hands all of it to a callback on the event loop in one batch. A pty with too
+much output the loop hasn't got round to yet isn't read until it has.
+
+This only works on POSIX.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import contextlib
+import logging
+import selectors
+import socket
+import threading
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from terminado.management import PtyWithClients
+
+# UTF-8 output of one pty, or None when it has reached EOF
+PtyBatch = List[Tuple["PtyWithClients", Optional[bytes]]]
+
+
+class PtyReaderThread(threading.Thread):
+    """A thread reading the ptys added to it.
+
+    ``deliver`` is called from the thread, once per batch of reads, and must
+    pass the batch on to the event loop, e.g. with
+    :meth:`tornado.ioloop.IOLoop.add_callback`. A pty reaching EOF is removed
+    from the thread before it is reported.
+
+    Once ``max_pending`` bytes of a pty's output have been delivered but not
+    passed to :meth:`consumed`, the thread stops reading it until they are,
+    so that a busy loop holds at most about that much output of each pty.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[PtyBatch], Any],
+        read_size: int = 65536,
+        max_pending: int = 262144,
+    ) -> None:
+        """Initialize the thread."""
+        super().__init__(name="terminado-pty-reader", daemon=True)
+        self.deliver = deliver
+        self.read_size = read_size
+        self.max_pending = max_pending
+        self._buffer = bytearray(read_size)
+        self.log = logging.getLogger(__name__)
+        self._selector = selectors.DefaultSelector()
+        # Changes requested by other threads, applied by this one
+        self._lock = threading.Lock()
+        self._changes: list[tuple[int, PtyWithClients | None]] = []
+        self._stopping = False
+        # The ptys added, their output not yet consumed, and those which
+        # aren't read until more of it is
+        self._ptys: dict[int, PtyWithClients] = {}
+        self._pending: dict[int, int] = {}
+        self._held: set[int] = set()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def add(self, ptywclients: PtyWithClients) -> None:
+        """Start reading a pty."""
+        fd = ptywclients.ptyproc.fd
+        with self._lock:
+            self._ptys[fd] = ptywclients
+            self._pending[fd] = 0
+            self._held.discard(fd)
+        self._request(fd, ptywclients)
+
+    def remove(self, fd: int) -> None:
+        """Stop reading a pty. Output already read may still be delivered."""
+        with self._lock:
+            self._ptys.pop(fd, None)
+            self._pending.pop(fd, None)
+            self._held.discard(fd)
+        self._request(fd, None)
+
+    def consumed(self, ptywclients: PtyWithClients, size: int) -> None:
+        """Report that the loop is done with ``size`` bytes of delivered output."""
+        fd = ptywclients.ptyproc.fd
+        with self._lock:
+            if self._ptys.get(fd) is not ptywclients:
+                return
+            pending = self._pending[fd] = max(self._pending[fd] - size, 0)
+            if fd not in self._held or pending >= self.max_pending:
+                return
+            self._held.discard(fd)
+            self._changes.append((fd, ptywclients))
+        self._wake()
+
+    def stop(self) -> None:
+        """Stop the thread, and wait for it to finish."""
+        with self._lock:
+            self._stopping = True
+        self._wake()
+        if self.is_alive():
+            self.join()
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def _request(self, fd: int, ptywclients: PtyWithClients | None) -> None:
+        with self._lock:
+            self._changes.append((fd, ptywclients))
+        self._wake()
+
+    def _wake(self) -> None:
+        # If the socket is full, the thread is already woken up
+        with contextlib.suppress(BlockingIOError):
+            self._wakeup_w.send(b"\0")
+
+    def _apply_changes(self) -> bool:
+        with self._lock:
+            changes, self._changes = self._changes, []
+            stopping = self._stopping
+        for fd, ptywclients in changes:
+            try:
+                if ptywclients is None:
+                    self._selector.unregister(fd)
+                else:
+                    self._selector.register(fd, selectors.EVENT_READ, ptywclients)
+            except (KeyError, ValueError):
+                pass  # Already (un)registered
+        return not stopping
+
+    def run(self) -> None:
+        """Read ptys until stopped."""
+        while self._apply_changes():
+            batch: PtyBatch = []
+            for key, _ in self._selector.select():
+                if key.fileobj is self._wakeup_r:
+                    try:
+                        while self._wakeup_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                ptywclients = key.data
+                try:
+                    n = ptywclients.readinto_nonblocking(self._buffer)
+                except (EOFError, OSError) as e:
+                    if not isinstance(e, EOFError):
+                        self.log.warning("Error reading fd %s: %s", key.fd, e)
+                    self._selector.unregister(key.fd)
+                    batch.append((ptywclients, None))
+                    continue
+                if n:
+                    batch.append((ptywclients, memoryview(self._buffer)[:n].tobytes()))
+            if batch:
+                self._hold(batch)
+                self.deliver(batch)
+
+    def _hold(self, batch: PtyBatch) -> None:
+        """Stop reading the ptys of a batch with too much pending output."""
+        held = []
+        with self._lock:
+            for ptywclients, data in batch:
+                fd = ptywclients.ptyproc.fd
+                if data is None or self._ptys.get(fd) is not ptywclients:
+                    continue
+                self._pending[fd] += len(data)
+                if self._pending[fd] >= self.max_pending and fd not in self._held:
+                    self._held.add(fd)
+                    held.append(fd)
+        for fd in held:
+            # consumed() registers it again, after this
+            with contextlib.suppress(KeyError, ValueError):
+                self._selector.unregister(fd)
@@ -7,55 +7,131 @@ from __future__ import annotations
 
 import asyncio
 import codecs
+import errno
+import functools
 import itertools
 import logging
 import os
+import secrets
 import select
 import signal
+import time
 import warnings
 from collections import deque
 from concurrent import futures
-from typing import TYPE_CHECKING, Any, Coroutine
+from typing import TYPE_CHECKING, Any, Coroutine, NoReturn
 
 if TYPE_CHECKING:
+    from terminado.backends import PtyBackend
+    from terminado.metrics import TermMetrics
     from terminado.websocket import TermSocket
 
-try:
-    from ptyprocess import PtyProcessUnicode  # type:ignore[import-untyped]
+from tornado.concurrent import Future, future_set_result_unless_cancelled
+from tornado.ioloop import IOLoop, PeriodicCallback
 
-    def preexec_fn() -> None:
-        """A prexec function to set up a signal handler."""
-        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+from terminado.backends import PtyProcessBackend
+from terminado.ratelimit import SNAPSHOT_BYTES, OutputRateLimit
+from terminado.screen import DEFAULT_SCREEN_HISTORY, ScreenModel
+from terminado.scrollback import ScrollbackBuffer
+from terminado.tracing import LatencyTrace
+from terminado.websocket import OutputFrames
 
-except ImportError:
-    try:
-        from winpty import PtyProcess as PtyProcessUnicode  # type:ignore[import-not-found]
-    except ImportError:
-        PtyProcessUnicode = object
-    preexec_fn = None  # type:ignore[assignment]
-
-from tornado.ioloop import IOLoop
+if os.name != "nt":
+    from terminado.iothreads import PtyBatch, PtyReaderThread
+    from terminado.spawnhelper import SpawnHelper
+    from terminado.workers import PtyWorkerPool, RemotePty
 
 ENV_PREFIX = "PYXTERM_"  # Environment variable prefix
 
 # TERM is set according to xterm.js capabilities
 DEFAULT_TERM_TYPE = "xterm-256color"
 
+# The size of terminals spawned without size options, as in make_term_env
+_DEFAULT_SIZE = {"height": 25, "width": 80, "winheight": 0, "winwidth": 0}
+
 
 class PtyWithClients:
     """A pty object with associated clients."""
 
     term_name: str | None
 
-    def __init__(self, argv: Any, env: dict[str, str] | None = None, cwd: str | None = None):
-        """Initialize the pty."""
+    def __init__(
+        self,
+        argv: Any,
+        env: dict[str, str] | None = None,
+        cwd: str | None = None,
+        scrollback_bytes: int | None = None,
+        screen: ScreenModel | None = None,
+        ptyproc: Any = None,
+        rate_limit: OutputRateLimit | None = None,
+        latency: LatencyTrace | None = None,
+    ):
+        """Initialize the pty.
+
+        ``scrollback_bytes`` bounds the output history kept to replay to
+        reconnecting clients; it defaults to
+        :data:`terminado.scrollback.DEFAULT_SCROLLBACK_BYTES`. If a ``screen``
+        model is given, it is kept up to date with the output and reconnecting
+        clients are sent a rendering of it instead of the history.
+
+        If ``ptyproc`` is given, it is used instead of spawning ``argv``: an
+        already started process, like a
+        :class:`~terminado.spawnhelper.HelperPtyProcess`, or one from a
+        :mod:`pty backend <terminado.backends>`.
+
+        The manager holds back output beyond the ``rate_limit``, if any, and
+        records the echo time of input in the ``latency`` trace, if any.
+        """
         self.clients: list[Any] = []
+        # Identifies this terminal's output to reconnecting clients, so that
+        # an offset into another terminal's output is not resumed from
+        self.session_id = secrets.token_hex(8)
         # Use read_buffer to store historical messages for reconnection
-        self.read_buffer: deque[str] = deque([], maxlen=1000)
-        kwargs = {"argv": argv, "env": env or [], "cwd": cwd}
-        if preexec_fn is not None:
-            kwargs["preexec_fn"] = preexec_fn
-        self.ptyproc = PtyProcessUnicode.spawn(**kwargs)
+        self.read_buffer = (
+            ScrollbackBuffer()
+            if scrollback_bytes is None
+            else ScrollbackBuffer(maxbytes=scrollback_bytes)
+        )
+        # Output held back by the manager's coalescing stage, in UTF-8
+        self.pending_output = bytearray()
+        # Reused for every read of the pty by the event loop, and sized by
+        # the manager along with the number of reads per wakeup.
+        self.read_buf: bytearray | None = None
+        self.reads_per_wakeup = 1
+        # What the manager's read scheduler knows of the terminal: when input
+        # was last sent, the output read so far, and an average of the output
+        # read each time it was served.
+        self.last_input = float("-inf")
+        # When the manager started reading the terminal, when it last
+        # produced output and last lost a client, in the event loop's time,
+        # for the culler.
+        self.started = 0.0
+        self.last_output = float("-inf")
+        self.last_disconnect = float("-inf")
+        self.bytes_read = 0
+        self.output_volume = 0.0
+        self.last_flush = 0.0
+        self.flush_timeout: Any = None
+        self.screen = screen
+        self.rate_limit = rate_limit
+        # Ends the current period of suppressed output
+        self.rate_limit_timeout: Any = None
+        self.latency = latency
+        # Set while all clients are too far behind for more output
+        self.reading_paused = False
+        # Input waiting for the pty to accept it, and the events the
+        # manager's event loop handler is registered for.
+        self.input_buffer = bytearray()
+        self.io_events = 0
+        # Whether one of the manager's I/O threads is reading the pty
+        self.thread_reading = False
+        # Bytes of input written so far, and futures waiting for the input
+        # up to an offset to be written.
+        self.input_written = 0
+        self.input_waiters: deque[tuple[int, Future[None]]] = deque()
+        if ptyproc is None:
+            ptyproc = PtyProcessBackend().spawn(argv, env, cwd)
+        self.ptyproc = ptyproc
         # The output might not be strictly UTF-8 encoded, so
         # we replace the inner decoder of PtyProcessUnicode
         # to allow non-strict decode.
@@ -82,6 +158,130 @@ class PtyWithClients:
         rows, cols = self.ptyproc.getwinsize()
         if (rows, cols) != (minrows, mincols):
             self.ptyproc.setwinsize(minrows, mincols)
+            if self.screen is not None:
+                self.screen.resize(minrows, mincols)
+
+    def last_active_time(self) -> float:
+        """When the terminal last had input, output or a client leaving.
+
+        It is the time the manager started reading it if none of these
+        happened yet.
+        """
+        return max(self.started, self.last_input, self.last_output, self.last_disconnect)
+
+    def has_foreground_job(self) -> bool | None:
+        """Whether a job other than the shell is running in the foreground.
+
+        This is None where it can't be told: on Windows, and for processes
+        whose pty the server doesn't hold, like those of worker processes or
+        of :class:`~terminado.backends.FakePtyBackend`.
+        """
+        pid: int | None = self.ptyproc.pid
+        if os.name == "nt" or pid is None or self.ptyproc.fd < 0:
+            return None
+        try:
+            # The shell leads its own process group
+            return os.tcgetpgrp(self.ptyproc.fd) != pid
+        except OSError:
+            return None
+
+    def replay(self) -> str:
+        """Output bringing a newly connected client up to date."""
+        if self.screen is not None:
+            return self.screen.render()
+        return self.read_buffer.text()
+
+    def snapshot(self) -> str:
+        """The current screen, or the end of the output history without a screen model."""
+        if self.screen is not None:
+            return self.screen.render()
+        start = max(self.read_buffer.start_offset, self.read_buffer.end_offset - SNAPSHOT_BYTES)
+        return self.output_since(start) or ""
+
+    def output_since(self, offset: int) -> str | None:
+        """Output after ``offset``, or None if some of it is no longer stored."""
+        data = self.read_buffer.read_from(offset)
+        if data is None:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def read_nonblocking(self, size: int) -> str | None:
+        """Read up to ``size`` bytes of output without blocking.
+
+        Returns None if no output is ready, and raises :exc:`EOFError` once
+        the pty is closed. Windows only: on POSIX, the manager reads into a
+        buffer with :meth:`readinto_nonblocking`.
+        """
+        # prevent blocking on fd
+        if not _poll(self.ptyproc.fd, timeout=0.1):  # 100ms
+            return None
+        return self.ptyproc.read(size)  # type:ignore[no-any-return]
+
+    def readinto_nonblocking(self, buffer: bytearray) -> int | None:
+        """Read output into ``buffer`` without blocking or decoding it.
+
+        Returns the number of bytes read, or None if no output is ready, and
+        raises :exc:`EOFError` once the pty is closed. POSIX only.
+        """
+        try:
+            n = os.readv(self.ptyproc.fd, [buffer])
+        except BlockingIOError:
+            return None
+        except OSError as e:
+            # Linux-style EOF
+            if e.errno != errno.EIO:
+                raise
+            n = 0
+        if not n:
+            self._eof()
+        return n
+
+    def _eof(self) -> NoReturn:
+        # Lets isalive() wait for the process, as ptyprocess does.
+        self.ptyproc.flag_eof = True
+        msg = "End Of File (EOF)"
+        raise EOFError(msg)
+
+    def write_blocking(self, text: str) -> None:
+        """Write input to the pty, waiting until it has all been accepted."""
+        if os.name == "nt":
+            self.ptyproc.write(text)
+            return
+        fd = self.ptyproc.fd
+        view = memoryview(text.encode("utf-8"))
+        while view:
+            try:
+                n = os.write(fd, view)
+            except BlockingIOError:
+                poller = select.poll()
+                poller.register(fd, select.POLLOUT)
+                poller.poll()
+                continue
+            view = view[n:]
+
+    def broadcast_frames(self, frames: OutputFrames) -> None:
+        """Send a chunk of output, encoded only once, to all clients.
+
+        Clients providing ``on_pty_frames`` (like :class:`TermSocket`) share
+        ``frames``; others get ``on_pty_read(text)``.
+        """
+        for client in self.clients:
+            on_pty_frames = getattr(client, "on_pty_frames", None)
+            if on_pty_frames is None:
+                client.on_pty_read(frames.text)
+            else:
+                on_pty_frames(frames)
+
+    def report_suppressed(self, nbytes: int) -> None:
+        """Tell clients that ``nbytes`` of output were not sent to them.
+
+        Clients providing ``on_output_suppressed`` (like :class:`TermSocket`)
+        are called with the number; others are not told.
+        """
+        for client in self.clients:
+            on_output_suppressed = getattr(client, "on_output_suppressed", None)
+            if on_output_suppressed is not None:
+                on_output_suppressed(nbytes)
 
     def kill(self, sig: int = signal.SIGTERM) -> None:
         """Send a signal to the process in the pty"""
@@ -91,6 +291,10 @@ class PtyWithClients:
         """Send a signal to the process group of the process in the pty"""
         if os.name == "nt":
             return self.ptyproc.kill(sig)
+        killpg = getattr(self.ptyproc, "killpg", None)
+        if killpg is not None:
+            # e.g. a RemotePty, whose process isn't ours
+            return killpg(sig)
         pgid = os.getpgid(self.ptyproc.pid)
         os.killpg(pgid, sig)
         return None
@@ -142,6 +346,20 @@ def _update_removing(target: Any, changes: Any) -> None:
             target[k] = v
 
 
+def _utf8_boundary(data: bytearray) -> int:
+    """The length of ``data`` without a UTF-8 sequence cut off at its end."""
+    size = len(data)
+    for back in range(1, min(4, size) + 1):
+        byte = data[size - back]
+        if byte < 0x80:
+            return size
+        if byte >= 0xC0:
+            # The lead byte of a sequence: is it complete?
+            length = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return size - back if length > back else size
+    return size
+
+
 def _poll(fd: int, timeout: float = 0.1) -> list[tuple[int, int]]:
     """Poll using poll() on posix systems and select() elsewhere (e.g., Windows)"""
     if os.name == "posix":
@@ -155,6 +373,15 @@ def _poll(fd: int, timeout: float = 0.1) -> list[tuple[int, int]]:
     return r
 
 
+def _close_pty(ptyproc: Any) -> None:
+    """Close a pty, without ptyprocess's wait for a process already gone."""
+    if getattr(ptyproc, "delayafterclose", 0) and not ptyproc.isalive():
+        # ptyprocess sleeps this long on close(), in case the process
+        # takes a moment to exit, which would block the event loop.
+        ptyproc.delayafterclose = 0
+    ptyproc.close()
+
+
 class TermManagerBase:
     """Base class for a terminal manager."""
 
@@ -166,15 +393,162 @@ class TermManagerBase:
         extra_env: Any = None,
         ioloop: Any = None,
         blocking_io_executor: Any = None,
+        coalesce_delay: float = 0.005,
+        coalesce_max_size: int = 65536,
+        client_buffer_limit: int = 4 << 20,
+        slow_client_policy: str = "skip",
+        stdin_chunk_size: int = 16384,
+        max_stdin_message_size: int | None = 4 << 20,
+        pool_size: int = 0,
+        pool_refill_interval: float = 0.2,
+        spawn_executor: Any = None,
+        spawn_helper: bool = False,
+        io_threads: int = 0,
+        worker_processes: int = 0,
+        min_read_size: int = 4096,
+        max_read_size: int = 65536,
+        max_reads_per_wakeup: int = 2,
+        read_budget: int | None = 262144,
+        interactive_window: float = 1.0,
+        metrics: TermMetrics | None = None,
+        trace_latency: bool = False,
+        pty_backend: PtyBackend | None = None,
+        terminado_cull_inactive_timeout: float = 0,
+        terminado_cull_max_age: float = 0,
+        terminado_cull_busy: bool = False,
+        terminado_cull_interval: float = 60,
     ):
-        """Initialize the manager."""
+        """Initialize the manager.
+
+        Output read from a pty shortly after the previous message was sent is
+        held back for up to ``coalesce_delay`` seconds, or until
+        ``coalesce_max_size`` bytes are pending, and sent as one message.
+        Output arriving after a quiet period is sent immediately, so
+        interactive echo is not delayed. Set ``coalesce_delay`` to 0 to send
+        every read as its own message.
+
+        A websocket with more than ``client_buffer_limit`` bytes waiting to be
+        sent is congested until half of that has been sent. While all clients
+        of a terminal are congested, the pty is not read, so the process in it
+        blocks. A congested client of a terminal whose other clients keep up
+        is handled according to ``slow_client_policy``:
+
+        - ``"skip"``: output is dropped until it catches up.
+        - ``"snapshot"``: output is dropped until it catches up, then it is
+          reset and sent the replay of a reconnecting client.
+        - ``"close"``: the websocket is closed.
+
+        Each pty is read into a buffer of ``min_read_size`` to
+        ``max_read_size`` bytes, which doubles while reads fill it and halves
+        while they fill less than a quarter of it. When the event loop finds a
+        pty readable, it keeps reading while reads return bulk output, at
+        least half a buffer each (ptys may return less than asked, e.g. 4095
+        bytes on Linux). How many reads it does per wakeup doubles while the
+        output keeps coming, up to ``max_reads_per_wakeup``, and halves when
+        it doesn't. Interactive shells take one small read per wakeup, and
+        bulk producers take few wakeups.
+
+        Readable ptys are not read as soon as the event loop reports them, but
+        once per loop iteration, in order: first terminals which were sent
+        input in the last ``interactive_window`` seconds, then the others,
+        those which recently produced the least output first. Once
+        ``read_budget`` bytes have been read in an iteration, the remaining
+        non-interactive terminals wait for the next one, so a terminal
+        flooding output can't hold up the echo of keystrokes in another, or
+        other work on the loop. ``None`` reads every pty as soon as it is
+        readable. This doesn't apply to ptys read by ``io_threads`` or
+        ``worker_processes``.
+
+        Input is written to a pty at most ``stdin_chunk_size`` bytes at a time,
+        as it becomes writable. Websockets reject stdin messages of more than
+        ``max_stdin_message_size`` characters, and stop reading messages from
+        a client while more than that is waiting to be written to its
+        terminal. ``None`` means no limit.
+
+        With a ``pool_size``, up to that many terminals are spawned ahead of
+        time, one every ``pool_refill_interval`` seconds, and
+        :meth:`new_terminal` hands them out when it can. See
+        :meth:`start_pool`.
+
+        The ``async_*`` methods spawn processes on ``spawn_executor``, by
+        default a small thread pool, so that forking doesn't block the event
+        loop. If ``spawn_helper`` is true, a small helper process is started
+        right away and forks the terminals instead of the server, see
+        :mod:`terminado.spawnhelper`. This is not available on Windows.
+
+        With ``io_threads``, ptys are read by that many dedicated threads
+        instead of the event loop (see :mod:`terminado.iothreads`), which
+        then only sends the output on to clients. This is not available on
+        Windows either.
+
+        With ``worker_processes``, terminals are spread over that many worker
+        processes, which spawn them, read them and encode their output for
+        the websockets (see :mod:`terminado.workers`), so that busy terminals
+        can use more than one core. The server only keeps the output history
+        and passes the output on. It can't be combined with ``io_threads`` or
+        ``spawn_helper``, and is not available on Windows.
+
+        If given :class:`~terminado.metrics.TermMetrics`, the manager and its
+        websockets count what they do in them, see :mod:`terminado.metrics`.
+
+        With ``trace_latency``, each terminal records how long its input takes
+        to be echoed, stage by stage, see :mod:`terminado.tracing` and
+        :meth:`latency_report`.
+
+        A ``pty_backend`` spawns the terminals instead of ptyprocess, e.g. a
+        :class:`~terminado.backends.FakePtyBackend` for tests, see
+        :mod:`terminado.backends`. It can't be combined with ``spawn_helper``
+        or ``worker_processes``.
+
+        Terminals are culled, that is terminated, once they have had no
+        clients, input or output for ``terminado_cull_inactive_timeout``
+        seconds, and once they are ``terminado_cull_max_age`` seconds old; 0
+        disables either. Unless ``terminado_cull_busy`` is true, terminals
+        running a foreground job, like an editor or a build, are spared, as
+        are those where that can't be told. The culler checks every
+        ``terminado_cull_interval`` seconds, see :meth:`cull_terminals`. The
+        options are prefixed so as not to clash with the culling options of
+        Jupyter's terminal manager, a subclass.
+        """
+        if slow_client_policy not in ("skip", "snapshot", "close"):
+            msg = f"Unknown slow_client_policy: {slow_client_policy!r}"
+            raise ValueError(msg)
+        if not 0 < min_read_size <= max_read_size:
+            msg = f"Invalid read sizes: {min_read_size} to {max_read_size}"
+            raise ValueError(msg)
+        if pty_backend is not None and (spawn_helper or worker_processes):
+            msg = "pty_backend can't be combined with spawn_helper or worker_processes"
+            raise ValueError(msg)
         self.shell_command = shell_command
         self.server_url = server_url
         self.term_settings = term_settings or {}
         self.extra_env = extra_env
+        self.coalesce_delay = coalesce_delay
+        self.coalesce_max_size = coalesce_max_size
+        self.client_buffer_limit = client_buffer_limit
+        self.slow_client_policy = slow_client_policy
+        self.stdin_chunk_size = stdin_chunk_size
+        self.max_stdin_message_size = max_stdin_message_size
+        self.min_read_size = min_read_size
+        self.max_read_size = max_read_size
+        self.max_reads_per_wakeup = max(1, max_reads_per_wakeup)
+        self.read_budget = read_budget
+        self.interactive_window = interactive_window
+        self.pool_size = pool_size
+        self.pool_refill_interval = pool_refill_interval
         self.log = logging.getLogger(__name__)
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.register(self)
+        self.trace_latency = trace_latency
 
         self.ptys_by_fd: dict[int, PtyWithClients] = {}
+        # Readable ptys waiting for the read scheduler
+        self._ready_fds: set[int] = set()
+        self._reads_scheduled = False
+        # Terminals spawned ahead of time, not yet read from
+        self.pool: deque[PtyWithClients] = deque()
+        self._pool_refill: Any = None
 
         if blocking_io_executor is None:
             self._blocking_io_executor_is_external = False
@@ -183,6 +557,58 @@ class TermManagerBase:
             self._blocking_io_executor_is_external = True
             self.blocking_io_executor = blocking_io_executor
 
+        if spawn_executor is None:
+            self._spawn_executor_is_external = False
+            self.spawn_executor = futures.ThreadPoolExecutor(max_workers=4)
+        else:
+            self._spawn_executor_is_external = True
+            self.spawn_executor = spawn_executor
+
+        self.spawn_helper: SpawnHelper | None = None
+        if spawn_helper:
+            if os.name == "nt":
+                msg = "The spawn helper is not available on Windows"
+                raise ValueError(msg)
+            self.spawn_helper = SpawnHelper()
+            self.spawn_helper.start()
+
+        if io_threads and os.name == "nt":
+            msg = "Reading ptys in threads is not available on Windows"
+            raise ValueError(msg)
+        self.io_threads = io_threads
+        # Started with the first terminal, to know the event loop
+        self._reader_threads: list[PtyReaderThread] = []
+
+        self.terminado_cull_inactive_timeout = terminado_cull_inactive_timeout
+        self.terminado_cull_max_age = terminado_cull_max_age
+        self.terminado_cull_busy = terminado_cull_busy
+        self.terminado_cull_interval = terminado_cull_interval
+        # Started with the first terminal, to know the event loop
+        self._culler: PeriodicCallback | None = None
+
+        self.worker_pool: PtyWorkerPool | None = None
+        if worker_processes:
+            if os.name == "nt":
+                msg = "Worker processes are not available on Windows"
+                raise ValueError(msg)
+            if io_threads or spawn_helper:
+                msg = "worker_processes can't be combined with io_threads or spawn_helper"
+                raise ValueError(msg)
+            self.worker_pool = PtyWorkerPool(
+                worker_processes,
+                self._on_remote_output,
+                self._on_remote_written,
+                self._on_remote_eof,
+                coalesce_delay=coalesce_delay,
+                coalesce_max_size=coalesce_max_size,
+                stdin_chunk_size=stdin_chunk_size,
+            )
+
+        # Spawns every terminal, see terminado.backends
+        self.pty_backend: PtyBackend = (
+            pty_backend or self.spawn_helper or self.worker_pool or PtyProcessBackend()
+        )
+
         if ioloop is not None:
             warnings.warn(
                 f"Setting {self.__class__.__name__}.ioloop is deprecated and ignored",
@@ -223,21 +649,361 @@ class TermManagerBase:
         return env
 
     def new_terminal(self, **kwargs: Any) -> PtyWithClients:
-        """Make a new terminal, return a :class:`PtyWithClients` instance."""
+        """Make a new terminal, return a :class:`PtyWithClients` instance.
+
+        Options are taken from ``term_settings``, overridden by ``kwargs``.
+        Besides the environment options of :meth:`make_term_env`, ``cwd`` sets
+        the working directory and ``scrollback_bytes`` the size of the output
+        history kept for reconnecting clients. If ``screen_model`` is true, a
+        :class:`~terminado.screen.ScreenModel` keeping ``screen_history``
+        lines of scrollback is used for reconnecting clients instead.
+
+        The output sent to clients is limited to ``max_output_rate`` bytes
+        and ``max_frame_rate`` messages per second, if set, see
+        :class:`~terminado.ratelimit.OutputRateLimit`; ``rate_limit_policy``
+        and ``rate_limit_interval`` set its ``policy`` and ``interval``.
+
+        If the manager has a pool of terminals and the options are those of
+        ``term_settings``, a pooled terminal is returned instead of spawning
+        a new one. Pooled terminals have the default size, which their
+        environment was made for, so other sizes need a new one.
+        """
+        options = self._terminal_options(kwargs)
+        if self.pool_size:
+            term = self._take_pooled(options)
+            self._schedule_pool_refill()
+            if term is not None:
+                return term
+        start = time.perf_counter()
+        term = self._spawn_terminal(options)
+        self._count_spawn(start)
+        return term
+
+    async def async_new_terminal(self, **kwargs: Any) -> PtyWithClients:
+        """Like :meth:`new_terminal`, but spawning on the ``spawn_executor``."""
+        if type(self).new_terminal is not TermManagerBase.new_terminal:
+            # Respect a subclass's own way of making terminals
+            return self.new_terminal(**kwargs)
+        options = self._terminal_options(kwargs)
+        if self.pool_size:
+            term = self._take_pooled(options)
+            self._schedule_pool_refill()
+            if term is not None:
+                return term
+        return await self._async_spawn_terminal(options)
+
+    def _terminal_options(self, kwargs: dict[str, Any]) -> dict[str, Any]:
         options = self.term_settings.copy()
         options["shell_command"] = self.shell_command
         options.update(kwargs)
+        return options
+
+    def _spawn_terminal(self, options: dict[str, Any]) -> PtyWithClients:
         argv = options["shell_command"]
         env = self.make_term_env(**options)
-        cwd = options.get("cwd", None)
-        return PtyWithClients(argv, env, cwd)
+        cwd = options.get("cwd")
+        screen = None
+        if options.get("screen_model"):
+            try:
+                screen = ScreenModel(
+                    rows=options.get("height", 25),
+                    cols=options.get("width", 80),
+                    history=options.get("screen_history", DEFAULT_SCREEN_HISTORY),
+                )
+            except ImportError:
+                self.log.warning("pyte is not installed; replaying history instead of screen")
+        rate_limit = None
+        if options.get("max_output_rate") or options.get("max_frame_rate"):
+            rate_limit = OutputRateLimit(
+                max_bytes_per_s=options.get("max_output_rate"),
+                max_frames_per_s=options.get("max_frame_rate"),
+                policy=options.get("rate_limit_policy", "marker"),
+                interval=options.get("rate_limit_interval", 1.0),
+            )
+        ptyproc = self.pty_backend.spawn(argv, env, cwd)
+        return PtyWithClients(
+            argv,
+            env,
+            cwd,
+            scrollback_bytes=options.get("scrollback_bytes"),
+            screen=screen,
+            ptyproc=ptyproc,
+            rate_limit=rate_limit,
+            latency=LatencyTrace() if self.trace_latency else None,
+        )
+
+    async def _async_spawn_terminal(self, options: dict[str, Any]) -> PtyWithClients:
+        if self.worker_pool is not None:
+            # Only sends a request to a worker; this must be on the event loop.
+            start = time.perf_counter()
+            term = self._spawn_terminal(options)
+            self._count_spawn(start)
+            return term
+        start = time.perf_counter()
+        loop = IOLoop.current()
+        term = await loop.run_in_executor(self.spawn_executor, self._spawn_terminal, options)
+        self._count_spawn(start)
+        return term
+
+    def _count_spawn(self, start: float) -> None:
+        if self.metrics is not None:
+            self.metrics.spawns.inc()
+            self.metrics.spawn_seconds.observe(time.perf_counter() - start)
+
+    def start_pool(self) -> None:
+        """Start filling the pool of terminals, if the manager has one.
+
+        Otherwise this happens when the first terminal is requested. Call it
+        once the event loop is running.
+        """
+        self._schedule_pool_refill()
+
+    def _schedule_pool_refill(self) -> None:
+        if self._pool_refill is None and len(self.pool) < self.pool_size:
+            self._pool_refill = IOLoop.current().call_later(
+                self.pool_refill_interval, self._refill_pool
+            )
+
+    async def _refill_pool(self) -> None:
+        # The timeout stays set while spawning, so that no other refill starts
+        handle = self._pool_refill
+        if len(self.pool) < self.pool_size:
+            options = self._terminal_options({})
+            try:
+                term = await self._async_spawn_terminal(options)
+            except Exception:
+                self.log.exception("Failed to spawn a terminal for the pool")
+                self._pool_refill = None
+                return
+            if self._pool_refill is not handle:
+                # The pool was emptied by kill_all meanwhile
+                await self._discard_terminal(term)
+                return
+            self.pool.append(term)
+        self._pool_refill = None
+        self._schedule_pool_refill()
+
+    async def _discard_terminal(self, term: PtyWithClients) -> None:
+        """Kill a terminal which is not being read, and close its pty."""
+        await term.terminate(force=True)
+        _close_pty(term.ptyproc)
+
+    def _take_pooled(self, options: dict[str, Any]) -> PtyWithClients | None:
+        """A pooled terminal spawned with ``options``, or None."""
+        pooled_options = {**_DEFAULT_SIZE, **self._terminal_options({})}
+        if {**_DEFAULT_SIZE, **options} != pooled_options:
+            return None
+        while self.pool:
+            term = self.pool.popleft()
+            if not term.ptyproc.isalive():
+                _close_pty(term.ptyproc)
+                continue
+            return term
+        return None
 
     def start_reading(self, ptywclients: PtyWithClients) -> None:
         """Connect a terminal to the tornado event loop to read data from it."""
         fd = ptywclients.ptyproc.fd
         self.ptys_by_fd[fd] = ptywclients
+        ptywclients.started = IOLoop.current().time()
+        if os.name != "nt" and self.worker_pool is None:
+            # Reads and writes must not block the event loop.
+            os.set_blocking(fd, False)
+        culling = self.terminado_cull_inactive_timeout or self.terminado_cull_max_age
+        if culling and self._culler is None:
+            self._culler = PeriodicCallback(
+                self.cull_terminals, self.terminado_cull_interval * 1000
+            )
+            self._culler.start()
+        if self.io_threads and not self._reader_threads:
+            loop = IOLoop.current()
+            for _ in range(self.io_threads):
+                thread = PtyReaderThread(functools.partial(loop.add_callback, self._on_pty_batch))
+                thread.start()
+                self._reader_threads.append(thread)
+        self._update_events(ptywclients)
+
+    def _update_events(self, ptywclients: PtyWithClients) -> None:
+        """Register for the pty events we need: readable unless reading is
+        paused, writable while there is input waiting."""
+        fd = ptywclients.ptyproc.fd
+        if fd not in self.ptys_by_fd:
+            return
+        if self.worker_pool is not None:
+            # The worker reads the pty, and writes input as soon as it can.
+            ptywclients.ptyproc.set_reading(not ptywclients.reading_paused)
+            return
         loop = IOLoop.current()
-        loop.add_handler(fd, self.pty_read, loop.READ)
+        events = 0
+        if self._reader_threads:
+            reading = not ptywclients.reading_paused
+            if reading != ptywclients.thread_reading:
+                thread = self._reader_threads[fd % len(self._reader_threads)]
+                if reading:
+                    thread.add(ptywclients)
+                else:
+                    thread.remove(fd)
+                ptywclients.thread_reading = reading
+        elif not ptywclients.reading_paused:
+            events |= loop.READ
+        if ptywclients.input_buffer:
+            events |= loop.WRITE
+        if events == ptywclients.io_events:
+            return
+        if not ptywclients.io_events:
+            loop.add_handler(fd, self._handle_pty_events, events)
+        elif not events:
+            loop.remove_handler(fd)
+        else:
+            loop.update_handler(fd, events)
+        ptywclients.io_events = events
+
+    def _handle_pty_events(self, fd: int, events: int) -> None:
+        if events & IOLoop.WRITE:
+            self.pty_write(fd)
+        if events & IOLoop.READ and fd in self.ptys_by_fd:
+            if self.read_budget is None:
+                self.pty_read(fd, events)
+                return
+            self._ready_fds.add(fd)
+            if not self._reads_scheduled:
+                self._reads_scheduled = True
+                IOLoop.current().add_callback(self._run_reads)
+
+    def _run_reads(self) -> None:
+        """Read the ptys found readable, interactive ones first, within the budget."""
+        self._reads_scheduled = False
+        now = IOLoop.current().time()
+        ready = [self.ptys_by_fd[fd] for fd in self._ready_fds if fd in self.ptys_by_fd]
+        self._ready_fds.clear()
+
+        def interactive(ptywclients: PtyWithClients) -> bool:
+            return now - ptywclients.last_input < self.interactive_window
+
+        def priority(ptywclients: PtyWithClients) -> tuple[bool, float]:
+            return not interactive(ptywclients), ptywclients.output_volume
+
+        ready.sort(key=priority)
+        budget = self.read_budget
+        assert budget is not None
+        for ptywclients in ready:
+            fd = ptywclients.ptyproc.fd
+            if fd not in self.ptys_by_fd or ptywclients.reading_paused:
+                continue
+            if budget <= 0 and not interactive(ptywclients):
+                # It stays readable, so the event loop will report it again.
+                # Let it come before the ones served now next time.
+                ptywclients.output_volume /= 2
+                continue
+            before = ptywclients.bytes_read
+            self.pty_read(fd)
+            served = ptywclients.bytes_read - before
+            budget -= served
+            ptywclients.output_volume += (served - ptywclients.output_volume) / 4
+
+    def pause_reading(self, ptywclients: PtyWithClients) -> None:
+        """Stop reading a pty until :meth:`resume_reading` is called."""
+        if not ptywclients.reading_paused:
+            ptywclients.reading_paused = True
+            self._update_events(ptywclients)
+
+    def resume_reading(self, ptywclients: PtyWithClients) -> None:
+        """Start reading a pty paused by :meth:`pause_reading` again."""
+        if ptywclients.reading_paused:
+            ptywclients.reading_paused = False
+            self._update_events(ptywclients)
+
+    def write_input(self, ptywclients: PtyWithClients, text: str) -> Future[None]:
+        """Send input to the process in a pty, without blocking.
+
+        The input is added to the terminal's own queue and written as the pty
+        accepts it, so a terminal which doesn't read its input never delays
+        another. The returned future resolves once the input is written, or
+        discarded because the pty has closed. On Windows, the write is done
+        on the blocking I/O executor instead.
+        """
+        loop = IOLoop.current()
+        ptywclients.last_input = loop.time()
+        if self.metrics is not None:
+            self.metrics.input_bytes.inc(len(text.encode("utf-8")))
+        latency = ptywclients.latency
+        if os.name == "nt":
+            written = loop.run_in_executor(
+                self.blocking_io_executor, ptywclients.write_blocking, text
+            )
+            if latency is not None:
+                latency.queued(0, time.perf_counter())
+                written.add_done_callback(
+                    lambda f: latency.written(float("inf"), time.perf_counter())
+                )
+            return written
+        future: Future[None] = Future()
+        if ptywclients.ptyproc.fd not in self.ptys_by_fd:
+            # Not being read, or already closed
+            future.set_result(None)
+            return future
+        if self.worker_pool is not None:
+            end = ptywclients.ptyproc.write(text.encode("utf-8"))
+            ptywclients.input_waiters.append((end, future))
+            if latency is not None:
+                latency.queued(end, time.perf_counter())
+            return future
+        was_empty = not ptywclients.input_buffer
+        ptywclients.input_buffer += text.encode("utf-8")
+        end = ptywclients.input_written + len(ptywclients.input_buffer)
+        ptywclients.input_waiters.append((end, future))
+        if latency is not None:
+            latency.queued(end, time.perf_counter())
+        if was_empty:
+            self.pty_write(ptywclients.ptyproc.fd)
+        return future
+
+    def input_backlogged(self, ptywclients: PtyWithClients) -> bool:
+        """Whether more input is waiting for a pty than one stdin message may hold."""
+        if os.name == "nt":
+            # Writes are serialised on the blocking I/O executor
+            return True
+        limit = self.max_stdin_message_size
+        return limit is not None and self._unwritten_input(ptywclients) > limit
+
+    def _unwritten_input(self, ptywclients: PtyWithClients) -> int:
+        if self.worker_pool is not None:
+            sent: int = ptywclients.ptyproc.bytes_sent
+            return sent - ptywclients.input_written
+        return len(ptywclients.input_buffer)
+
+    def pty_write(self, fd: int) -> None:
+        """Write the next chunk of queued input to a pty, if it accepts it."""
+        ptywclients = self.ptys_by_fd.get(fd)
+        if ptywclients is None:
+            return
+        buf = ptywclients.input_buffer
+        try:
+            n = os.write(fd, buf[: self.stdin_chunk_size])
+        except BlockingIOError:
+            n = 0
+        except OSError:
+            # The pty is closing; the EOF will be handled by pty_read.
+            n = len(buf)
+        del buf[:n]
+        self._input_written(ptywclients, n)
+        self._update_events(ptywclients)
+
+    def _input_written(self, ptywclients: PtyWithClients, n: int) -> None:
+        ptywclients.input_written += n
+        if ptywclients.latency is not None and n:
+            ptywclients.latency.written(ptywclients.input_written, time.perf_counter())
+        waiters = ptywclients.input_waiters
+        while waiters and waiters[0][0] <= ptywclients.input_written:
+            future_set_result_unless_cancelled(waiters.popleft()[1], None)
+
+    def check_backpressure(self, ptywclients: PtyWithClients) -> None:
+        """Pause reading a pty while all its clients are congested."""
+        clients = ptywclients.clients
+        if clients and all(getattr(client, "congested", False) for client in clients):
+            self.pause_reading(ptywclients)
+        else:
+            self.resume_reading(ptywclients)
 
     def on_eof(self, ptywclients: PtyWithClients) -> None:
         """Called when the pty has closed."""
@@ -246,27 +1012,233 @@ class TermManagerBase:
         self.log.info("EOF on FD %d; stopping reading", fd)
         del self.ptys_by_fd[fd]
         IOLoop.current().remove_handler(fd)
+        ptywclients.io_events = 0
+        if ptywclients.thread_reading:
+            self._reader_threads[fd % len(self._reader_threads)].remove(fd)
+            ptywclients.thread_reading = False
+        # Input which can no longer be written counts as done
+        self._input_written(ptywclients, self._unwritten_input(ptywclients))
+        ptywclients.input_buffer.clear()
+        ptywclients.read_buf = None
+        self.flush_output(ptywclients, final=True)
+        if ptywclients.rate_limit_timeout is not None:
+            # Show the clients the end of the output
+            IOLoop.current().remove_timeout(ptywclients.rate_limit_timeout)
+            self._end_rate_limit_period(ptywclients, final=True)
 
         # This closes the fd, and should result in the process being reaped.
-        ptywclients.ptyproc.close()
+        _close_pty(ptywclients.ptyproc)
 
     def pty_read(self, fd: int, events: Any = None) -> None:
         """Called by the event loop when there is pty data ready to read."""
-        # prevent blocking on fd
-        if not _poll(fd, timeout=0.1):  # 100ms
-            self.log.debug("Spurious pty_read() on fd %s", fd)
-            return
         ptywclients = self.ptys_by_fd[fd]
+        metrics = self.metrics
+        start = time.perf_counter() if metrics is not None else 0.0
         try:
             self.pre_pty_read_hook(ptywclients)
-            s = ptywclients.ptyproc.read(65536)
-            ptywclients.read_buffer.append(s)
-            for client in ptywclients.clients:
-                client.on_pty_read(s)
+            if os.name == "nt":
+                s = ptywclients.read_nonblocking(65536)
+                if s is None:
+                    self.log.debug("Spurious pty_read() on fd %s", fd)
+                    return
+                self.on_pty_output(ptywclients, s)
+                return
+            buf = ptywclients.read_buf
+            if buf is None:
+                buf = ptywclients.read_buf = bytearray(self.min_read_size)
+            reads = largest = 0
+            bulk = False
+            while reads < ptywclients.reads_per_wakeup:
+                n = ptywclients.readinto_nonblocking(buf)
+                if n is None:
+                    bulk = False
+                    break
+                reads += 1
+                largest = max(largest, n)
+                ptywclients.bytes_read += n
+                with memoryview(buf) as view:
+                    self.on_pty_bytes(ptywclients, view[:n])
+                bulk = n >= len(buf) // 2
+                if not bulk or ptywclients.reading_paused or fd not in self.ptys_by_fd:
+                    break
+            if not reads:
+                self.log.debug("Spurious pty_read() on fd %s", fd)
+                return
+            self._adapt_reading(ptywclients, largest, bulk, reads)
+            if metrics is not None:
+                metrics.pty_reads.inc(reads)
+                metrics.pty_read_seconds.observe(time.perf_counter() - start)
         except EOFError:
-            self.on_eof(ptywclients)
-            for client in ptywclients.clients:
-                client.on_pty_died()
+            self._pty_closed(ptywclients)
+
+    def _adapt_reading(
+        self, ptywclients: PtyWithClients, largest: int, bulk: bool, reads: int
+    ) -> None:
+        """Fit the read buffer and reads per wakeup of a pty to its output rate."""
+        assert ptywclients.read_buf is not None
+        size = len(ptywclients.read_buf)
+        if largest == size:
+            size = min(size * 2, self.max_read_size)
+        elif largest < size // 4:
+            size = max(size // 2, self.min_read_size)
+        if size != len(ptywclients.read_buf):
+            ptywclients.read_buf = bytearray(size)
+        if bulk and reads == ptywclients.reads_per_wakeup:
+            # Output was left over
+            ptywclients.reads_per_wakeup = min(reads * 2, self.max_reads_per_wakeup)
+        elif not bulk:
+            ptywclients.reads_per_wakeup = max(ptywclients.reads_per_wakeup // 2, 1)
+
+    def _on_pty_batch(self, batch: PtyBatch) -> None:
+        """Handle output read by the I/O threads, on the event loop."""
+        for ptywclients, data in batch:
+            fd = ptywclients.ptyproc.fd
+            if self.ptys_by_fd.get(fd) is not ptywclients:
+                continue
+            self.pre_pty_read_hook(ptywclients)
+            if data is None:
+                self._pty_closed(ptywclients)
+                continue
+            self.on_pty_bytes(ptywclients, data)
+            if self._reader_threads:
+                thread = self._reader_threads[fd % len(self._reader_threads)]
+                thread.consumed(ptywclients, len(data))
+
+    def _on_remote_output(self, ptyproc: RemotePty, frames: OutputFrames) -> None:
+        """Handle output of a terminal read and coalesced by a worker process."""
+        ptywclients = self.ptys_by_fd.get(ptyproc.fd)
+        if ptywclients is None:
+            return
+        self.pre_pty_read_hook(ptywclients)
+        ptywclients.last_output = IOLoop.current().time()
+        if ptywclients.latency is not None:
+            ptywclients.latency.output(time.perf_counter())
+        ptywclients.read_buffer.write(frames.binary[1:])
+        if ptywclients.screen is not None:
+            ptywclients.screen.feed(frames.text)
+        # Have the worker encode JSON while websockets take it. Until it
+        # does, the JSON of the output is encoded here as needed.
+        ptyproc.set_encode_json(
+            any(not getattr(client, "binary", True) for client in ptywclients.clients)
+        )
+        self._send_output(ptywclients, frames)
+
+    def _on_remote_written(self, ptyproc: RemotePty, total: int) -> None:
+        ptywclients = self.ptys_by_fd.get(ptyproc.fd)
+        if ptywclients is not None:
+            self._input_written(ptywclients, total - ptywclients.input_written)
+
+    def _on_remote_eof(self, ptyproc: RemotePty) -> None:
+        ptywclients = self.ptys_by_fd.get(ptyproc.fd)
+        if ptywclients is not None:
+            self._pty_closed(ptywclients)
+
+    def _pty_closed(self, ptywclients: PtyWithClients) -> None:
+        self.on_eof(ptywclients)
+        for client in ptywclients.clients:
+            client.on_pty_died()
+
+    def on_pty_output(self, ptywclients: PtyWithClients, text: str) -> None:
+        """Queue output read from a pty, coalescing bursts into one message."""
+        self.on_pty_bytes(ptywclients, text.encode("utf-8"))
+
+    def on_pty_bytes(self, ptywclients: PtyWithClients, data: bytes | memoryview) -> None:
+        """Like :meth:`on_pty_output`, with the output as read, in UTF-8.
+
+        It is only decoded if a client or the screen model needs text.
+        """
+        loop = IOLoop.current()
+        now = ptywclients.last_output = loop.time()
+        if ptywclients.latency is not None:
+            ptywclients.latency.output(time.perf_counter())
+        ptywclients.pending_output += data
+        if not self.coalesce_delay or len(ptywclients.pending_output) >= self.coalesce_max_size:
+            self.flush_output(ptywclients)
+            return
+        if ptywclients.flush_timeout is not None:
+            return
+
+        due = ptywclients.last_flush + self.coalesce_delay
+        if now >= due:
+            # Sparse output, e.g. echo of a keystroke: don't wait.
+            self.flush_output(ptywclients)
+        else:
+            ptywclients.flush_timeout = loop.call_at(due, self.flush_output, ptywclients)
+
+    def flush_output(self, ptywclients: PtyWithClients, final: bool = False) -> None:
+        """Send any pending output of a pty to its clients.
+
+        A character split across reads is held back for the next flush,
+        unless this is the ``final`` one.
+        """
+        if ptywclients.flush_timeout is not None:
+            IOLoop.current().remove_timeout(ptywclients.flush_timeout)
+            ptywclients.flush_timeout = None
+        pending = ptywclients.pending_output
+        end = len(pending) if final else _utf8_boundary(pending)
+        if not end:
+            return
+        ptywclients.last_flush = IOLoop.current().time()
+        offset = ptywclients.read_buffer.end_offset + end
+        with memoryview(pending) as view:
+            frames = OutputFrames.from_utf8(view[:end], offset)
+        del pending[:end]
+        ptywclients.read_buffer.write(memoryview(frames.binary)[1:])
+        if ptywclients.screen is not None:
+            ptywclients.screen.feed(frames.text)
+        self._send_output(ptywclients, frames)
+
+    def _send_output(self, ptywclients: PtyWithClients, frames: OutputFrames) -> None:
+        """Send a chunk of output to the clients of a pty, within its rate limit."""
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.output_bytes.inc(len(frames.binary) - 1)
+        limit = ptywclients.rate_limit
+        if limit is not None:
+            loop = IOLoop.current()
+            if not limit.allow(len(frames.binary) - 1, loop.time()):
+                if ptywclients.rate_limit_timeout is None:
+                    self.log.debug("Suppressing output of fd %s", ptywclients.ptyproc.fd)
+                    ptywclients.rate_limit_timeout = loop.call_later(
+                        limit.interval, self._end_rate_limit_period, ptywclients
+                    )
+                return
+        if metrics is None:
+            ptywclients.broadcast_frames(frames)
+            return
+        start = time.perf_counter()
+        ptywclients.broadcast_frames(frames)
+        metrics.fanout_seconds.observe(time.perf_counter() - start)
+
+    def _end_rate_limit_period(self, ptywclients: PtyWithClients, final: bool = False) -> None:
+        """Tell clients about the output suppressed, and resume if it has slowed."""
+        limit = ptywclients.rate_limit
+        assert limit is not None
+        ptywclients.rate_limit_timeout = None
+        loop = IOLoop.current()
+        resumed = limit.end_period(loop.time()) or final
+        nbytes = limit.take_suppressed()
+        if nbytes:
+            ptywclients.report_suppressed(nbytes)
+        if resumed:
+            limit.suppressing = False
+        else:
+            ptywclients.rate_limit_timeout = loop.call_later(
+                limit.interval, self._end_rate_limit_period, ptywclients
+            )
+
+    def latency_report(self) -> dict[str, dict[str, dict[str, float]]]:
+        """The echo latency percentiles of each terminal, in seconds.
+
+        Terminals are named by their name, or their fd if they have none. The
+        report is empty unless the manager was created with ``trace_latency``.
+        """
+        report = {}
+        for ptywclients in self.ptys_by_fd.values():
+            if ptywclients.latency is not None:
+                name = getattr(ptywclients, "term_name", None) or str(ptywclients.ptyproc.fd)
+                report[name] = ptywclients.latency.percentiles()
+        return report
 
     def pre_pty_read_hook(self, ptywclients: PtyWithClients) -> None:
         """Hook before pty read, subclass can patch something into ptywclients when pty_read"""
@@ -280,20 +1252,92 @@ class TermManagerBase:
         """
         raise NotImplementedError
 
+    async def async_get_terminal(self, url_component: Any = None) -> PtyWithClients:
+        """Give a terminal to a new websocket connection, without blocking.
+
+        :class:`TermSocket` calls this. By default, it calls
+        :meth:`get_terminal`; the managers in terminado override it to spawn
+        new terminals on the ``spawn_executor``, unless a subclass overrides
+        :meth:`get_terminal`.
+        """
+        return self.get_terminal(url_component)
+
     def client_disconnected(self, websocket: Any) -> None:
         """Override this to e.g. kill terminals on client disconnection."""
 
+    async def cull_terminals(self) -> list[PtyWithClients]:
+        """Terminate the terminals due to be culled, and return them.
+
+        The culler calls this periodically, if the manager was given a
+        ``terminado_cull_inactive_timeout`` or ``terminado_cull_max_age``.
+        Each culled terminal is passed to :meth:`on_terminal_culled` once it
+        has been terminated.
+        """
+        now = IOLoop.current().time()
+        due = []
+        for term in self.ptys_by_fd.values():
+            max_age = self.terminado_cull_max_age
+            if max_age and now - term.started >= max_age:
+                reason = "max_age"
+            elif (
+                self.terminado_cull_inactive_timeout
+                and not term.clients
+                and now - term.last_active_time() >= self.terminado_cull_inactive_timeout
+            ):
+                reason = "inactive"
+            else:
+                continue
+            # Spare terminals which may be busy, unless told otherwise
+            if not self.terminado_cull_busy and term.has_foreground_job() is not False:
+                continue
+            due.append((term, reason))
+        if due:
+            await asyncio.gather(*(self._cull_terminal(term, reason) for term, reason in due))
+        return [term for term, _ in due]
+
+    async def _cull_terminal(self, ptywclients: PtyWithClients, reason: str) -> None:
+        name = getattr(ptywclients, "term_name", None) or ptywclients.ptyproc.fd
+        self.log.info("Culling terminal %s (%s)", name, reason)
+        if self.metrics is not None:
+            self.metrics.culled.inc()
+        await ptywclients.terminate(force=True)
+        self.on_terminal_culled(ptywclients, reason)
+
+    def on_terminal_culled(self, ptywclients: PtyWithClients, reason: str) -> None:
+        """Override this to act on terminals terminated by the culler.
+
+        ``reason`` is ``"inactive"`` or ``"max_age"``.
+        """
+
     async def shutdown(self) -> None:
         """Shutdown the manager."""
         await self.kill_all()
         if not self._blocking_io_executor_is_external:
             self.blocking_io_executor.shutdown(wait=False, cancel_futures=True)  # type:ignore[call-arg]
+        if not self._spawn_executor_is_external:
+            self.spawn_executor.shutdown(wait=False, cancel_futures=True)  # type:ignore[call-arg]
+        if self.spawn_helper is not None:
+            self.spawn_helper.close()
+        for thread in self._reader_threads:
+            thread.stop()
+        self._reader_threads = []
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
 
     async def kill_all(self) -> None:
-        """Kill all terminals."""
-        futures = []
+        """Kill all terminals, including any in the pool."""
+        if self._pool_refill is not None:
+            IOLoop.current().remove_timeout(self._pool_refill)
+            self._pool_refill = None
+        if self._culler is not None:
+            self._culler.stop()
+            self._culler = None
+        futures: list[Coroutine[Any, Any, Any]] = []
         for term in self.ptys_by_fd.values():
             futures.append(term.terminate(force=True))
+        # Pooled terminals are not read, so won't be closed on EOF
+        futures.extend(self._discard_terminal(term) for term in self.pool)
+        self.pool.clear()
         # wait for futures to finish
         if futures:
             await asyncio.gather(*futures)
@@ -306,6 +1350,7 @@ class SingleTermManager(TermManagerBase):
         """Initialize the manager."""
         super().__init__(**kwargs)
         self.terminal: PtyWithClients | None = None
+        self._spawning: asyncio.Future[PtyWithClients] | None = None
 
     def get_terminal(self, url_component: Any = None) -> PtyWithClients:
         """ "Get the singleton terminal."""
@@ -314,6 +1359,25 @@ class SingleTermManager(TermManagerBase):
             self.start_reading(self.terminal)
         return self.terminal
 
+    async def async_get_terminal(self, url_component: Any = None) -> PtyWithClients:
+        """Get the singleton terminal, spawning it off the event loop."""
+        if type(self).get_terminal is not SingleTermManager.get_terminal:
+            return await super().async_get_terminal(url_component)
+        if self.terminal is not None:
+            return self.terminal
+        if self._spawning is None:
+            self._spawning = asyncio.ensure_future(self._spawn_single())
+        return await asyncio.shield(self._spawning)
+
+    async def _spawn_single(self) -> PtyWithClients:
+        try:
+            term = await self.async_new_terminal()
+        finally:
+            self._spawning = None
+        self.terminal = term
+        self.start_reading(term)
+        return term
+
     async def kill_all(self) -> None:
         """Kill the singletone terminal."""
         await super().kill_all()
@@ -339,16 +1403,32 @@ class UniqueTermManager(TermManagerBase):
         """Initialize the manager."""
         super().__init__(**kwargs)
         self.max_terminals = max_terminals
+        self._spawning = 0
 
     def get_terminal(self, url_component: Any = None) -> PtyWithClients:
         """Get a terminal from the manager."""
-        if self.max_terminals and len(self.ptys_by_fd) >= self.max_terminals:
+        if self.max_terminals and len(self.ptys_by_fd) + self._spawning >= self.max_terminals:
             raise MaxTerminalsReached(self.max_terminals)
 
         term = self.new_terminal()
         self.start_reading(term)
         return term
 
+    async def async_get_terminal(self, url_component: Any = None) -> PtyWithClients:
+        """Get a terminal from the manager, spawning it off the event loop."""
+        if type(self).get_terminal is not UniqueTermManager.get_terminal:
+            return await super().async_get_terminal(url_component)
+        if self.max_terminals and len(self.ptys_by_fd) + self._spawning >= self.max_terminals:
+            raise MaxTerminalsReached(self.max_terminals)
+
+        self._spawning += 1
+        try:
+            term = await self.async_new_terminal()
+        finally:
+            self._spawning -= 1
+        self.start_reading(term)
+        return term
+
     def client_disconnected(self, websocket: TermSocket) -> None:
         """Send terminal SIGHUP when client disconnects."""
         self.log.info("Websocket closed, sending SIGHUP to terminal.")
@@ -370,6 +1450,8 @@ class NamedTermManager(TermManagerBase):
         super().__init__(**kwargs)
         self.max_terminals = max_terminals
         self.terminals: dict[str, PtyWithClients] = {}
+        # Terminals being spawned by the async methods, by name
+        self._spawning: dict[str, asyncio.Future[PtyWithClients]] = {}
 
     def get_terminal(self, term_name: str) -> PtyWithClients:  # type:ignore[override]
         """Get or create a terminal by name."""
@@ -378,7 +1460,7 @@ class NamedTermManager(TermManagerBase):
         if term_name in self.terminals:
             return self.terminals[term_name]
 
-        if self.max_terminals and len(self.terminals) >= self.max_terminals:
+        if self.max_terminals and len(self.terminals) + len(self._spawning) >= self.max_terminals:
             raise MaxTerminalsReached(self.max_terminals)
 
         # Create new terminal
@@ -389,18 +1471,41 @@ class NamedTermManager(TermManagerBase):
         self.start_reading(term)
         return term
 
+    async def async_get_terminal(self, term_name: str) -> PtyWithClients:  # type:ignore[override]
+        """Get or create a terminal by name, spawning it off the event loop.
+
+        Concurrent requests for a terminal which doesn't exist yet share one
+        spawn.
+        """
+        if type(self).get_terminal is not NamedTermManager.get_terminal:
+            return await super().async_get_terminal(term_name)
+        assert term_name is not None
+
+        if term_name in self.terminals:
+            return self.terminals[term_name]
+
+        if term_name not in self._spawning:
+            if (
+                self.max_terminals
+                and len(self.terminals) + len(self._spawning) >= self.max_terminals
+            ):
+                raise MaxTerminalsReached(self.max_terminals)
+            self.log.info("New terminal with specified name: %s", term_name)
+            self._start_spawning(term_name, {})
+        return await asyncio.shield(self._spawning[term_name])
+
     name_template = "%d"
 
     def _next_available_name(self) -> str | None:
         for n in itertools.count(start=1):
             name = self.name_template % n
-            if name not in self.terminals:
+            if name not in self.terminals and name not in self._spawning:
                 return name
         return None
 
     def new_named_terminal(self, **kwargs: Any) -> tuple[str, PtyWithClients]:
         """Create a new named terminal with an automatic name."""
-        name = kwargs["name"] if "name" in kwargs else self._next_available_name()
+        name = kwargs.pop("name") if "name" in kwargs else self._next_available_name()
         term = self.new_terminal(**kwargs)
         self.log.info("New terminal with automatic name: %s", name)
         term.term_name = name
@@ -408,6 +1513,31 @@ class NamedTermManager(TermManagerBase):
         self.start_reading(term)
         return name, term
 
+    async def async_new_named_terminal(self, **kwargs: Any) -> tuple[str, PtyWithClients]:
+        """Like :meth:`new_named_terminal`, but spawning off the event loop."""
+        name = kwargs.pop("name") if "name" in kwargs else self._next_available_name()
+        assert name is not None
+        self.log.info("New terminal with automatic name: %s", name)
+        self._start_spawning(name, kwargs)
+        return name, await asyncio.shield(self._spawning[name])
+
+    async def new_named_terminals(self, n: int, **kwargs: Any) -> list[tuple[str, PtyWithClients]]:
+        """Create ``n`` named terminals with automatic names, spawned concurrently."""
+        return await asyncio.gather(*(self.async_new_named_terminal(**kwargs) for _ in range(n)))
+
+    def _start_spawning(self, name: str, kwargs: dict[str, Any]) -> None:
+        async def spawn() -> PtyWithClients:
+            try:
+                term = await self.async_new_terminal(**kwargs)
+            finally:
+                del self._spawning[name]
+            term.term_name = name
+            self.terminals[name] = term
+            self.start_reading(term)
+            return term
+
+        self._spawning[name] = asyncio.ensure_future(spawn())
+
     def kill(self, name: str, sig: int = signal.SIGTERM) -> None:
         """Kill a terminal by name."""
         term = self.terminals[name]
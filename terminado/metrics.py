@@ -0,0 +1,270 @@
+"""Counters and histograms about terminals, in the Prometheus text format.
+
+Give a terminal manager a :class:`TermMetrics` to collect them, and serve
+them with :class:`MetricsHandler`::
+
+    metrics = TermMetrics()
+    term_manager = UniqueTermManager(shell_command=["bash"], metrics=metrics)
+    app = tornado.web.Application([
+        (r"/websocket", TermSocket, {"term_manager": term_manager}),
+        (r"/metrics", MetricsHandler, {"metrics": metrics}),
+    ])
+
+Without one, the manager and its websockets skip all of this after checking
+that ``metrics`` is None.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import bisect
+import weakref
+from typing import TYPE_CHECKING, Any
+
+import tornado.web
+
+from terminado.tracing import QUANTILES
+
+if TYPE_CHECKING:
+    from terminado.management import PtyWithClients, TermManagerBase
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SPAWN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label(term: PtyWithClients) -> str:
+    return _escape(str(getattr(term, "term_name", None) or term.ptyproc.fd))
+
+
+def _header(name: str, description: str, kind: str) -> list[str]:
+    return [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+
+
+class Counter:
+    """A value which only goes up."""
+
+    __slots__ = ("description", "name", "value")
+
+    def __init__(self, name: str, description: str) -> None:
+        """Initialize the counter."""
+        self.name = name
+        self.description = description
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        """Add ``amount`` to the counter."""
+        self.value += amount
+
+    def render(self) -> list[str]:
+        """The lines of the text format for the counter."""
+        return [*_header(self.name, self.description, "counter"), f"{self.name} {self.value}"]
+
+
+class Histogram:
+    """Observations counted in buckets of values up to their upper bounds."""
+
+    __slots__ = ("buckets", "count", "counts", "description", "name", "sum")
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...]) -> None:
+        """Initialize the histogram."""
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # The last one counts the observations above all the bounds
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum: float = 0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Count an observation."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self) -> list[str]:
+        """The lines of the text format for the histogram."""
+        lines = _header(self.name, self.description, "histogram")
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class TermMetrics:
+    """The metrics of one or more terminal managers and their websockets.
+
+    Counters and histograms are updated as things happen. Gauges, like the
+    number of live terminals or the size of their output history, are
+    computed from the managers when the metrics are rendered. With
+    ``per_terminal``, the output, clients and history size of each terminal
+    are rendered too, labelled with its name, or its fd if it has none, and
+    for terminals tracing their latency, its quantiles by stage.
+    """
+
+    def __init__(self, per_terminal: bool = True) -> None:
+        """Initialize the metrics."""
+        self.per_terminal = per_terminal
+        self._managers: weakref.WeakSet[TermManagerBase] = weakref.WeakSet()
+
+        self.output_bytes = Counter(
+            "terminado_output_bytes_total", "Bytes of output read from terminals."
+        )
+        self.input_bytes = Counter(
+            "terminado_input_bytes_total", "Bytes of input sent to terminals."
+        )
+        self.pty_reads = Counter(
+            "terminado_pty_reads_total", "Reads from ptys done on the event loop."
+        )
+        self.spawns = Counter("terminado_spawns_total", "Terminals spawned.")
+        self.culled = Counter("terminado_culled_total", "Terminals terminated by the culler.")
+        self.connections = Counter(
+            "terminado_websocket_connections_total", "Websocket clients connected to terminals."
+        )
+        self.sent_bytes = Counter(
+            "terminado_websocket_sent_bytes_total",
+            "Bytes of websocket messages sent, before any compression.",
+        )
+        self.sent_messages = Counter(
+            "terminado_websocket_sent_messages_total", "Websocket messages sent."
+        )
+        self.pty_read_seconds = Histogram(
+            "terminado_pty_read_seconds",
+            "Time taken by pty_read, including passing the output on.",
+            LATENCY_BUCKETS,
+        )
+        self.fanout_seconds = Histogram(
+            "terminado_fanout_seconds",
+            "Time taken to send a chunk of output to all the clients of a terminal.",
+            LATENCY_BUCKETS,
+        )
+        self.spawn_seconds = Histogram(
+            "terminado_spawn_seconds", "Time taken to spawn a terminal.", SPAWN_BUCKETS
+        )
+        self.replay_bytes = Histogram(
+            "terminado_replay_bytes",
+            "Size of the output replayed to connecting clients.",
+            SIZE_BUCKETS,
+        )
+
+    def register(self, manager: TermManagerBase) -> None:
+        """Include the terminals of ``manager`` in the gauges."""
+        self._managers.add(manager)
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for metric in (
+            self.output_bytes,
+            self.input_bytes,
+            self.pty_reads,
+            self.spawns,
+            self.culled,
+            self.connections,
+            self.sent_bytes,
+            self.sent_messages,
+            self.pty_read_seconds,
+            self.fanout_seconds,
+            self.spawn_seconds,
+            self.replay_bytes,
+        ):
+            lines.extend(metric.render())
+
+        terminals: list[PtyWithClients] = []
+        pooled = pending_input = 0
+        for manager in self._managers:
+            terminals.extend(manager.ptys_by_fd.values())
+            pooled += len(manager.pool)
+            pending_input += sum(
+                manager._unwritten_input(term) for term in manager.ptys_by_fd.values()
+            )
+        gauges: list[tuple[str, str, Any]] = [
+            ("terminado_terminals", "Terminals being read.", len(terminals)),
+            ("terminado_pooled_terminals", "Terminals spawned ahead of time.", pooled),
+            (
+                "terminado_clients",
+                "Clients connected to terminals.",
+                sum(len(term.clients) for term in terminals),
+            ),
+            (
+                "terminado_history_bytes",
+                "Output history kept for reconnecting clients.",
+                sum(term.read_buffer.nbytes for term in terminals),
+            ),
+            (
+                "terminado_input_pending_bytes",
+                "Input waiting to be written to terminals.",
+                pending_input,
+            ),
+        ]
+        for name, description, value in gauges:
+            lines.extend(_header(name, description, "gauge"))
+            lines.append(f"{name} {value}")
+
+        if self.per_terminal:
+            per_terminal: list[tuple[str, str, str, Any]] = [
+                (
+                    "terminado_terminal_output_bytes_total",
+                    "Bytes of output of a terminal, in UTF-8.",
+                    "counter",
+                    lambda term: term.read_buffer.end_offset,
+                ),
+                (
+                    "terminado_terminal_clients",
+                    "Clients connected to a terminal.",
+                    "gauge",
+                    lambda term: len(term.clients),
+                ),
+                (
+                    "terminado_terminal_history_bytes",
+                    "Output history kept for a terminal.",
+                    "gauge",
+                    lambda term: term.read_buffer.nbytes,
+                ),
+            ]
+            for name, description, kind, value_of in per_terminal:
+                lines.extend(_header(name, description, kind))
+                for term in terminals:
+                    lines.append(f'{name}{{terminal="{_label(term)}"}} {value_of(term)}')
+
+            traced = [term for term in terminals if term.latency is not None]
+            if traced:
+                name = "terminado_terminal_latency_seconds"
+                lines.extend(
+                    _header(name, "Latency of the input to a terminal, by stage.", "summary")
+                )
+                for term in traced:
+                    assert term.latency is not None
+                    for stage, stats in term.latency.percentiles().items():
+                        labels = f'terminal="{_label(term)}",stage="{stage}"'
+                        for q in QUANTILES:
+                            value = stats[f"p{round(q * 100)}"]
+                            lines.append(f'{name}{{{labels},quantile="{q}"}} {value}')
+                        samples = term.latency.samples[stage]
+                        lines.append(f"{name}_sum{{{labels}}} {sum(samples)}")
+                        lines.append(f"{name}_count{{{labels}}} {len(samples)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Serve :class:`TermMetrics` in the Prometheus text exposition format."""
+
+    def initialize(self, metrics: TermMetrics) -> None:
+        """Initialize the handler."""
+        self.metrics = metrics
+
+    def get(self) -> None:
+        """Render the metrics."""
+        self.set_header("Content-Type", CONTENT_TYPE)
+        self.write(self.metrics.render())
@@ -0,0 +1,87 @@
+"""Limits on the rate of output sent to the clients of a terminal."""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+# How much of the output history a snapshot shows without a screen model
+SNAPSHOT_BYTES = 16384
+
+
+class OutputRateLimit:
+    """A ceiling on the output a terminal sends to its clients.
+
+    Output is counted over periods of ``interval`` seconds. Once more than
+    ``max_bytes_per_s`` bytes or ``max_frames_per_s`` messages per second
+    have been sent in a period, further output is suppressed: it is still
+    read from the pty and kept in the terminal's history, but not sent. At
+    the end of every period in which output was suppressed, clients are told
+    about it according to ``policy``:
+
+    - ``"marker"``: ``["suppressed", nbytes, offset]``, the number of bytes
+      left out and the offset reached.
+    - ``"snapshot"``: a reset, followed by the terminal's screen, or the end
+      of its output history without a screen model.
+
+    Streaming resumes after a period in which the output stayed within the
+    limits.
+    """
+
+    def __init__(
+        self,
+        max_bytes_per_s: float | None = None,
+        max_frames_per_s: float | None = None,
+        policy: str = "marker",
+        interval: float = 1.0,
+    ) -> None:
+        """Initialize the limit."""
+        if policy not in ("marker", "snapshot"):
+            msg = f"Unknown rate limit policy: {policy!r}"
+            raise ValueError(msg)
+        self.max_bytes_per_s = max_bytes_per_s
+        self.max_frames_per_s = max_frames_per_s
+        self.policy = policy
+        self.interval = interval
+        self.suppressing = False
+        # Bytes left out since clients were last told
+        self.suppressed_bytes = 0
+        self._period_start = float("-inf")
+        self._bytes = 0
+        self._frames = 0
+
+    def allow(self, size: int, now: float) -> bool:
+        """Count a chunk of ``size`` bytes of output; return whether to send it."""
+        if not self.suppressing and now - self._period_start >= self.interval:
+            self._start_period(now)
+        self._bytes += size
+        self._frames += 1
+        if not self.suppressing and self._exceeded(self.interval):
+            self.suppressing = True
+        if self.suppressing:
+            self.suppressed_bytes += size
+            return False
+        return True
+
+    def end_period(self, now: float) -> bool:
+        """End a period of suppressed output; return whether to resume streaming."""
+        if self._exceeded(max(now - self._period_start, 1e-3)):
+            self._start_period(now)
+            return False
+        self.suppressing = False
+        self._start_period(now)
+        return True
+
+    def take_suppressed(self) -> int:
+        """The number of bytes suppressed since the last call."""
+        nbytes, self.suppressed_bytes = self.suppressed_bytes, 0
+        return nbytes
+
+    def _start_period(self, now: float) -> None:
+        self._period_start = now
+        self._bytes = 0
+        self._frames = 0
+
+    def _exceeded(self, seconds: float) -> bool:
+        if self.max_bytes_per_s is not None and self._bytes > self.max_bytes_per_s * seconds:
+            return True
+        return self.max_frames_per_s is not None and self._frames > self.max_frames_per_s * seconds
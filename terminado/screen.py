@@ -0,0 +1,128 @@
+"""Headless terminal screen model, used to replay a compact screen image.
+
+This needs the optional ``pyte`` dependency.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
+try:
+    import pyte
+    from pyte.graphics import BG_AIXTERM, BG_ANSI, FG_AIXTERM, FG_ANSI, FG_BG_256
+except ImportError:
+    HAVE_PYTE = False
+else:
+    HAVE_PYTE = True
+
+if TYPE_CHECKING:
+    from pyte.screens import Char
+
+# Default number of lines scrolled off the screen which are kept for replay
+DEFAULT_SCREEN_HISTORY = 1000
+
+if HAVE_PYTE:
+    _FG_NAMES = {name: code for code, name in {**FG_ANSI, **FG_AIXTERM}.items()}
+    _BG_NAMES = {name: code for code, name in {**BG_ANSI, **BG_AIXTERM}.items()}
+    # pyte stores 256-color palette entries as hex; map back to the first index
+    _PALETTE = {color: i for i, color in reversed(list(enumerate(FG_BG_256)))}
+
+
+def _color_params(color: str, names: dict[str, int], extended: int) -> str:
+    """The SGR parameters selecting ``color`` as foreground or background."""
+    if color in names:
+        return str(names[color])
+    if color in _PALETTE:
+        return f"{extended};5;{_PALETTE[color]}"
+    try:
+        r, g, b = int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+    except ValueError:
+        return str(extended + 1)  # Unknown: default color
+    return f"{extended};2;{r};{g};{b}"
+
+
+def _sgr(char: Char) -> str:
+    """The escape sequence setting the attributes of ``char``."""
+    params = ["0"]
+    if char.bold:
+        params.append("1")
+    if char.italics:
+        params.append("3")
+    if char.underscore:
+        params.append("4")
+    if char.blink:
+        params.append("5")
+    if char.reverse:
+        params.append("7")
+    if char.strikethrough:
+        params.append("9")
+    if char.fg != "default":
+        params.append(_color_params(char.fg, _FG_NAMES, 38))
+    if char.bg != "default":
+        params.append(_color_params(char.bg, _BG_NAMES, 48))
+    return "\x1b[" + ";".join(params) + "m"
+
+
+class ScreenModel:
+    """The current screen of a terminal, plus recent lines scrolled off it.
+
+    The model is fed the same output as the clients, and :meth:`render`
+    synthesizes output which reproduces its state on a blank terminal. The
+    size of that output depends on the screen size and ``history``, not on
+    how much output the terminal has produced.
+    """
+
+    def __init__(self, rows: int = 25, cols: int = 80, history: int = DEFAULT_SCREEN_HISTORY):
+        """Initialize the model."""
+        if not HAVE_PYTE:
+            msg = "The terminal screen model requires pyte"
+            raise ImportError(msg)
+        self.screen = pyte.HistoryScreen(cols, rows, history=history, ratio=0.5)
+        self.stream = pyte.Stream(self.screen)
+
+    def feed(self, text: str) -> None:
+        """Update the screen with output from the terminal."""
+        self.stream.feed(text)
+
+    def resize(self, rows: int, cols: int) -> None:
+        """Follow a resize of the terminal."""
+        self.screen.resize(lines=rows, columns=cols)
+
+    def _render_line(self, line: Any, parts: list[str], attrs: str) -> str:
+        cols = self.screen.columns
+        default = self.screen.default_char
+        # Trailing blanks need not be sent
+        end = cols
+        while end > 0 and line[end - 1] == default:
+            end -= 1
+        for x in range(end):
+            char = line[x]
+            if not char.data:
+                continue  # Second cell of a wide character
+            sgr = _sgr(char)
+            if sgr != attrs:
+                parts.append(sgr)
+                attrs = sgr
+            parts.append(char.data)
+        return attrs
+
+    def render(self) -> str:
+        """Output reproducing the history and screen on a blank terminal."""
+        screen = self.screen
+        attrs = _sgr(screen.default_char)
+        parts = ["\x1b[H\x1b[2J", attrs]
+        for line in screen.history.top:
+            attrs = self._render_line(line, parts, attrs)
+            parts.append("\r\n")
+        for y in range(screen.lines):
+            if y:
+                parts.append("\r\n")
+            attrs = self._render_line(screen.buffer[y], parts, attrs)
+        cursor = screen.cursor
+        parts.append(_sgr(cursor.attrs))
+        parts.append(f"\x1b[{cursor.y + 1};{cursor.x + 1}H")
+        if cursor.hidden:
+            parts.append("\x1b[?25l")
+        return "".join(parts)
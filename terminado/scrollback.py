@@ -0,0 +1,145 @@
+"""Byte-bounded storage for terminal output history."""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+from collections import deque
+from typing import Iterator
+
+# Default size of the history kept for each terminal, in bytes
+DEFAULT_SCROLLBACK_BYTES = 1 << 20
+
+
+class ScrollbackBuffer:
+    """The most recent output of a terminal, bounded by a byte budget.
+
+    Output is stored UTF-8 encoded in a ring of fixed-size blocks. When the
+    budget is exceeded, the oldest bytes are dropped, and blocks which become
+    empty are reused for new output rather than freed. Memory use is
+    therefore bounded by ``maxbytes`` plus one block, however the output was
+    chunked.
+
+    Every byte written is also given an offset, counting from the first byte
+    ever written; :meth:`read_from` returns the output after a given offset
+    as long as it hasn't been evicted.
+    """
+
+    def __init__(self, maxbytes: int = DEFAULT_SCROLLBACK_BYTES, block_size: int = 65536) -> None:
+        """Initialize the buffer."""
+        self.maxbytes = maxbytes
+        self.block_size = max(1, min(block_size, maxbytes))
+        self._blocks: deque[bytearray] = deque()
+        self._spare: list[bytearray] = []
+        # Offset of the oldest stored byte in the first block
+        self._head = 0
+        # Number of bytes used in the last block
+        self._tail = 0
+        self._size = 0
+        # Offset just past the newest byte
+        self.end_offset = 0
+
+    @property
+    def start_offset(self) -> int:
+        """The offset of the oldest byte still stored."""
+        return self.end_offset - self._size
+
+    @property
+    def nbytes(self) -> int:
+        """The number of bytes of output stored."""
+        return self._size
+
+    @property
+    def allocated(self) -> int:
+        """The memory held by the buffer's blocks, in bytes."""
+        return (len(self._blocks) + len(self._spare)) * self.block_size
+
+    def __len__(self) -> int:
+        """The number of bytes of output stored."""
+        return self._size
+
+    def append(self, text: str) -> None:
+        """Store a chunk of output."""
+        self.write(text.encode("utf-8"))
+
+    def write(self, data: bytes | memoryview) -> None:
+        """Store a chunk of UTF-8 encoded output."""
+        self.end_offset += len(data)
+        if self.maxbytes <= 0 or not data:
+            return
+        view = memoryview(data)
+        if len(view) > self.maxbytes:
+            view = view[-self.maxbytes :]
+        size = len(view)
+        blocks = self._blocks
+        while view:
+            if not blocks or self._tail == self.block_size:
+                blocks.append(self._spare.pop() if self._spare else bytearray(self.block_size))
+                self._tail = 0
+            n = min(self.block_size - self._tail, len(view))
+            blocks[-1][self._tail : self._tail + n] = view[:n]
+            self._tail += n
+            view = view[n:]
+        self._size += size
+        self._trim()
+
+    def _trim(self) -> None:
+        excess = self._size - self.maxbytes
+        while excess > 0:
+            end = self._tail if len(self._blocks) == 1 else self.block_size
+            available = end - self._head
+            if available > excess:
+                self._head += excess
+                self._size -= excess
+                return
+            self._spare.append(self._blocks.popleft())
+            self._head = 0
+            self._size -= available
+            excess -= available
+        if not self._blocks:
+            self._tail = 0
+
+    def chunks(self) -> Iterator[memoryview]:
+        """Iterate over the stored bytes, oldest first, without copying."""
+        last = len(self._blocks) - 1
+        for i, block in enumerate(self._blocks):
+            start = self._head if i == 0 else 0
+            end = self._tail if i == last else self.block_size
+            yield memoryview(block)[start:end]
+
+    def getvalue(self) -> bytes:
+        """Return all the stored bytes."""
+        return b"".join(self.chunks())
+
+    def read_from(self, offset: int) -> bytes | None:
+        """Return the bytes after ``offset``, or None if they are not all stored."""
+        start = self.start_offset
+        if not start <= offset <= self.end_offset:
+            return None
+        skip = offset - start
+        parts = []
+        for chunk in self.chunks():
+            if skip >= len(chunk):
+                skip -= len(chunk)
+                continue
+            parts.append(chunk[skip:])
+            skip = 0
+        return b"".join(parts)
+
+    def text(self) -> str:
+        """Return the stored output as text.
+
+        Eviction works on bytes, so the oldest character may have been cut;
+        any partial character at the start is skipped.
+        """
+        data = self.getvalue()
+        start = 0
+        while start < min(len(data), 3) and 0x80 <= data[start] < 0xC0:
+            start += 1
+        return data[start:].decode("utf-8", errors="replace")
+
+    def clear(self) -> None:
+        """Discard all stored output, keeping the blocks for reuse."""
+        self._spare.extend(self._blocks)
+        self._blocks.clear()
+        self._head = self._tail = self._size = 0
@@ -0,0 +1,276 @@
+"""A small helper process which spawns terminals for the server.
+
+Forking copies the page tables of the forking process, so spawning a shell
+from a server holding gigabytes of memory is slow. The helper is started
+once, while it is still cheap to start a process, and forks on the server's
+behalf: it creates the pty, starts the shell in it, and passes the pty's
+master file descriptor back over a Unix socket.
+
+The helper is a separate script; it only uses the standard library, and
+doesn't import terminado or Tornado.
+
+This only works on POSIX.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import array
+import errno
+import fcntl
+import json
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import termios
+import threading
+from typing import Any
+
+# Length prefix of the JSON messages on the socket
+_HEADER = struct.Struct("!I")
+
+# The size ptyprocess gives new ptys
+DEFAULT_DIMENSIONS = (24, 80)
+
+
+def _send_message(sock: socket.socket, message: Any, fds: tuple[int, ...] = ()) -> None:
+    data = json.dumps(message).encode("utf-8")
+    payload = _HEADER.pack(len(data)) + data
+    if fds:
+        rights = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))]
+        # The descriptors travel with the first byte sent
+        sent = sock.sendmsg([payload], rights)
+        payload = payload[sent:]
+    if payload:
+        # sendall() sends even nothing, which fails if the server has taken
+        # the whole message and closed the connection already.
+        sock.sendall(payload)
+
+
+def _recv_exact(sock: socket.socket, size: int, data: bytes = b"") -> bytes:
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            msg = "Spawn helper connection closed"
+            raise EOFError(msg)
+        data += chunk
+    return data
+
+
+def _recv_message(sock: socket.socket) -> tuple[Any, list[int]]:
+    fds = array.array("i")
+    data, ancdata, _, _ = sock.recvmsg(_HEADER.size, socket.CMSG_SPACE(fds.itemsize))
+    if not data:
+        msg = "Spawn helper connection closed"
+        raise EOFError(msg)
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[: len(cdata) - (len(cdata) % fds.itemsize)])
+    header = _recv_exact(sock, _HEADER.size, data)
+    (length,) = _HEADER.unpack(header)
+    return json.loads(_recv_exact(sock, length)), list(fds)
+
+
+def _setwinsize(fd: int, rows: int, cols: int) -> None:
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+
+class HelperPtyProcess:
+    """A process in a pty, started by the spawn helper.
+
+    This provides the parts of :class:`ptyprocess.PtyProcess` which terminado
+    uses. The process is not a child of the server, so it is reaped by the
+    helper, and its exit status is not available.
+    """
+
+    # Like ptyprocess, the delay in seconds after a signal in terminate()
+    delayafterterminate = 0.1
+
+    def __init__(self, pid: int, fd: int, argv: list[str]) -> None:
+        """Initialize the process."""
+        self.pid = pid
+        self.fd = fd
+        self.argv = argv
+        self.flag_eof = False
+        self.exitstatus = None
+        self.signalstatus = None
+        self.closed = False
+        self.decoder: Any = None
+
+    def isalive(self) -> bool:
+        """Whether the process is still running."""
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def kill(self, sig: int) -> None:
+        """Send a signal to the process."""
+        if self.isalive():
+            os.kill(self.pid, sig)
+
+    def getwinsize(self) -> tuple[int, int]:
+        """The size of the pty, as (rows, cols)."""
+        data = fcntl.ioctl(self.fd, termios.TIOCGWINSZ, b"\0" * 8)
+        rows, cols = struct.unpack("HHHH", data)[:2]
+        return rows, cols
+
+    def setwinsize(self, rows: int, cols: int) -> None:
+        """Change the size of the pty."""
+        _setwinsize(self.fd, rows, cols)
+
+    def close(self, force: bool = True) -> None:
+        """Close the pty. This hangs up the process in it."""
+        if not self.closed:
+            os.close(self.fd)
+            self.closed = True
+
+
+class SpawnHelper:
+    """Client side of the spawn helper process.
+
+    :meth:`spawn` may be called from several threads. If the helper process
+    has died, it is started again.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the client, without starting the helper."""
+        self._lock = threading.Lock()
+        self._proc: subprocess.Popen[bytes] | None = None
+        self._sock: socket.socket | None = None
+
+    def start(self) -> None:
+        """Start the helper process."""
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        with theirs:
+            self._proc = subprocess.Popen(  # noqa: S603
+                # -I keeps this directory, and the environment, off sys.path
+                [sys.executable, "-I", __file__, str(theirs.fileno())],
+                pass_fds=(theirs.fileno(),),
+                stdin=subprocess.DEVNULL,
+                # Don't get signals meant for the server's terminal
+                start_new_session=True,
+            )
+        self._sock = ours
+
+    def spawn(
+        self,
+        argv: list[str],
+        env: dict[str, str] | None = None,
+        cwd: str | None = None,
+        dimensions: tuple[int, int] = DEFAULT_DIMENSIONS,
+    ) -> HelperPtyProcess:
+        """Start ``argv`` in a new pty, like :meth:`ptyprocess.PtyProcess.spawn`."""
+        request = {"argv": argv, "env": env, "cwd": cwd, "dimensions": dimensions}
+        with self._lock:
+            if self._proc is None or self._proc.poll() is not None:
+                self.close()
+                self.start()
+            assert self._sock is not None
+            _send_message(self._sock, request)
+            reply, fds = _recv_message(self._sock)
+        for fd in fds:
+            # Like other fds we open, don't leak it to later processes
+            os.set_inheritable(fd, False)
+        if "error" in reply:
+            for fd in fds:
+                os.close(fd)
+            raise OSError(reply["errno"], reply["error"])
+        return HelperPtyProcess(reply["pid"], fds[0], argv)
+
+    def close(self) -> None:
+        """Stop the helper process. Terminals it started keep running."""
+        if self._sock is not None:
+            # The helper exits when the connection closes
+            self._sock.close()
+            self._sock = None
+        if self._proc is not None:
+            try:
+                self._proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+            self._proc = None
+
+
+# The helper process itself
+
+
+def _reap_children(signum: int, frame: Any) -> None:
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def _spawn(request: dict[str, Any]) -> tuple[int, int]:
+    """Start a process in a new pty; return its pid and the pty's master fd."""
+    # exec() closes the write end, so reading it only returns data on failure
+    err_r, err_w = os.pipe()
+    pid, fd = os.forkpty()
+    if pid == 0:
+        try:
+            os.close(err_r)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+            # The pty is our stdin now
+            _setwinsize(0, *request["dimensions"])
+            if request["cwd"] is not None:
+                os.chdir(request["cwd"])
+            argv = request["argv"]
+            env = request["env"] if request["env"] is not None else os.environ
+            os.execvpe(argv[0], argv, env)  # noqa: S606
+        except Exception as e:  # noqa: BLE001
+            code = getattr(e, "errno", None) or errno.EIO
+            os.write(err_w, json.dumps([code, str(e)]).encode("utf-8"))
+        finally:
+            os._exit(1)
+    os.close(err_w)
+    with os.fdopen(err_r, "rb") as f:
+        error = f.read()
+    if error:
+        os.close(fd)
+        code, message = json.loads(error)
+        raise OSError(code, message)
+    return pid, fd
+
+
+def _serve(sock: socket.socket) -> None:
+    signal.signal(signal.SIGCHLD, _reap_children)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    while True:
+        try:
+            request, _ = _recv_message(sock)
+        except (EOFError, ConnectionError):
+            return
+        try:
+            pid, fd = _spawn(request)
+        except OSError as e:
+            _send_message(sock, {"error": str(e), "errno": e.errno or errno.EIO})
+            continue
+        try:
+            _send_message(sock, {"pid": pid}, (fd,))
+        finally:
+            # The server has its own copy now
+            os.close(fd)
+
+
+def main() -> None:
+    """Serve spawn requests on the socket whose fd is the first argument."""
+    sock = socket.socket(fileno=int(sys.argv[1]))
+    # Keep it from the processes we start
+    sock.set_inheritable(False)
+    with sock:
+        _serve(sock)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Tracing of the time from a keystroke to its echo, per terminal.
+
+A :class:`LatencyTrace` follows each input message through the stages it
+goes through on the server:
+
+- ``queue``: from its receipt on the websocket to its queueing for the pty.
+- ``write``: until it has all been written to the pty.
+- ``echo``: until the next output is read from the pty.
+- ``total``: from its receipt to that output.
+
+``rtt`` is the round trip time clients report with ``ping`` messages, which
+includes the network and the browser.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+from collections import deque
+
+STAGES = ("queue", "write", "echo", "total", "rtt")
+
+# The quantiles reported for each stage
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class LatencyTrace:
+    """Latency samples of the input to one terminal, in seconds.
+
+    The last ``samples`` of each stage are kept. Times passed in must all
+    come from the same clock, like :func:`time.perf_counter`.
+    """
+
+    def __init__(self, samples: int = 1000) -> None:
+        """Initialize the trace."""
+        self.samples: dict[str, deque[float]] = {stage: deque(maxlen=samples) for stage in STAGES}
+        # When the input message being handled was received
+        self._received: float | None = None
+        # Input not echoed yet: the input offset of its end, and when it was
+        # received, queued and written
+        self._pending: deque[list[float]] = deque()
+
+    def received(self, now: float) -> None:
+        """An input message was received; it is queued next."""
+        self._received = now
+
+    def queued(self, end: float, now: float) -> None:
+        """Input ending at offset ``end`` of the terminal's input was queued."""
+        received = now if self._received is None else self._received
+        self._received = None
+        self._pending.append([end, received, now, -1.0])
+
+    def written(self, total: float, now: float) -> None:
+        """The first ``total`` bytes of input have been written to the pty."""
+        for entry in self._pending:
+            if entry[0] > total:
+                break
+            if entry[3] < 0:
+                entry[3] = now
+
+    def output(self, now: float) -> None:
+        """Output was read from the pty: the input written so far was echoed."""
+        pending = self._pending
+        while pending and pending[0][3] >= 0:
+            _, received, queued, written = pending.popleft()
+            self.samples["queue"].append(queued - received)
+            self.samples["write"].append(written - queued)
+            self.samples["echo"].append(now - written)
+            self.samples["total"].append(now - received)
+
+    def round_trip(self, seconds: float) -> None:
+        """Record a round trip time measured by a client."""
+        self.samples["rtt"].append(seconds)
+
+    def percentiles(self) -> dict[str, dict[str, float]]:
+        """The count and quantiles of each stage with samples."""
+        report = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            stats = {"count": float(len(ordered))}
+            for q in QUANTILES:
+                stats[f"p{round(q * 100)}"] = ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+            report[stage] = stats
+        return report
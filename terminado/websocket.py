@@ -5,18 +5,107 @@
 # Distributed under the terms of the Simplified BSD License.
 from __future__ import annotations
 
+import functools
 import json
 import logging
+import math
 import os
+import time
 from typing import TYPE_CHECKING, Any
 
 import tornado.websocket
 from tornado import gen
-from tornado.concurrent import run_on_executor
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
 
 if TYPE_CHECKING:
+    from asyncio import Future
+
     from terminado.management import PtyWithClients, TermManagerBase
 
+# Websocket subprotocol for the binary framing of terminal data. Clients which
+# offer it exchange raw UTF-8 terminal bytes in binary frames, prefixed with a
+# one-byte opcode. Control messages are still sent as JSON text frames, and
+# clients which don't offer it get the plain JSON protocol.
+BINARY_SUBPROTOCOL = "terminado.binary"
+
+OPCODE_STDOUT = 0x01
+OPCODE_STDIN = 0x02
+
+# permessage-deflate settings used for the options a TermSocket isn't given.
+# Terminal output compresses well even at low levels, which cost far less CPU.
+# Small messages such as keystroke echoes are compressed too, as Tornado has
+# no public way to send some messages of a compressed connection as they are.
+DEFAULT_COMPRESSION_OPTIONS: dict[str, Any] = {
+    "compression_level": 1,
+    "mem_level": 8,
+}
+
+
+class OutputFrames:
+    """A chunk of terminal output, encoded lazily for each wire format.
+
+    One instance is shared by all the clients of a terminal, so each encoding
+    is done at most once per chunk however many websockets are attached.
+    """
+
+    __slots__ = ("_binary", "_json", "_text", "offset")
+
+    def __init__(self, text: str, offset: int | None = None) -> None:
+        """Initialize the frames.
+
+        ``offset`` is the position in the terminal's output just past this
+        chunk, if known.
+        """
+        self._text: str | None = text
+        self.offset = offset
+        self._json: bytes | None = None
+        self._binary: bytes | None = None
+
+    @classmethod
+    def encoded(cls, json_payload: bytes | None, binary: bytes, offset: int | None) -> OutputFrames:
+        """Frames encoded elsewhere; the text is only decoded if needed."""
+        frames = cls.__new__(cls)
+        frames._text = None
+        frames.offset = offset
+        frames._json = json_payload
+        frames._binary = binary
+        return frames
+
+    @classmethod
+    def from_utf8(cls, data: bytes | memoryview, offset: int | None = None) -> OutputFrames:
+        """Frames of UTF-8 output, which is only decoded if a client needs text.
+
+        Invalid sequences are sent to binary clients as they are, and replaced
+        in the text.
+        """
+        return cls.encoded(None, bytes((OPCODE_STDOUT,)) + data, offset)
+
+    @property
+    def text(self) -> str:
+        """The output, as text."""
+        if self._text is None:
+            assert self._binary is not None
+            self._text = self._binary[1:].decode("utf-8", errors="replace")
+        return self._text
+
+    @property
+    def json(self) -> bytes:
+        """The UTF-8 payload of the ``["stdout", text, offset]`` JSON message."""
+        if self._json is None:
+            content: list[Any] = ["stdout", self.text]
+            if self.offset is not None:
+                content.append(self.offset)
+            self._json = json.dumps(content).encode("utf-8")
+        return self._json
+
+    @property
+    def binary(self) -> bytes:
+        """The payload of the binary ``OPCODE_STDOUT`` frame."""
+        if self._binary is None:
+            self._binary = bytes((OPCODE_STDOUT,)) + self.text.encode("utf-8")
+        return self._binary
+
 
 def _cast_unicode(s: str | bytes) -> str:
     if isinstance(s, bytes):
@@ -27,12 +116,34 @@ def _cast_unicode(s: str | bytes) -> str:
 class TermSocket(tornado.websocket.WebSocketHandler):
     """Handler for a terminal websocket"""
 
-    def initialize(self, term_manager: TermManagerBase) -> None:
-        """Initialize the handler."""
+    def initialize(
+        self,
+        term_manager: TermManagerBase,
+        compression_options: dict[str, Any] | None = None,
+    ) -> None:
+        """Initialize the handler.
+
+        Messages are compressed with permessage-deflate for clients that
+        support it if ``compression_options`` is given, a dict with any of
+        the keys of :data:`DEFAULT_COMPRESSION_OPTIONS`, which are passed to
+        zlib through :meth:`get_compression_options`.
+        """
         self.term_manager = term_manager
+        self.compression_options: dict[str, Any] | None = None
+        if compression_options is not None:
+            unknown = set(compression_options) - set(DEFAULT_COMPRESSION_OPTIONS)
+            if unknown:
+                msg = f"Unknown compression options: {sorted(unknown)}"
+                raise ValueError(msg)
+            self.compression_options = {**DEFAULT_COMPRESSION_OPTIONS, **compression_options}
         self.term_name = ""
         self.size = (None, None)
         self.terminal: PtyWithClients | None = None
+        self.binary = False
+        # Bytes handed to Tornado but not yet written to the network
+        self.buffered_bytes = 0
+        self.congested = False
+        self._missed_output = False
         self._blocking_io_executor = term_manager.blocking_io_executor
 
         self._logger = logging.getLogger(__name__)
@@ -47,7 +158,19 @@ class TermSocket(tornado.websocket.WebSocketHandler):
         assert origin is not None
         return self.check_origin(origin)
 
-    def open(self, url_component: Any = None) -> None:  # type:ignore[override]
+    def get_compression_options(self) -> dict[str, Any] | None:
+        """Enable permessage-deflate if the handler was given compression options."""
+        if self.compression_options is None:
+            return None
+        return dict(self.compression_options)
+
+    def select_subprotocol(self, subprotocols: list[str]) -> str | None:
+        """Select the binary framing if the client offers it."""
+        if BINARY_SUBPROTOCOL in subprotocols:
+            return BINARY_SUBPROTOCOL
+        return None
+
+    async def open(self, url_component: Any = None) -> None:  # type:ignore[override]
         """Websocket connection opened.
 
         Call our terminal manager to get a terminal, and connect to it as a
@@ -59,58 +182,238 @@ class TermSocket(tornado.websocket.WebSocketHandler):
 
         self._logger.info("TermSocket.open: %s", url_component)
 
+        self.binary = self.selected_subprotocol == BINARY_SUBPROTOCOL
         url_component = _cast_unicode(url_component)
         self.term_name = url_component or "tty"
-        self.terminal = self.term_manager.get_terminal(url_component)
+        self.terminal = await self.term_manager.async_get_terminal(url_component)
+        if self.ws_connection is None:
+            # The connection was lost while the terminal was starting
+            self.term_manager.client_disconnected(self)
+            self.terminal = None
+            return
         self.terminal.clients.append(self)
+        if self.term_manager.metrics is not None:
+            self.term_manager.metrics.connections.inc()
         self.send_json_message(["setup", {}])
         self._logger.info("TermSocket.open: Opened %s", self.term_name)
-        # Now drain the preopen buffer, if reconnect.
-        buffered = ""
-        preopen_buffer = self.terminal.read_buffer.copy()
-        while True:
-            if not preopen_buffer:
-                break
-            s = preopen_buffer.popleft()
-            buffered += s
+        # Now send the output history or current screen, if reconnect.
+        # Clients which already have part of the output of this terminal pass
+        # the offset they reached and its session, and only get what follows
+        # if it is still available.
+        resume_from = self.get_query_argument("offset", None)
+        buffered = None
+        if resume_from is not None:
+            if not resume_from.isdigit():
+                self._logger.warning("Ignoring malformed offset %r", resume_from)
+            elif self.get_query_argument("session", None) == self.terminal.session_id:
+                buffered = self.terminal.output_since(int(resume_from))
+            if buffered is None:
+                self.send_json_message(["reset", {}])
+        if buffered is None:
+            buffered = self.terminal.replay()
+        self._send_replay(buffered, send_offset=self.binary or resume_from is not None)
+
+    def _send_replay(self, buffered: str, send_offset: bool) -> None:
+        assert self.terminal is not None
+        offset = self.terminal.read_buffer.end_offset
         if buffered:
-            self.on_pty_read(buffered)
+            frames = OutputFrames(buffered, offset)
+            if self.term_manager.metrics is not None:
+                self.term_manager.metrics.replay_bytes.observe(len(frames.binary) - 1)
+            self.on_pty_frames(frames)
+        if send_offset:
+            # Binary frames don't carry offsets: clients count bytes from here.
+            self.send_json_message(["offset", offset, self.terminal.session_id])
 
     def on_pty_read(self, text: str) -> None:
         """Data read from pty; send to frontend"""
-        self.send_json_message(["stdout", text])
+        self._write_frames(OutputFrames(text))
+
+    def on_pty_frames(self, frames: OutputFrames) -> None:
+        """Data read from pty, already encoded for all clients of the terminal.
+
+        Subclasses overriding :meth:`on_pty_read` keep receiving the text of
+        every chunk through it instead.
+        """
+        if type(self).on_pty_read is not TermSocket.on_pty_read:
+            self.on_pty_read(frames.text)
+        else:
+            self._write_frames(frames)
+
+    def on_output_suppressed(self, nbytes: int) -> None:
+        """Output was held back by the terminal's rate limit.
+
+        Depending on the limit's policy, tell the frontend how much was left
+        out, or send it a snapshot of the terminal instead.
+        """
+        terminal = self.terminal
+        if terminal is None or terminal.rate_limit is None:
+            return
+        if self.congested:
+            # It will be brought up to date once it has caught up
+            self._missed_output = True
+            return
+        if terminal.rate_limit.policy == "snapshot":
+            self.send_json_message(["reset", {}])
+            self._send_replay(terminal.snapshot(), send_offset=True)
+        else:
+            self.send_json_message(["suppressed", nbytes, terminal.read_buffer.end_offset])
+
+    def _write_frames(self, frames: OutputFrames) -> None:
+        if self.congested and self.terminal is not None and not self.terminal.reading_paused:
+            # The other clients keep up, so the pty is still read: apply the
+            # slow client policy instead of buffering without bound.
+            if self.term_manager.slow_client_policy == "close":
+                self._logger.warning("Closing websocket of %s: client too slow", self.term_name)
+                self.close()
+            else:
+                self._missed_output = True
+            return
+
+        if self.binary:
+            self._send(frames.binary, binary=True)
+        else:
+            # Tornado sends bytes as-is in a text frame when binary is False.
+            self._send(frames.json)
+
+        if self._enable_output_logging:
+            self.log_terminal_output(f"STDOUT: {frames.text}")
 
     def send_json_message(self, content: Any) -> None:
         """Send a json message on the socket."""
         json_msg = json.dumps(content)
-        self.write_message(json_msg)
+        self._send(json_msg)
 
         if self._enable_output_logging and content[0] == "stdout" and isinstance(content[1], str):
             self.log_terminal_output(f"STDOUT: {content[1]}")
 
+    def _send(self, message: str | bytes, binary: bool = False) -> None:
+        """Write a message, keeping track of how much is waiting to be sent."""
+        if isinstance(message, str):
+            # Count bytes, as they will go out; Tornado would encode it anyway.
+            message = message.encode("utf-8")
+        size = len(message)
+        # Subclasses overriding write_message may not return the future, as in
+        # jupyter_server_terminals: an empty write to the stream completes
+        # once everything before it has been sent.
+        future: Future[None] | None = self.write_message(message, binary=binary)
+        future = future or self._flushed()
+        if future is not None:
+            self.buffered_bytes += size
+            future.add_done_callback(functools.partial(self._on_sent, size))
+        metrics = self.term_manager.metrics
+        if metrics is not None:
+            metrics.sent_bytes.inc(size)
+            metrics.sent_messages.inc()
+        if not self.congested and self.buffered_bytes >= self.term_manager.client_buffer_limit:
+            self.congested = True
+            if self.terminal is not None:
+                self.term_manager.check_backpressure(self.terminal)
+
+    def _flushed(self) -> Future[None] | None:
+        connection = self.ws_connection
+        if connection is None or connection.is_closing() or connection.stream is None:
+            return None
+        try:
+            return connection.stream.write(b"")
+        except StreamClosedError:
+            return None
+
+    def _on_sent(self, size: int, future: Any) -> None:
+        if not future.cancelled():
+            # A closed connection is handled by on_close
+            future.exception()
+        self.buffered_bytes -= size
+        if not self.congested or self.buffered_bytes > self.term_manager.client_buffer_limit // 2:
+            return
+        self.congested = False
+        if self.terminal is None or self.ws_connection is None or self.ws_connection.is_closing():
+            return
+        if self._missed_output:
+            self._missed_output = False
+            if self.term_manager.slow_client_policy == "snapshot":
+                self.send_json_message(["reset", {}])
+                self._send_replay(self.terminal.replay(), send_offset=True)
+            else:
+                self._send_replay("", send_offset=True)
+        self.term_manager.check_backpressure(self.terminal)
+
     @gen.coroutine
-    def on_message(self, message: str) -> None:  # type:ignore[misc]
+    def on_message(self, message: str | bytes) -> None:  # type:ignore[misc]
         """Handle incoming websocket message
 
         We send JSON arrays, where the first element is a string indicating
         what kind of message this is. Data associated with the message follows.
+
+        Clients using the binary subprotocol send stdin as binary frames
+        instead: an ``OPCODE_STDIN`` byte followed by the UTF-8 input.
+
+        A ``["stdin", data, id]`` message is acknowledged with
+        ``["stdin_ack", id]`` once the input has been written to the pty, so
+        clients can pace large pastes.
+
+        ``["ping", id]`` is answered with ``["pong", id]`` right away. Clients
+        can add the round trip time of their previous ping, in ms, as a third
+        element, which is recorded if the terminal traces its latency. Times
+        which are not finite and non-negative numbers are ignored.
         """
         # logging.info("TermSocket.on_message: %s - (%s) %s", self.term_name, type(message), len(message) if isinstance(message, bytes) else message[:250])
+        assert self.terminal is not None
+        latency = self.terminal.latency
+        if isinstance(message, bytes):
+            if message[:1] == bytes((OPCODE_STDIN,)):
+                if latency is not None:
+                    latency.received(time.perf_counter())
+                yield self.handle_stdin(message[1:].decode("utf-8", errors="replace"))
+            else:
+                self._logger.warning("TermSocket.on_message: unknown binary opcode %r", message[:1])
+            return
         command = json.loads(message)
         msg_type = command[0]
-        assert self.terminal is not None
         if msg_type == "stdin":
-            yield self.stdin_to_ptyproc(command[1])
-            if self._enable_output_logging:
-                if command[1] == "\r":
-                    self.log_terminal_output(f"STDIN: {self._user_command}")
-                    self._user_command = ""
-                else:
-                    self._user_command += command[1]
+            if latency is not None:
+                latency.received(time.perf_counter())
+            yield self.handle_stdin(command[1], command[2] if len(command) > 2 else None)
+        elif msg_type == "ping":
+            self.send_json_message(["pong", command[1] if len(command) > 1 else None])
+            try:
+                rtt = float(command[2]) if len(command) > 2 else math.nan
+            except (TypeError, ValueError):
+                rtt = math.nan
+            if latency is not None and math.isfinite(rtt) and rtt >= 0:
+                latency.round_trip(rtt / 1000)
         elif msg_type == "set_size":
             self.size = command[1:3]
             self.terminal.resize_to_smallest()
 
+    @gen.coroutine
+    def handle_stdin(self, text: str, ack_id: Any = None) -> None:  # type:ignore[misc]
+        """Write input from the frontend to the pty, logging it if enabled.
+
+        Input larger than the manager's ``max_stdin_message_size`` is
+        rejected with a ``stdin_rejected`` message. If ``ack_id`` is given,
+        ``["stdin_ack", ack_id]`` is sent once the input has been written.
+        """
+        limit = self.term_manager.max_stdin_message_size
+        if limit is not None and len(text) > limit:
+            self._logger.warning("Rejecting stdin message of %d characters", len(text))
+            reply = {"max_size": limit} if ack_id is None else {"max_size": limit, "id": ack_id}
+            self.send_json_message(["stdin_rejected", reply])
+            return
+        future = self.stdin_to_ptyproc(text)
+        if future is not None:
+            if ack_id is not None:
+                future.add_done_callback(functools.partial(self._ack_stdin, ack_id))
+            if self.terminal is not None and self.term_manager.input_backlogged(self.terminal):
+                # Stop reading from this client until the pty catches up
+                yield future
+        if self._enable_output_logging:
+            if text == "\r":
+                self.log_terminal_output(f"STDIN: {self._user_command}")
+                self._user_command = ""
+            else:
+                self._user_command += text
+
     def on_close(self) -> None:
         """Handle websocket closing.
 
@@ -120,7 +423,9 @@ class TermSocket(tornado.websocket.WebSocketHandler):
         self._logger.info("Websocket closed")
         if self.terminal:
             self.terminal.clients.remove(self)
+            self.terminal.last_disconnect = IOLoop.current().time()
             self.terminal.resize_to_smallest()
+            self.term_manager.check_backpressure(self.terminal)
         self.term_manager.client_disconnected(self)
 
     def on_pty_died(self) -> None:
@@ -137,13 +442,17 @@ class TermSocket(tornado.websocket.WebSocketHandler):
         """
         self._logger.debug(log)
 
-    @run_on_executor(executor="_blocking_io_executor")
-    def stdin_to_ptyproc(self, text: str) -> None:
+    def _ack_stdin(self, ack_id: Any, future: Any) -> None:
+        if self.ws_connection is not None and not self.ws_connection.is_closing():
+            self.send_json_message(["stdin_ack", ack_id])
+
+    def stdin_to_ptyproc(self, text: str) -> Any:
         """Handles stdin messages sent on the websocket.
 
-        This is a blocking call that should NOT be performed inside the
-        server primary event loop thread. Messages must be handled
-        asynchronously to prevent blocking on the PTY buffer.
+        The input is queued on the terminal and written without blocking the
+        event loop, see :meth:`TermManagerBase.write_input`. Returns a future
+        which resolves once it is written.
         """
         if self.terminal is not None:
-            self.terminal.ptyproc.write(text)
+            return self.term_manager.write_input(self.terminal, text)
+        return None
@@ -0,0 +1,648 @@
+"""Worker processes running terminals for the server.
+
+With hundreds of busy terminals, reading their output, decoding it and
+encoding it for the websockets needs more than one core. A
+:class:`PtyWorkerPool` shards terminals across worker processes. Each worker
+spawns its terminals and reads them, and sends their output to the server
+already coalesced and encoded as websocket payloads, over a Unix socket. The
+server keeps the output history and passes the payloads on to the clients.
+The binary payload, which is the output as it is, is always sent; the JSON
+one only while a client of the terminal takes JSON.
+
+In the server, a :class:`RemotePty` stands in for the
+:class:`ptyprocess.PtyProcess` of each terminal.
+
+This only works on POSIX.
+"""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+from __future__ import annotations
+
+import codecs
+import contextlib
+import fcntl
+import itertools
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import termios
+import time
+from typing import Any, Callable
+
+from ptyprocess import PtyProcess  # type:ignore[import-untyped]
+from tornado.ioloop import IOLoop
+from tornado.iostream import IOStream, StreamClosedError
+
+from terminado.websocket import OutputFrames
+
+# Messages are a header (kind, terminal id, payload length) and a payload.
+_HEADER = struct.Struct("!BII")
+# Server to worker
+SPAWN = 1  # JSON: argv, env, cwd, dimensions
+WRITE = 2  # input bytes
+RESIZE = 3  # rows, cols
+SIGNAL = 4  # signal number; SIGNAL_GROUP signals the process group
+SIGNAL_GROUP = 5
+READ = 6  # 1 to read the pty, 0 to pause
+CLOSE = 7
+ENCODE_JSON = 8  # 1 to send JSON payloads of the output too, 0 not to
+# Worker to server
+SPAWNED = 16  # JSON: pid, or error
+OUTPUT = 17  # offset, JSON payload length (0 if none), JSON payload, binary payload
+WRITTEN = 18  # total input bytes written so far
+EOF = 19
+EXIT = 20  # JSON: exitstatus, signalstatus
+
+_OUTPUT = struct.Struct("!QI")
+_SIZE = struct.Struct("!HH")
+_INT = struct.Struct("!i")
+_COUNT = struct.Struct("!Q")
+
+OPCODE_STDOUT = b"\x01"  # As in terminado.websocket
+
+# The size ptyprocess gives new ptys
+DEFAULT_DIMENSIONS = (24, 80)
+
+# Messages a worker holds for the server before it stops reading its ptys
+OUTBOX_LIMIT = 4 << 20
+
+
+def _message(kind: int, term_id: int, payload: bytes = b"") -> bytes:
+    return _HEADER.pack(kind, term_id, len(payload)) + payload
+
+
+def _parse_messages(buf: bytearray) -> list[tuple[int, int, bytes]]:
+    """Remove the complete messages at the start of ``buf`` and return them."""
+    messages = []
+    pos = 0
+    while len(buf) - pos >= _HEADER.size:
+        kind, term_id, length = _HEADER.unpack_from(buf, pos)
+        end = pos + _HEADER.size + length
+        if len(buf) < end:
+            break
+        messages.append((kind, term_id, bytes(buf[pos + _HEADER.size : end])))
+        pos = end
+    del buf[:pos]
+    return messages
+
+
+class RemotePty:
+    """A process in a pty run by a worker process.
+
+    This provides the parts of :class:`ptyprocess.PtyProcess` which terminado
+    uses. Its ``fd`` is a negative number identifying the terminal, not a
+    file descriptor. ``pid`` is None until the worker has started the
+    process.
+    """
+
+    # Like ptyprocess, the delay in seconds after a signal in terminate()
+    delayafterterminate = 0.1
+
+    def __init__(
+        self, worker: _WorkerConnection, term_id: int, argv: list[str], dimensions: tuple[int, int]
+    ) -> None:
+        """Initialize the pty."""
+        self.worker = worker
+        self.id = term_id
+        self.fd = -term_id
+        self.argv = argv
+        self.pid: int | None = None
+        self.exitstatus: int | None = None
+        self.signalstatus: int | None = None
+        self.flag_eof = False
+        self.closed = False
+        self.decoder: Any = None
+        # Whether the worker has been asked to read the pty, and to encode
+        # its output as JSON
+        self.reading = False
+        self.encode_json = False
+        # Bytes of input sent to the worker so far
+        self.bytes_sent = 0
+        self._alive = True
+        self._size = dimensions
+
+    def isalive(self) -> bool:
+        """Whether the process is still running, as far as we know."""
+        return self._alive
+
+    def kill(self, sig: int) -> None:
+        """Send a signal to the process."""
+        if self._alive:
+            self.worker.send(SIGNAL, self.id, _INT.pack(sig))
+
+    def killpg(self, sig: int) -> None:
+        """Send a signal to the process group of the process."""
+        if self._alive:
+            self.worker.send(SIGNAL_GROUP, self.id, _INT.pack(sig))
+
+    def getwinsize(self) -> tuple[int, int]:
+        """The size of the pty, as (rows, cols)."""
+        return self._size
+
+    def setwinsize(self, rows: int, cols: int) -> None:
+        """Change the size of the pty."""
+        self._size = (rows, cols)
+        self.worker.send(RESIZE, self.id, _SIZE.pack(rows, cols))
+
+    def set_reading(self, reading: bool) -> None:
+        """Ask the worker to start or stop reading the pty."""
+        if reading != self.reading:
+            self.reading = reading
+            self.worker.send(READ, self.id, bytes((reading,)))
+
+    def set_encode_json(self, encode_json: bool) -> None:
+        """Ask the worker to send JSON payloads of the output, or to stop."""
+        if encode_json != self.encode_json:
+            self.encode_json = encode_json
+            self.worker.send(ENCODE_JSON, self.id, bytes((encode_json,)))
+
+    def write(self, data: bytes) -> int:
+        """Send input; return the total number of bytes sent so far."""
+        self.worker.send(WRITE, self.id, data)
+        self.bytes_sent += len(data)
+        return self.bytes_sent
+
+    def close(self, force: bool = True) -> None:
+        """Close the pty. This hangs up the process in it."""
+        if not self.closed:
+            self.closed = True
+            self.worker.send(CLOSE, self.id)
+
+
+class _WorkerConnection:
+    """The server's end of the connection to one worker."""
+
+    def __init__(self, proc: subprocess.Popen[bytes], stream: IOStream) -> None:
+        self.proc = proc
+        self.stream = stream
+        self.ptys: dict[int, RemotePty] = {}
+
+    def send(self, kind: int, term_id: int, payload: bytes = b"") -> None:
+        if not self.stream.closed():
+            self.stream.write(_message(kind, term_id, payload))
+
+
+class PtyWorkerPool:
+    """Worker processes running terminals, from the server's side.
+
+    The callbacks are called on the event loop: ``on_output(pty, frames)``
+    with the :class:`~terminado.websocket.OutputFrames` of each chunk of
+    output, ``on_written(pty, total)`` as input is written, and
+    ``on_eof(pty)`` when the pty has closed. The workers are started with the
+    first terminal.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        on_output: Callable[[RemotePty, OutputFrames], None],
+        on_written: Callable[[RemotePty, int], None],
+        on_eof: Callable[[RemotePty], None],
+        coalesce_delay: float = 0.005,
+        coalesce_max_size: int = 65536,
+        stdin_chunk_size: int = 16384,
+    ) -> None:
+        """Initialize the pool, without starting the workers.
+
+        The workers coalesce output and write input like
+        :class:`~terminado.management.TermManagerBase` with the same options.
+        """
+        self.size = workers
+        self.on_output = on_output
+        self.on_written = on_written
+        self.on_eof = on_eof
+        self.config = {
+            "coalesce_delay": coalesce_delay,
+            "coalesce_max_size": coalesce_max_size,
+            "stdin_chunk_size": stdin_chunk_size,
+        }
+        self.workers: list[_WorkerConnection] = []
+        self.log = logging.getLogger(__name__)
+        self._ids = itertools.count(1)
+        self._stopping = False
+
+    def start(self) -> None:
+        """Start the worker processes."""
+        for _ in range(self.size):
+            ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            with theirs:
+                proc = subprocess.Popen(  # noqa: S603
+                    [
+                        sys.executable,
+                        "-c",
+                        "from terminado.workers import main; main()",
+                        str(theirs.fileno()),
+                        json.dumps(self.config),
+                    ],
+                    pass_fds=(theirs.fileno(),),
+                    stdin=subprocess.DEVNULL,
+                    # Don't get signals meant for the server's terminal
+                    start_new_session=True,
+                )
+            worker = _WorkerConnection(proc, IOStream(ours))
+            self.workers.append(worker)
+            IOLoop.current().add_callback(self._read_messages, worker)
+
+    def spawn(
+        self,
+        argv: list[str],
+        env: dict[str, str] | None = None,
+        cwd: str | None = None,
+        dimensions: tuple[int, int] = DEFAULT_DIMENSIONS,
+    ) -> RemotePty:
+        """Start ``argv`` in a new pty, on the worker with the fewest terminals.
+
+        This doesn't wait for the worker. If the process can't be started,
+        the pty reaches EOF straight away.
+        """
+        if not self.workers:
+            self.start()
+        worker = min(self.workers, key=lambda w: len(w.ptys))
+        pty = RemotePty(worker, next(self._ids), argv, dimensions)
+        worker.ptys[pty.id] = pty
+        request = {"argv": argv, "env": env, "cwd": cwd, "dimensions": dimensions}
+        worker.send(SPAWN, pty.id, json.dumps(request).encode("utf-8"))
+        return pty
+
+    async def _read_messages(self, worker: _WorkerConnection) -> None:
+        buf = bytearray()
+        try:
+            while True:
+                buf += await worker.stream.read_bytes(1 << 20, partial=True)
+                for kind, term_id, payload in _parse_messages(buf):
+                    pty = worker.ptys.get(term_id)
+                    if pty is None:
+                        continue
+                    try:
+                        self._dispatch(pty, kind, payload)
+                    except Exception:
+                        self.log.exception("Error handling terminal worker message")
+                    if not pty._alive and pty.flag_eof:
+                        del worker.ptys[term_id]
+        except StreamClosedError:
+            if not self._stopping:
+                self.log.warning("Terminal worker %s has exited", worker.proc.pid)
+        # Whatever the worker was running is gone
+        for pty in list(worker.ptys.values()):
+            pty._alive = False
+            if not pty.flag_eof:
+                pty.flag_eof = True
+                self.on_eof(pty)
+        worker.ptys.clear()
+
+    def _dispatch(self, pty: RemotePty, kind: int, payload: bytes) -> None:
+        if kind == OUTPUT:
+            offset, json_size = _OUTPUT.unpack_from(payload)
+            start = _OUTPUT.size
+            json_payload = payload[start : start + json_size] if json_size else None
+            frames = OutputFrames.encoded(json_payload, payload[start + json_size :], offset)
+            self.on_output(pty, frames)
+        elif kind == WRITTEN:
+            self.on_written(pty, _COUNT.unpack(payload)[0])
+        elif kind == SPAWNED:
+            info = json.loads(payload)
+            if "error" in info:
+                self.log.warning("Failed to start %s: %s", pty.argv, info["error"])
+            else:
+                pty.pid = info["pid"]
+        elif kind == EXIT:
+            info = json.loads(payload)
+            pty.exitstatus = info["exitstatus"]
+            pty.signalstatus = info["signalstatus"]
+            pty._alive = False
+        elif kind == EOF:
+            pty.flag_eof = True
+            self.on_eof(pty)
+
+    def stop(self) -> None:
+        """Stop the worker processes. Terminals they run are hung up."""
+        self._stopping = True
+        for worker in self.workers:
+            worker.stream.close()
+        for worker in self.workers:
+            try:
+                worker.proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                worker.proc.kill()
+                worker.proc.wait()
+        self.workers = []
+
+
+# The worker process itself
+
+
+class _Pty:
+    """A terminal run by the worker."""
+
+    def __init__(self, term_id: int, pid: int, fd: int) -> None:
+        self.id = term_id
+        self.pid = pid
+        self.fd = fd
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # Bytes of output sent so far, as counted by the scrollback buffer
+        self.offset = 0
+        self.pending: list[str] = []
+        self.pending_size = 0
+        self.flush_due: float | None = None
+        self.last_flush = 0.0
+        self.reading = False
+        self.encode_json = False
+        self.input = bytearray()
+        self.written = 0
+
+
+class _Worker:
+    def __init__(
+        self,
+        sock: socket.socket,
+        coalesce_delay: float,
+        coalesce_max_size: int,
+        stdin_chunk_size: int,
+    ) -> None:
+        self.sock = sock
+        sock.setblocking(False)
+        self.coalesce_delay = coalesce_delay
+        self.coalesce_max_size = coalesce_max_size
+        self.stdin_chunk_size = stdin_chunk_size
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+        # SIGCHLD wakes up the selector, to reap the processes
+        self.wakeup_r, wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        wakeup_w.setblocking(False)
+        self._wakeup_w = wakeup_w
+        signal.set_wakeup_fd(wakeup_w.fileno())
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+        self.ptys: dict[int, _Pty] = {}
+        # Terminal ids of the processes not reaped yet
+        self.children: dict[int, int] = {}
+        self.inbox = bytearray()
+        # Messages not yet taken by the server. While there are more than
+        # OUTBOX_LIMIT bytes, the ptys are not read.
+        self.outbox = bytearray()
+        self.outbox_full = False
+
+    def run(self) -> None:
+        while True:
+            for key, mask in self.selector.select(self._next_timeout()):
+                if key.fileobj is self.sock:
+                    if mask & selectors.EVENT_READ:
+                        try:
+                            data = self.sock.recv(1 << 20)
+                        except BlockingIOError:
+                            data = None
+                        except ConnectionError:
+                            return
+                        if data is not None:
+                            if not data:
+                                return
+                            self.inbox += data
+                            for message in _parse_messages(self.inbox):
+                                self._handle(*message)
+                elif key.fileobj is self.wakeup_r:
+                    with contextlib.suppress(BlockingIOError):
+                        while self.wakeup_r.recv(4096):
+                            pass
+                    self._reap()
+                else:
+                    pty = key.data
+                    if mask & selectors.EVENT_WRITE:
+                        self._write_input(pty)
+                    if mask & selectors.EVENT_READ and pty.id in self.ptys:
+                        self._read(pty)
+            self._flush_due()
+            if not self._send_outbox():
+                return
+
+    def _next_timeout(self) -> float | None:
+        dues = [pty.flush_due for pty in self.ptys.values() if pty.flush_due is not None]
+        if dues:
+            return max(0.0, min(dues) - time.monotonic())
+        return None
+
+    def _send(self, kind: int, term_id: int, payload: bytes = b"") -> None:
+        self.outbox += _message(kind, term_id, payload)
+
+    def _send_outbox(self) -> bool:
+        """Send what the socket takes without blocking; False if it is closed."""
+        if self.outbox:
+            try:
+                sent = self.sock.send(self.outbox)
+            except BlockingIOError:
+                sent = 0
+            except ConnectionError:
+                return False
+            del self.outbox[:sent]
+        events = selectors.EVENT_READ
+        if self.outbox:
+            events |= selectors.EVENT_WRITE
+        if events != self.selector.get_key(self.sock).events:
+            self.selector.modify(self.sock, events)
+        outbox_full = len(self.outbox) > OUTBOX_LIMIT
+        if outbox_full != self.outbox_full:
+            self.outbox_full = outbox_full
+            for pty in self.ptys.values():
+                self._update_events(pty)
+        return True
+
+    def _handle(self, kind: int, term_id: int, payload: bytes) -> None:
+        if kind == SPAWN:
+            self._spawn(term_id, json.loads(payload))
+            return
+        pty = self.ptys.get(term_id)
+        if pty is None:
+            return
+        if kind == WRITE:
+            pty.input += payload
+            self._write_input(pty)
+        elif kind == RESIZE:
+            _setwinsize(pty.fd, *_SIZE.unpack(payload))
+        elif kind in (SIGNAL, SIGNAL_GROUP):
+            (sig,) = _INT.unpack(payload)
+            with contextlib.suppress(ProcessLookupError):
+                if kind == SIGNAL:
+                    os.kill(pty.pid, sig)
+                else:
+                    os.killpg(os.getpgid(pty.pid), sig)
+        elif kind == READ:
+            pty.reading = bool(payload[0])
+            self._update_events(pty)
+        elif kind == ENCODE_JSON:
+            pty.encode_json = bool(payload[0])
+        elif kind == CLOSE:
+            self._close(pty)
+
+    def _spawn(self, term_id: int, request: dict[str, Any]) -> None:
+        try:
+            proc = PtyProcess.spawn(
+                request["argv"],
+                env=request["env"],
+                cwd=request["cwd"],
+                dimensions=tuple(request["dimensions"]),
+                preexec_fn=_preexec_fn,
+            )
+        except Exception as e:  # noqa: BLE001
+            self._send(SPAWNED, term_id, json.dumps({"error": str(e)}).encode("utf-8"))
+            self._send(EXIT, term_id, b'{"exitstatus": null, "signalstatus": null}')
+            self._send(EOF, term_id)
+            return
+        # We only need the pid and fd. Keep ptyprocess from closing the fd or
+        # reaping the process itself.
+        fd = os.dup(proc.fd)
+        proc.fileobj.close()
+        proc.closed = True
+        os.set_blocking(fd, False)
+        pty = _Pty(term_id, proc.pid, fd)
+        self.ptys[term_id] = pty
+        self.children[pty.pid] = term_id
+        self._send(SPAWNED, term_id, json.dumps({"pid": pty.pid}).encode("utf-8"))
+        # It may have exited before we knew its pid
+        self._reap()
+
+    def _update_events(self, pty: _Pty) -> None:
+        events = 0
+        if pty.reading and not self.outbox_full:
+            events |= selectors.EVENT_READ
+        if pty.input:
+            events |= selectors.EVENT_WRITE
+        try:
+            key = self.selector.get_key(pty.fd)
+        except KeyError:
+            if events:
+                self.selector.register(pty.fd, events, pty)
+            return
+        if not events:
+            self.selector.unregister(pty.fd)
+        elif events != key.events:
+            self.selector.modify(pty.fd, events, pty)
+
+    def _read(self, pty: _Pty) -> None:
+        try:
+            data = os.read(pty.fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            # EIO once the process has exited, on Linux
+            data = b""
+        if not data:
+            pty.pending.append(pty.decoder.decode(b"", final=True))
+            self._flush(pty)
+            self._close(pty)
+            return
+        text = pty.decoder.decode(data)
+        if not text:
+            return
+        pty.pending.append(text)
+        pty.pending_size += len(text)
+        now = time.monotonic()
+        if (
+            not self.coalesce_delay
+            or pty.pending_size >= self.coalesce_max_size
+            or now >= pty.last_flush + self.coalesce_delay
+        ):
+            # Sparse output, e.g. echo of a keystroke, is sent right away.
+            self._flush(pty)
+        elif pty.flush_due is None:
+            pty.flush_due = pty.last_flush + self.coalesce_delay
+
+    def _flush_due(self) -> None:
+        now = time.monotonic()
+        for pty in self.ptys.values():
+            if pty.flush_due is not None and now >= pty.flush_due:
+                self._flush(pty)
+
+    def _flush(self, pty: _Pty) -> None:
+        pty.flush_due = None
+        text = "".join(pty.pending)
+        pty.pending = []
+        pty.pending_size = 0
+        if not text:
+            return
+        pty.last_flush = time.monotonic()
+        data = text.encode("utf-8")
+        pty.offset += len(data)
+        # The same payloads as terminado.websocket.OutputFrames
+        json_payload = b""
+        if pty.encode_json:
+            json_payload = json.dumps(["stdout", text, pty.offset]).encode("utf-8")
+        header = _OUTPUT.pack(pty.offset, len(json_payload))
+        self._send(OUTPUT, pty.id, b"".join([header, json_payload, OPCODE_STDOUT, data]))
+
+    def _write_input(self, pty: _Pty) -> None:
+        if pty.input:
+            try:
+                n = os.write(pty.fd, pty.input[: self.stdin_chunk_size])
+            except BlockingIOError:
+                n = 0
+            except OSError:
+                # The pty is closing; the EOF will be handled by _read.
+                n = len(pty.input)
+            if n:
+                del pty.input[:n]
+                pty.written += n
+                self._send(WRITTEN, pty.id, _COUNT.pack(pty.written))
+        self._update_events(pty)
+
+    def _close(self, pty: _Pty) -> None:
+        del self.ptys[pty.id]
+        if pty.input:
+            # Input which can no longer be written counts as done
+            pty.written += len(pty.input)
+            pty.input.clear()
+            self._send(WRITTEN, pty.id, _COUNT.pack(pty.written))
+        with contextlib.suppress(KeyError):
+            self.selector.unregister(pty.fd)
+        # This hangs up the process, if it is still running.
+        os.close(pty.fd)
+        self._send(EOF, pty.id)
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            term_id = self.children.pop(pid, None)
+            if term_id is None:
+                # A process which failed to start
+                continue
+            info = {
+                "exitstatus": os.WEXITSTATUS(status) if os.WIFEXITED(status) else None,
+                "signalstatus": os.WTERMSIG(status) if os.WIFSIGNALED(status) else None,
+            }
+            self._send(EXIT, term_id, json.dumps(info).encode("utf-8"))
+
+
+def _preexec_fn() -> None:
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+
+
+def _setwinsize(fd: int, rows: int, cols: int) -> None:
+    fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+
+def main() -> None:
+    """Run terminals for the server, over the socket whose fd is the first argument."""
+    sock = socket.socket(fileno=int(sys.argv[1]))
+    # Keep it from the processes we start
+    sock.set_inheritable(False)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    config = json.loads(sys.argv[2])
+    with sock:
+        # Returns when the server closes the connection; the ptys are closed
+        # as the process exits.
+        _Worker(sock, **config).run()
+
+
+if __name__ == "__main__":
+    main()
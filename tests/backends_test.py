@@ -0,0 +1,103 @@
+"""Tests for the pty backends."""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+import os
+import select
+import signal
+import time
+
+import pytest
+
+if os.name == "nt":
+    pytest.skip("The fake pty backend needs POSIX", allow_module_level=True)
+
+from terminado.backends import FakePtyBackend, PtyProcessBackend
+
+
+@pytest.fixture
+def backends():
+    created = []
+
+    def make(**kwargs):
+        backend = FakePtyBackend(**kwargs)
+        created.append(backend)
+        return backend
+
+    yield make
+    for backend in created:
+        backend.close()
+
+
+def read_all(fd):
+    output = b""
+    while True:
+        data = os.read(fd, 1024)
+        if not data:
+            break
+        output += data
+    return output
+
+
+def test_scripted_output(backends):
+    backend = backends(output=b"0123456789", chunk_size=3, repeat=3, exit_when_done=True)
+    proc = backend.spawn(["fake"])
+    try:
+        assert read_all(proc.fd) == b"0123456789" * 3
+        assert not proc.isalive()
+        assert proc.exitstatus == 0
+    finally:
+        proc.close()
+
+
+def test_rate(backends):
+    backend = backends(output=b"x" * 1000, rate=5000, chunk_size=100, exit_when_done=True)
+    proc = backend.spawn(["fake"])
+    try:
+        start = time.monotonic()
+        assert read_all(proc.fd) == b"x" * 1000
+        # The first chunk is written right away
+        assert time.monotonic() - start >= 0.17
+    finally:
+        proc.close()
+
+
+def test_echo_and_signals(backends):
+    proc = backends().spawn(["fake"], dimensions=(30, 100))
+    try:
+        assert proc.getwinsize() == (30, 100)
+        proc.setwinsize(40, 120)
+        assert proc.getwinsize() == (40, 120)
+        os.write(proc.fd, b"hello")
+        assert os.read(proc.fd, 1024) == b"hello"
+        proc.kill(signal.SIGCONT)
+        assert proc.isalive()
+        proc.kill(signal.SIGHUP)
+        assert not proc.isalive()
+        assert proc.signalstatus == signal.SIGHUP
+        # Input after the end is dropped
+        os.write(proc.fd, b"more")
+        assert read_all(proc.fd) == b""
+    finally:
+        proc.close()
+
+
+def test_invalid_options():
+    with pytest.raises(ValueError, match="chunk_size"):
+        FakePtyBackend(chunk_size=0)
+    with pytest.raises(ValueError, match="rate"):
+        FakePtyBackend(rate=0)
+    with pytest.raises(ValueError, match="repeat"):
+        FakePtyBackend(repeat=0)
+
+
+def test_ptyprocess_backend():
+    proc = PtyProcessBackend().spawn(["sh", "-c", "echo hello; sleep 10"], dict(os.environ), None)
+    output = b""
+    deadline = time.monotonic() + 5
+    while b"hello" not in output and time.monotonic() < deadline:
+        if select.select([proc.fd], [], [], 0.1)[0]:
+            output += os.read(proc.fd, 1024)
+    assert b"hello" in output
+    proc.close(force=True)
+    assert not proc.isalive()
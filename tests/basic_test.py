@@ -10,6 +10,7 @@ import datetime
 import json
 import os
 import re
+import signal
 
 # We must set the policy for python >=3.8, see https://www.tornadoweb.org/en/stable/#installation
 # Snippet from https://github.com/tornadoweb/tornado/issues/2608#issuecomment-619524992
@@ -21,9 +22,13 @@ import pytest
 import tornado
 import tornado.httpserver
 import tornado.testing
+import tornado.web
 from tornado.ioloop import IOLoop
 
 from terminado import NamedTermManager, SingleTermManager, TermSocket, UniqueTermManager
+from terminado.backends import FakePtyBackend
+from terminado.metrics import MetricsHandler, TermMetrics
+from terminado.websocket import BINARY_SUBPROTOCOL, OPCODE_STDIN, OPCODE_STDOUT, OutputFrames
 
 if sys.version_info >= (3, 8) and sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -56,7 +61,10 @@ class TestTermClient:
 
         response = await self.pending_read
         self.pending_read = None
-        if response:
+        if isinstance(response, bytes):
+            assert response[0] == OPCODE_STDOUT
+            response = ["stdout", response[1:].decode("utf-8")]
+        elif response:
             response = json.loads(response)
         return response
 
@@ -104,7 +112,10 @@ class TestTermClient:
 
     async def write_stdin(self, data):
         """Write to terminal stdin"""
-        await self.write_msg(["stdin", data])
+        if self.ws.selected_subprotocol == BINARY_SUBPROTOCOL:
+            await self.ws.write_message(bytes((OPCODE_STDIN,)) + data.encode("utf-8"), binary=True)
+        else:
+            await self.write_msg(["stdin", data])
 
     async def get_pid(self):
         """Get process ID of terminal shell process"""
@@ -128,18 +139,61 @@ class TestTermClient:
         self.ws.close()
 
 
+class PtyClient:
+    """A client of a terminal recording what it is sent, without a websocket"""
+
+    def __init__(self):
+        self.texts = []
+        self.suppressed = []
+        self.congested = False
+        self.died = False
+
+    @property
+    def text(self):
+        return "".join(self.texts)
+
+    def on_pty_read(self, text):
+        self.texts.append(text)
+
+    def on_output_suppressed(self, nbytes):
+        self.suppressed.append(nbytes)
+
+    def on_pty_died(self):
+        self.died = True
+
+
+class FramesClient(PtyClient):
+    """A client taking encoded output, like TermSocket"""
+
+    def __init__(self):
+        super().__init__()
+        self.frames = []
+
+    def on_pty_frames(self, frames):
+        self.frames.append(frames)
+
+
 class TermTestCase(tornado.testing.AsyncHTTPTestCase):
+    def setUp(self):
+        super().setUp()
+        # Closed by tearDown if a test leaves them open
+        self.term_clients = []
+
     # Factory for TestTermClient, because it has to be async
     # See:  https://github.com/tornadoweb/tornado/issues/1161
-    async def get_term_client(self, path):
+    async def get_term_client(self, path, subprotocols=None, compression_options=None):
         port = self.get_http_port()
         url = "ws://127.0.0.1:%d%s" % (port, path)
         request = tornado.httpclient.HTTPRequest(
             url, headers={"Origin": "http://127.0.0.1:%d" % port}
         )
 
-        ws = await tornado.websocket.websocket_connect(request)
-        return TestTermClient(ws)
+        ws = await tornado.websocket.websocket_connect(
+            request, subprotocols=subprotocols, compression_options=compression_options
+        )
+        client = TestTermClient(ws)
+        self.term_clients.append(client)
+        return client
 
     async def get_term_clients(self, paths):
         return await asyncio.gather(*(self.get_term_client(path) for path in paths))
@@ -153,10 +207,13 @@ class TermTestCase(tornado.testing.AsyncHTTPTestCase):
         return pids
 
     def tearDown(self):
+        for client in self.term_clients:
+            client.close()
         run = IOLoop.current().run_sync
         run(self.named_tm.kill_all)
         run(self.single_tm.kill_all)
         run(self.unique_tm.kill_all)
+        run(self.small_buffer_tm.kill_all)
         super().tearDown()
 
     def get_app(self):
@@ -167,13 +224,28 @@ class TermTestCase(tornado.testing.AsyncHTTPTestCase):
 
         self.single_tm = SingleTermManager(shell_command=["bash"])
 
+        self.metrics = TermMetrics()
         self.unique_tm = UniqueTermManager(
             shell_command=["bash"],
             max_terminals=MAX_TERMS,
+            metrics=self.metrics,
+            trace_latency=True,
+        )
+
+        self.small_buffer_tm = UniqueTermManager(
+            shell_command=["bash"],
+            client_buffer_limit=1024,
+            max_stdin_message_size=4096,
         )
 
         named_tm = self.named_tm
 
+        class NoFutureTermSocket(TermSocket):
+            """Like jupyter_server_terminals, whose write_message returns None."""
+
+            def write_message(self, message, binary=False):
+                super().write_message(message, binary=binary)
+
         class NewTerminalHandler(tornado.web.RequestHandler):
             """Create a new named terminal, return redirect"""
 
@@ -187,6 +259,19 @@ class TermTestCase(tornado.testing.AsyncHTTPTestCase):
                 (r"/named/(\w+)", TermSocket, {"term_manager": self.named_tm}),
                 (r"/single", TermSocket, {"term_manager": self.single_tm}),
                 (r"/unique", TermSocket, {"term_manager": self.unique_tm}),
+                (r"/small_buffer", TermSocket, {"term_manager": self.small_buffer_tm}),
+                (r"/no_future", NoFutureTermSocket, {"term_manager": self.unique_tm}),
+                (
+                    r"/small_buffer_no_future",
+                    NoFutureTermSocket,
+                    {"term_manager": self.small_buffer_tm},
+                ),
+                (
+                    r"/compressed",
+                    TermSocket,
+                    {"term_manager": self.unique_tm, "compression_options": {}},
+                ),
+                (r"/metrics", MetricsHandler, {"metrics": self.metrics}),
             ],
             debug=True,
         )
@@ -222,6 +307,20 @@ class CommonTests(TermTestCase):
             assert other == []
             tm.close()
 
+    @tornado.testing.gen_test
+    async def test_binary_protocol(self):
+        for url in self.test_urls:
+            tm = await self.get_term_client(url, subprotocols=[BINARY_SUBPROTOCOL])
+            self.assertEqual(tm.ws.selected_subprotocol, BINARY_SUBPROTOCOL)
+            response = await tm.read_msg()
+            self.assertEqual(response, ["setup", {}])
+            await tm.read_all_msg()
+            await tm.write_stdin("echo h\u00e9llo\r")
+            (stdout, other) = await tm.read_stdout()
+            assert "h\u00e9llo" in stdout
+            assert other == []
+            tm.close()
+
 
 class NamedTermTests(TermTestCase):
     def test_new(self):
@@ -233,6 +332,137 @@ class NamedTermTests(TermTestCase):
         name = url.split("/")[2]
         self.assertIn(name, self.named_tm.terminals)
 
+    def test_broadcast_encodes_once(self):
+        _, terminal = self.named_tm.new_named_terminal()
+        frame_clients = [FramesClient(), FramesClient()]
+        text_client = PtyClient()
+        terminal.clients.extend([*frame_clients, text_client])
+        terminal.broadcast_frames(OutputFrames("hello"))
+        assert frame_clients[0].frames[0] is frame_clients[1].frames[0]
+        assert json.loads(frame_clients[0].frames[0].json) == ["stdout", "hello"]
+        assert text_client.texts == ["hello"]
+
+    @tornado.testing.gen_test
+    async def test_output_coalescing(self):
+        terminal = self.named_tm.new_terminal()
+        client = PtyClient()
+        terminal.clients.append(client)
+        self.named_tm.on_pty_output(terminal, "a")
+        # Sparse output is sent straight away
+        assert client.texts == ["a"]
+        self.named_tm.on_pty_output(terminal, "b")
+        self.named_tm.on_pty_output(terminal, "c")
+        assert client.texts == ["a"]
+        await asyncio.sleep(self.named_tm.coalesce_delay * 4)
+        assert client.texts == ["a", "bc"]
+        assert terminal.read_buffer.text() == "abc"
+        await terminal.terminate(force=True)
+        terminal.ptyproc.close()
+
+    @tornado.testing.gen_test
+    async def test_split_utf8_output(self):
+        terminal = self.named_tm.new_terminal()
+        client = FramesClient()
+        terminal.clients.append(client)
+        data = "é€".encode()
+        self.named_tm.on_pty_bytes(terminal, data[:1])
+        await asyncio.sleep(self.named_tm.coalesce_delay * 4)
+        # Nothing can be sent until the character is complete
+        assert client.frames == []
+        self.named_tm.on_pty_bytes(terminal, data[1:4])
+        await asyncio.sleep(self.named_tm.coalesce_delay * 4)
+        self.named_tm.on_pty_bytes(terminal, data[4:])
+        await asyncio.sleep(self.named_tm.coalesce_delay * 4)
+        assert [frames.binary[1:] for frames in client.frames] == [data[:2], data[2:]]
+        # Binary clients don't need the text, so it is never decoded
+        assert all(frames._text is None for frames in client.frames)
+        assert [frames.text for frames in client.frames] == ["é", "€"]
+        assert client.frames[-1].offset == terminal.read_buffer.end_offset == len(data)
+        await terminal.terminate(force=True)
+        terminal.ptyproc.close()
+
+    @tornado.testing.gen_test
+    async def test_output_rate_limit(self):
+        terminal = self.named_tm.new_terminal(max_output_rate=1000, rate_limit_interval=0.05)
+        client = FramesClient()
+        terminal.clients.append(client)
+        for chunk in (b"a" * 40, b"b" * 40, b"c" * 40):
+            self.named_tm.on_pty_bytes(terminal, chunk)
+            self.named_tm.flush_output(terminal)
+        # Over 50 bytes in the period; the rest is only kept in the history
+        assert [frames.binary[1:] for frames in client.frames] == [b"a" * 40]
+        assert terminal.read_buffer.end_offset == 120
+        await asyncio.sleep(0.2)
+        assert client.suppressed == [80]
+        assert terminal.rate_limit_timeout is None
+        self.named_tm.on_pty_bytes(terminal, b"d")
+        self.named_tm.flush_output(terminal)
+        assert client.frames[-1].binary[1:] == b"d"
+        await terminal.terminate(force=True)
+        terminal.ptyproc.close()
+
+    @tornado.testing.gen_test
+    async def test_screen_model_replay(self):
+        pytest.importorskip("pyte")
+        terminal = self.named_tm.new_terminal(screen_model=True, screen_history=0, height=5)
+        self.named_tm.on_pty_output(terminal, "x" * 100000 + "\r\n$ ")
+        replay = terminal.replay()
+        assert len(replay) < 1000
+        assert replay.endswith("\x1b[5;3H")
+        await terminal.terminate(force=True)
+        terminal.ptyproc.close()
+
+    @tornado.testing.gen_test
+    async def test_resume_from_offset(self):
+        tm = await self.get_term_client("/named/resume")
+        msgs = await tm.read_all_msg()
+        offset = [msg for msg in msgs if msg[0] == "stdout"][-1][2]
+        await tm.write_stdin("echo resumed\r")
+        (stdout, _) = await tm.read_stdout()
+        assert "resumed" in stdout
+        tm.close()
+        session = self.named_tm.terminals["resume"].session_id
+
+        # Only the output after the offset is sent again
+        tm = await self.get_term_client(f"/named/resume?offset={offset}&session={session}")
+        msgs = await tm.read_all_msg()
+        self.assertEqual(msgs[0], ["setup", {}])
+        self.assertEqual(msgs[1][:2], ["stdout", stdout])
+        self.assertEqual(msgs[2], ["offset", msgs[1][2], session])
+        tm.close()
+
+        # An offset which isn't available, into the output of another
+        # terminal, or malformed gets a full replay
+        for query in (
+            f"offset={offset * 1000}&session={session}",
+            f"offset={offset}&session=other",
+            f"offset={offset}",
+            "offset=x",
+        ):
+            tm = await self.get_term_client(f"/named/resume?{query}")
+            msgs = await tm.read_all_msg()
+            self.assertEqual(msgs[1], ["reset", {}])
+            assert msgs[2][1].endswith(stdout)
+            tm.close()
+
+    @tornado.testing.gen_test
+    async def test_new_named_terminals(self):
+        created = await self.named_tm.new_named_terminals(3)
+        names = [name for name, term in created]
+        assert len(set(names)) == 3
+        for name, term in created:
+            assert self.named_tm.terminals[name] is term
+            assert term.ptyproc.fd in self.named_tm.ptys_by_fd
+
+    @tornado.testing.gen_test
+    async def test_concurrent_get_terminal_spawns_once(self):
+        first, second = await asyncio.gather(
+            self.named_tm.async_get_terminal("shared"),
+            self.named_tm.async_get_terminal("shared"),
+        )
+        assert first is second
+        assert self.named_tm.terminals == {"shared": first}
+
     @tornado.testing.gen_test
     async def test_namespace(self):
         names = ["/named/1"] * 2 + ["/named/2"] * 2
@@ -334,6 +564,490 @@ class UniqueTermTests(TermTestCase):
         assert other == []
         tm.close()
 
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="The fake pty backend needs POSIX")
+    async def test_adaptive_reads(self):
+        backend = FakePtyBackend()
+        tm = UniqueTermManager(
+            shell_command=["fake"],
+            pty_backend=backend,
+            min_read_size=1024,
+            max_read_size=8192,
+            max_reads_per_wakeup=8,
+        )
+        term = await tm.async_get_terminal()
+        term.read_buf = bytearray(tm.min_read_size)
+        term.reads_per_wakeup = 1
+        # Full reads grow the buffer, and output left over the reads per wakeup
+        for reads in (1, 2, 4, 8):
+            tm._adapt_reading(term, len(term.read_buf), bulk=True, reads=reads)
+        assert len(term.read_buf) == 8192
+        assert term.reads_per_wakeup == 8
+        # Reads which don't fill a quarter of the buffer shrink both
+        tm._adapt_reading(term, 100, bulk=False, reads=1)
+        assert len(term.read_buf) == 4096
+        assert term.reads_per_wakeup == 4
+        for _ in range(4):
+            tm._adapt_reading(term, 100, bulk=False, reads=1)
+        assert len(term.read_buf) == 1024
+        assert term.reads_per_wakeup == 1
+        # Reads filling some of the buffer keep its size
+        tm._adapt_reading(term, 512, bulk=False, reads=1)
+        assert len(term.read_buf) == 1024
+        await tm.shutdown()
+        backend.close()
+        with pytest.raises(ValueError, match="Invalid read sizes"):
+            UniqueTermManager(shell_command=["cat"], min_read_size=8192, max_read_size=4096)
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Windows ptys are read from the event loop")
+    async def test_read_scheduling(self):
+        tm = UniqueTermManager(shell_command=["cat"], read_budget=300)
+        bulk = tm.new_terminal()
+        quiet = tm.new_terminal()
+        typing = tm.new_terminal()
+        for term in (bulk, quiet, typing):
+            tm.start_reading(term)
+        bulk.output_volume = 1000.0
+        await tm.write_input(typing, "x")
+        served = []
+
+        def pty_read(fd, events=None):
+            term = tm.ptys_by_fd[fd]
+            served.append(term)
+            term.bytes_read += 1000 if term is bulk else 200
+
+        tm.pty_read = pty_read
+        for term in (bulk, quiet, typing):
+            tm._handle_pty_events(term.ptyproc.fd, IOLoop.READ)
+        await asyncio.sleep(0)
+        # Typing first; the budget is spent before the bulk terminal's turn
+        assert served == [typing, quiet]
+        assert bulk.output_volume == 500
+        await tm.shutdown()
+
+    @tornado.testing.gen_test
+    async def test_stdin_ack(self):
+        for url in ("/unique", "/no_future"):
+            tm = await self.get_term_client(url)
+            await tm.read_all_msg()
+            await tm.write_msg(["stdin", "echo hello\r", 7])
+            (stdout, other) = await tm.read_stdout()
+            assert other == [["stdin_ack", 7]]
+            assert "hello" in stdout
+            tm.close()
+
+    @tornado.testing.gen_test
+    async def test_oversized_stdin_rejected(self):
+        tm = await self.get_term_client("/small_buffer")
+        await tm.read_all_msg()
+        await tm.write_msg(["stdin", "echo " + "x" * 5000 + "\r", 3])
+        (stdout, other) = await tm.read_stdout()
+        assert other == [["stdin_rejected", {"max_size": 4096, "id": 3}]]
+        assert "xxxx" not in stdout
+        tm.close()
+
+    @tornado.testing.gen_test
+    async def test_metrics(self):
+        tm = await self.get_term_client("/unique")
+        await tm.read_all_msg()
+        await tm.write_stdin("echo héllo\r")
+        await tm.read_stdout()
+        response = await self.http_client.fetch(self.get_url("/metrics"))
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        metrics = {}
+        for line in response.body.decode().splitlines():
+            if not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                metrics[name] = float(value)
+        assert metrics["terminado_terminals"] == 1
+        assert metrics["terminado_clients"] == 1
+        assert metrics["terminado_spawns_total"] == 1
+        assert metrics["terminado_websocket_connections_total"] == 1
+        # Bytes, not characters
+        assert metrics["terminado_input_bytes_total"] == len("echo héllo\r".encode())
+        fd, terminal = next(iter(self.unique_tm.ptys_by_fd.items()))
+        output = metrics[f'terminado_terminal_output_bytes_total{{terminal="{fd}"}}']
+        assert output == metrics["terminado_output_bytes_total"] > 0
+        assert output == len(terminal.read_buffer.text().encode())
+        assert metrics["terminado_pty_reads_total"] >= 1
+        assert metrics['terminado_pty_read_seconds_bucket{le="+Inf"}'] >= 1
+        assert metrics["terminado_websocket_sent_messages_total"] >= 2
+        tm.close()
+
+    @tornado.testing.gen_test
+    async def test_latency_tracing(self):
+        tm = await self.get_term_client("/unique")
+        await tm.read_all_msg()
+        for _ in range(3):
+            await tm.write_stdin("x")
+            await tm.read_stdout()
+        await tm.write_msg(["ping", 7])
+        assert await tm.read_msg() == ["pong", 7]
+        await tm.write_msg(["ping", 8, 12.5])
+        assert await tm.read_msg() == ["pong", 8]
+        # Invalid round trip times are ignored
+        for rtt in ('"soon"', "-1", "NaN", "Infinity", "null", "[]"):
+            await tm.ws.write_message(f'["ping", 9, {rtt}]')
+            assert await tm.read_msg() == ["pong", 9]
+        [report] = self.unique_tm.latency_report().values()
+        assert report["total"]["count"] == 3
+        assert report["echo"]["p50"] <= report["total"]["p50"]
+        assert report["rtt"] == {"count": 1, "p50": 0.0125, "p90": 0.0125, "p99": 0.0125}
+        response = await self.http_client.fetch(self.get_url("/metrics"))
+        assert 'stage="total",quantile="0.99"}' in response.body.decode()
+        tm.close()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Needs seq")
+    async def test_compression(self):
+        tm = await self.get_term_client("/compressed", compression_options={})
+        await tm.read_all_msg()
+        await tm.write_stdin("seq 1 3000\r")
+        (stdout, _) = await tm.read_stdout()
+        numbers = [li for li in stdout.splitlines() if li.isdigit()]
+        self.assertEqual(numbers, [str(i) for i in range(1, 3001)])
+        protocol = tm.ws.protocol
+        assert protocol._wire_bytes_in < protocol._message_bytes_in / 2
+        tm.close()
+
+    def test_compression_options(self):
+        # Only the options Tornado's get_compression_options takes are known
+        handler = TermSocket.__new__(TermSocket)
+        handler.initialize(self.unique_tm, {"mem_level": 1})
+        assert handler.get_compression_options() == {"compression_level": 1, "mem_level": 1}
+        with pytest.raises(ValueError, match="min_size"):
+            handler.initialize(self.unique_tm, {"min_size": 0})
+        with pytest.raises(ValueError, match="context_takeover"):
+            handler.initialize(self.unique_tm, {"context_takeover": False})
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Needs seq")
+    async def test_backpressure_keeps_all_output(self):
+        # A single client over its buffer limit pauses reading instead of
+        # losing output.
+        tm = await self.get_term_client("/small_buffer")
+        await tm.read_all_msg()
+        await tm.write_stdin("seq 1 30000\r")
+        (stdout, _) = await tm.read_stdout()
+        numbers = [li for li in stdout.splitlines() if li.isdigit()]
+        self.assertEqual(numbers, [str(i) for i in range(1, 30001)])
+        tm.close()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Needs seq")
+    async def test_backpressure_without_future(self):
+        # Sockets whose write_message returns None still get congested.
+        paused = []
+        pause_reading = self.small_buffer_tm.pause_reading
+
+        def record_pause(ptywclients):
+            paused.append(ptywclients)
+            pause_reading(ptywclients)
+
+        self.small_buffer_tm.pause_reading = record_pause
+        tm = await self.get_term_client("/small_buffer_no_future")
+        await tm.read_all_msg()
+        await tm.write_stdin("seq 1 30000\r")
+        (stdout, _) = await tm.read_stdout()
+        numbers = [li for li in stdout.splitlines() if li.isdigit()]
+        self.assertEqual(numbers, [str(i) for i in range(1, 30001)])
+        assert paused
+        tm.close()
+
+    def test_check_backpressure(self):
+        terminal = self.unique_tm.new_terminal()
+        self.unique_tm.start_reading(terminal)
+        clients = [PtyClient(), PtyClient()]
+        terminal.clients.extend(clients)
+        clients[0].congested = True
+        self.unique_tm.check_backpressure(terminal)
+        assert not terminal.reading_paused
+        clients[1].congested = True
+        self.unique_tm.check_backpressure(terminal)
+        assert terminal.reading_paused
+        clients[0].congested = False
+        self.unique_tm.check_backpressure(terminal)
+        assert not terminal.reading_paused
+
+    @tornado.testing.gen_test
+    async def test_terminal_pool(self):
+        tm = UniqueTermManager(shell_command=["bash"], pool_size=1, pool_refill_interval=0.01)
+        tm.start_pool()
+        await asyncio.sleep(0.1)
+        assert len(tm.pool) == 1
+        pooled = tm.pool[0]
+        # Options the pooled terminals weren't spawned with need a new one,
+        # size included, as it is in their environment
+        resized = tm.new_terminal(height=30, width=100)
+        assert resized is not pooled
+        assert list(tm.pool) == [pooled]
+        fresh = tm.new_terminal(cwd="/")
+        assert fresh is not pooled
+        term = tm.new_terminal(height=25, width=80)
+        assert term is pooled
+        await asyncio.sleep(0.1)
+        assert len(tm.pool) == 1
+        for started in (term, fresh, resized):
+            tm.start_reading(started)
+        refilled = tm.pool[0]
+        await tm.shutdown()
+        assert not tm.pool
+        assert not refilled.ptyproc.isalive()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="I/O threads need POSIX")
+    async def test_io_threads(self):
+        tm = UniqueTermManager(shell_command=["bash"], io_threads=2)
+        clients = []
+        for _ in range(3):
+            term = await tm.async_get_terminal()
+            client = PtyClient()
+            term.clients.append(client)
+            clients.append(client)
+            tm.write_input(term, "seq 1 20000; exit\r")
+        for _ in range(250):
+            if all(client.died for client in clients):
+                break
+            await asyncio.sleep(0.02)
+        for client in clients:
+            assert client.died
+            numbers = [li for li in client.text.splitlines() if li.isdigit()]
+            assert numbers == [str(i) for i in range(1, 20001)]
+        assert not tm.ptys_by_fd
+        threads = tm._reader_threads
+        assert len(threads) == 2
+        await tm.shutdown()
+        assert not any(thread.is_alive() for thread in threads)
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Worker processes need POSIX")
+    async def test_worker_processes(self):
+        tm = UniqueTermManager(shell_command=["bash"], worker_processes=2)
+        clients = []
+        terms = []
+        for _ in range(3):
+            term = await tm.async_get_terminal()
+            client = PtyClient()
+            term.clients.append(client)
+            clients.append(client)
+            terms.append(term)
+        assert sorted(len(worker.ptys) for worker in tm.worker_pool.workers) == [1, 2]
+        for term in terms:
+            await tm.write_input(term, "seq 1 20000; exit\r")
+        for _ in range(250):
+            if all(client.died for client in clients):
+                break
+            await asyncio.sleep(0.02)
+        for client, term in zip(clients, terms):
+            assert client.died
+            numbers = [li for li in client.text.splitlines() if li.isdigit()]
+            assert numbers == [str(i) for i in range(1, 20001)]
+            assert term.read_buffer.end_offset == len(client.text.encode("utf-8"))
+        assert not tm.ptys_by_fd
+        workers = tm.worker_pool.workers
+        await tm.shutdown()
+        assert all(worker.proc.poll() is not None for worker in workers)
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Worker processes need POSIX")
+    async def test_worker_encodes_json_for_json_clients(self):
+        tm = UniqueTermManager(shell_command=["bash"], worker_processes=1)
+        term = await tm.async_get_terminal()
+        client = FramesClient()
+        term.clients.append(client)
+        await tm.write_input(term, "echo one\r")
+        for _ in range(250):
+            if "one\r\n" in "".join(frames.text for frames in client.frames):
+                break
+            await asyncio.sleep(0.02)
+        # Only binary clients: the worker sends no JSON
+        assert client.frames
+        assert all(frames._json is None for frames in client.frames)
+        seen = len(client.frames)
+        client.binary = False
+        await tm.write_input(term, "seq 1 3; sleep 0.2; seq 4 6; exit\r")
+        for _ in range(250):
+            if client.died:
+                break
+            await asyncio.sleep(0.02)
+        assert client.died
+        encoded = [frames for frames in client.frames[seen:] if frames._json is not None]
+        assert encoded
+        for frames in encoded:
+            assert json.loads(frames.json) == ["stdout", frames.text, frames.offset]
+        await tm.shutdown()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="The fake pty backend needs POSIX")
+    async def test_fake_pty_backend(self):
+        script = "".join(f"line {i}\r\n" for i in range(2000)).encode()
+        backend = FakePtyBackend(output=script, chunk_size=1000, exit_when_done=True)
+        tm = UniqueTermManager(shell_command=["fake"], pty_backend=backend)
+        clients = []
+        for _ in range(100):
+            term = await tm.async_get_terminal()
+            client = PtyClient()
+            term.clients.append(client)
+            clients.append(client)
+        for _ in range(250):
+            if all(client.died for client in clients):
+                break
+            await asyncio.sleep(0.02)
+        for client in clients:
+            assert client.died
+            assert client.text == script.decode()
+        assert not tm.ptys_by_fd
+
+        idle = FakePtyBackend()
+        tm = UniqueTermManager(shell_command=["fake"], pty_backend=idle)
+        term = await tm.async_get_terminal()
+        assert await term.terminate()
+        assert term.ptyproc.signalstatus == signal.SIGHUP
+        await tm.shutdown()
+        backend.close()
+        idle.close()
+
+        with pytest.raises(ValueError, match="pty_backend"):
+            UniqueTermManager(shell_command=["fake"], pty_backend=idle, worker_processes=1)
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="The fake pty backend needs POSIX")
+    async def test_cull_terminals(self):
+        class CullingTermManager(NamedTermManager):
+            def on_terminal_culled(self, ptywclients, reason):
+                culled.append((ptywclients.term_name, reason))
+
+        culled = []
+        backend = FakePtyBackend()
+        metrics = TermMetrics()
+        tm = CullingTermManager(
+            shell_command=["fake"],
+            pty_backend=backend,
+            metrics=metrics,
+            terminado_cull_inactive_timeout=60,
+            terminado_cull_max_age=3600,
+        )
+        idle = await tm.async_get_terminal("idle")
+        watched = await tm.async_get_terminal("watched")
+        old = await tm.async_get_terminal("old")
+        recent = await tm.async_get_terminal("recent")
+        watched.clients.append(PtyClient())
+        for term in (idle, watched, recent):
+            term.started -= 120
+        old.started -= 7200
+        recent.last_disconnect = IOLoop.current().time() - 30
+        # Whether fake terminals are busy can't be told, so they are spared
+        assert idle.has_foreground_job() is None
+        assert await tm.cull_terminals() == []
+        tm.terminado_cull_busy = True
+        assert await tm.cull_terminals() == [idle, old]
+        assert sorted(culled) == [("idle", "inactive"), ("old", "max_age")]
+        assert metrics.culled.value == 2
+        for _ in range(100):
+            if sorted(tm.terminals) == ["recent", "watched"]:
+                break
+            await asyncio.sleep(0.01)
+        assert sorted(tm.terminals) == ["recent", "watched"]
+        await tm.shutdown()
+        backend.close()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="The fake pty backend needs POSIX")
+    async def test_sync_overrides_respected(self):
+        class GreetingTermManager(UniqueTermManager):
+            def get_terminal(self, url_component=None):
+                term = super().get_terminal(url_component)
+                greeted.append(term)
+                return term
+
+        class NamingTermManager(NamedTermManager):
+            def new_terminal(self, **kwargs):
+                term = super().new_terminal(**kwargs)
+                named.append(term)
+                return term
+
+        greeted = []
+        named = []
+        backend = FakePtyBackend()
+        unique_tm = GreetingTermManager(shell_command=["fake"], pty_backend=backend)
+        named_tm = NamingTermManager(shell_command=["fake"], pty_backend=backend)
+        term = await unique_tm.async_get_terminal()
+        assert greeted == [term]
+        term = await named_tm.async_get_terminal("term1")
+        assert named == [term]
+        await unique_tm.shutdown()
+        await named_tm.shutdown()
+        backend.close()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Foreground jobs are only seen on POSIX")
+    async def test_culler_spares_busy_terminals(self):
+        tm = UniqueTermManager(
+            shell_command=["bash"],
+            terminado_cull_inactive_timeout=0.2,
+            terminado_cull_interval=0.05,
+        )
+        term = await tm.async_get_terminal()
+        await tm.write_input(term, "sleep 30\r")
+        for _ in range(100):
+            if term.has_foreground_job():
+                break
+            await asyncio.sleep(0.01)
+        assert term.has_foreground_job()
+        await asyncio.sleep(0.5)
+        assert term.ptyproc.isalive()
+        # Interrupt the job: the shell is idle now
+        tm.write_input(term, "\x03")
+        for _ in range(200):
+            if not tm.ptys_by_fd:
+                break
+            await asyncio.sleep(0.01)
+        assert not tm.ptys_by_fd
+        assert not term.ptyproc.isalive()
+        await tm.shutdown()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="The spawn helper needs POSIX")
+    async def test_spawn_helper(self):
+        tm = UniqueTermManager(shell_command=["bash"], spawn_helper=True)
+        term = await tm.async_get_terminal()
+        client = PtyClient()
+        term.clients.append(client)
+        tm.write_input(term, "echo $((6 * 7))\r")
+        for _ in range(100):
+            if "42" in client.text:
+                break
+            await asyncio.sleep(0.02)
+        assert "42" in client.text
+        await tm.shutdown()
+        assert not term.ptyproc.isalive()
+
+    @tornado.testing.gen_test
+    @pytest.mark.skipif(os.name == "nt", reason="Input is written from a thread on Windows")
+    async def test_stuck_stdin_doesnt_block_others(self):
+        tm = self.unique_tm
+        stuck = tm.new_terminal(shell_command=["sleep", "30"])
+        echo = tm.new_terminal(shell_command=["cat"])
+        client = PtyClient()
+        echo.clients.append(client)
+        tm.start_reading(stuck)
+        tm.start_reading(echo)
+        # More than the pty will take while nothing reads it
+        stuck_written = tm.write_input(stuck, ("x" * 99 + "\n") * 1000)
+        tm.write_input(echo, "ping\n")
+        for _ in range(100):
+            if "ping" in client.text:
+                break
+            await asyncio.sleep(0.02)
+        assert "ping" in client.text
+        assert stuck.input_buffer
+        assert not stuck_written.done()
+        for terminal in (stuck, echo):
+            await terminal.terminate(force=True)
+        # Input which can't be written any more is given up on
+        await stuck_written
+
 
 if __name__ == "__main__":
     unittest.main()
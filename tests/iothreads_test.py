@@ -0,0 +1,78 @@
+# iothreads_test.py -- Unit tests for the pty reader threads
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+
+import contextlib
+import os
+import queue
+import socket
+import threading
+import time
+import types
+
+import pytest
+
+from terminado.iothreads import PtyReaderThread
+
+
+class SocketPty:
+    """Stands in for a PtyWithClients, reading one end of a socket pair."""
+
+    def __init__(self, sock):
+        self.ptyproc = types.SimpleNamespace(fd=sock.fileno())
+
+    def readinto_nonblocking(self, buffer):
+        try:
+            n = os.readv(self.ptyproc.fd, [buffer])
+        except BlockingIOError:
+            return None
+        if not n:
+            raise EOFError
+        return n
+
+
+@pytest.mark.skipif(os.name == "nt", reason="I/O threads need POSIX")
+def test_pending_output_is_bounded():
+    reader, writer = socket.socketpair()
+    reader.setblocking(False)
+    total = 4 * 1024 * 1024
+
+    def produce():
+        writer.sendall(b"x" * total)
+        writer.close()
+
+    batches = queue.Queue()
+    thread = PtyReaderThread(batches.put, read_size=4096, max_pending=16384)
+    pty = SocketPty(reader)
+    thread.add(pty)
+    thread.start()
+    producer = threading.Thread(target=produce)
+    producer.start()
+
+    # A slow loop, consuming one batch at a time
+    unconsumed = []
+    received = pending = most_pending = 0
+    eof = False
+    while not eof:
+        if not unconsumed:
+            unconsumed.append(batches.get(timeout=10))
+        with contextlib.suppress(queue.Empty):
+            while True:
+                unconsumed.append(batches.get_nowait())
+        pending = sum(len(data) for batch in unconsumed for _, data in batch if data)
+        most_pending = max(most_pending, pending)
+        time.sleep(0.001)
+        for ptywclients, data in unconsumed.pop(0):
+            if data is None:
+                eof = True
+            else:
+                received += len(data)
+                thread.consumed(ptywclients, len(data))
+    producer.join()
+    thread.stop()
+    reader.close()
+    assert eof
+    assert received == total
+    # One read more than the limit at most
+    assert most_pending <= 16384 + 4096
@@ -0,0 +1,38 @@
+# metrics_test.py -- Unit tests for the metrics in text format
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+
+from terminado.metrics import Counter, Histogram, TermMetrics
+
+
+def test_counter():
+    counter = Counter("things_total", "Things.")
+    counter.inc()
+    counter.inc(2)
+    assert counter.render() == [
+        "# HELP things_total Things.",
+        "# TYPE things_total counter",
+        "things_total 3",
+    ]
+
+
+def test_histogram():
+    histogram = Histogram("sizes", "Sizes.", (10, 100))
+    for value in (5, 10, 50, 500):
+        histogram.observe(value)
+    assert histogram.render()[2:] == [
+        'sizes_bucket{le="10"} 2',
+        'sizes_bucket{le="100"} 3',
+        'sizes_bucket{le="+Inf"} 4',
+        "sizes_sum 565",
+        "sizes_count 4",
+    ]
+
+
+def test_no_managers():
+    text = TermMetrics().render()
+    assert text.endswith("\n")
+    assert "terminado_terminals 0\n" in text
+    assert "terminado_output_bytes_total 0\n" in text
+    assert 'terminado_spawn_seconds_bucket{le="+Inf"} 0\n' in text
@@ -0,0 +1,40 @@
+# ratelimit_test.py -- Unit tests for output rate limits
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+
+import pytest
+
+from terminado.ratelimit import OutputRateLimit
+
+
+def test_byte_rate():
+    limit = OutputRateLimit(max_bytes_per_s=100)
+    assert limit.allow(60, now=0.0)
+    assert not limit.allow(60, now=0.5)
+    assert not limit.allow(10, now=0.9)
+    assert limit.take_suppressed() == 70
+    assert limit.take_suppressed() == 0
+    # Still too fast over the period
+    assert not limit.end_period(now=1.0)
+    limit.allow(150, now=1.5)
+    assert not limit.end_period(now=2.0)
+    limit.allow(50, now=2.5)
+    assert limit.end_period(now=3.0)
+    assert limit.allow(50, now=3.1)
+
+
+def test_frame_rate():
+    limit = OutputRateLimit(max_frames_per_s=2, interval=0.5)
+    assert limit.allow(1, now=0.0)
+    assert not limit.allow(1, now=0.1)
+    assert limit.suppressing
+    assert not limit.end_period(now=0.6)
+    # Quiet for a period
+    assert limit.end_period(now=1.1)
+    assert limit.allow(1, now=1.2)
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError, match="policy"):
+        OutputRateLimit(max_bytes_per_s=1, policy="drop")
@@ -0,0 +1,57 @@
+# screen_test.py -- Unit tests for the headless screen model
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+
+import pytest
+
+pytest.importorskip("pyte")
+
+from terminado.screen import ScreenModel
+
+
+def cells(screen, line):
+    return [line[x] for x in range(screen.columns)]
+
+
+def assert_same_screen(a, b):
+    assert a.screen.display == b.screen.display
+    history_a = [cells(a.screen, line) for line in a.screen.history.top]
+    history_b = [cells(b.screen, line) for line in b.screen.history.top]
+    assert history_a == history_b
+    for y in range(a.screen.lines):
+        assert cells(a.screen, a.screen.buffer[y]) == cells(b.screen, b.screen.buffer[y])
+    assert (a.screen.cursor.x, a.screen.cursor.y) == (b.screen.cursor.x, b.screen.cursor.y)
+
+
+def test_render_reproduces_screen():
+    model = ScreenModel(rows=5, cols=20)
+    model.feed("plain\r\n\x1b[1;31mbold red\x1b[0m \x1b[38;5;200mpink\x1b[0m\r\n")
+    model.feed("\x1b[48;2;1;2;3mtrue\x1b[7mrev\x1b[0m wide: 中文\r\n$ ")
+
+    replica = ScreenModel(rows=5, cols=20)
+    replica.feed(model.render())
+    assert_same_screen(model, replica)
+
+
+def test_render_size_is_bounded_by_screen():
+    model = ScreenModel(rows=10, cols=40, history=5)
+    for i in range(10000):
+        model.feed(f"line {i}\r\n")
+    rendered = model.render()
+    assert len(rendered) < 20 * 45
+    assert "line 9999" in rendered
+    # 9 lines on screen above the cursor, 5 more in the history
+    assert "line 9986" in rendered
+    assert "line 9985" not in rendered
+
+    replica = ScreenModel(rows=10, cols=40, history=5)
+    replica.feed(rendered)
+    assert_same_screen(model, replica)
+
+
+def test_resize():
+    model = ScreenModel(rows=5, cols=20)
+    model.resize(3, 10)
+    model.feed("0123456789abc")
+    assert model.screen.display[1].startswith("abc")
@@ -0,0 +1,62 @@
+# scrollback_test.py -- Unit tests for the scrollback buffer
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+
+from terminado.scrollback import ScrollbackBuffer
+
+
+def test_keeps_recent_bytes_within_budget():
+    buf = ScrollbackBuffer(maxbytes=10, block_size=4)
+    for i in range(20):
+        buf.append(str(i % 10))
+        assert buf.nbytes <= 10
+    assert buf.getvalue() == b"0123456789"
+    assert buf.allocated <= 10 + 2 * 4
+
+
+def test_large_chunk_keeps_tail():
+    buf = ScrollbackBuffer(maxbytes=8, block_size=3)
+    buf.append("abc")
+    buf.append("0123456789")
+    assert buf.getvalue() == b"23456789"
+    assert len(buf) == 8
+
+
+def test_text_skips_cut_character():
+    buf = ScrollbackBuffer(maxbytes=5)
+    buf.append("xééé")  # 1 + 3 * 2 bytes
+    assert buf.getvalue() == "ééé".encode()[1:]
+    assert buf.text() == "éé"
+
+
+def test_blocks_are_reused():
+    buf = ScrollbackBuffer(maxbytes=16, block_size=4)
+    buf.append("x" * 16)
+    allocated = buf.allocated
+    for _ in range(100):
+        buf.append("y" * 3)
+    assert buf.allocated <= allocated + 2 * 4
+    buf.clear()
+    assert buf.nbytes == 0
+    assert buf.text() == ""
+
+
+def test_zero_budget_keeps_nothing():
+    buf = ScrollbackBuffer(maxbytes=0)
+    buf.append("hello")
+    assert not buf
+    assert buf.allocated == 0
+
+
+def test_offsets():
+    buf = ScrollbackBuffer(maxbytes=6, block_size=4)
+    buf.append("abc")
+    buf.append("défg")
+    assert buf.end_offset == 8
+    assert buf.start_offset == 2
+    assert buf.read_from(8) == b""
+    assert buf.read_from(3) == "défg".encode()
+    assert buf.read_from(2) == "cdéfg".encode()
+    assert buf.read_from(1) is None
+    assert buf.read_from(9) is None
@@ -0,0 +1,72 @@
+"""Tests for the terminal spawn helper process."""
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+import os
+import signal
+import time
+
+import pytest
+
+if os.name == "nt":
+    pytest.skip("The spawn helper needs POSIX", allow_module_level=True)
+
+from terminado.spawnhelper import SpawnHelper
+
+
+@pytest.fixture
+def helper():
+    helper = SpawnHelper()
+    helper.start()
+    yield helper
+    helper.close()
+
+
+def read_all(fd):
+    output = b""
+    while True:
+        try:
+            data = os.read(fd, 1024)
+        except OSError:  # EIO once the process has exited, on Linux
+            break
+        if not data:
+            break
+        output += data
+    return output
+
+
+def test_spawn(helper, tmp_path):
+    proc = helper.spawn(["sh", "-c", "pwd; echo $GREETING"], {"GREETING": "hello"}, str(tmp_path))
+    try:
+        assert proc.getwinsize() == (24, 80)
+        output = read_all(proc.fd).decode()
+        assert output.split() == [str(tmp_path), "hello"]
+    finally:
+        proc.close()
+
+
+def test_liveness_and_signals(helper):
+    proc = helper.spawn(["sleep", "30"])
+    try:
+        assert proc.isalive()
+        proc.kill(signal.SIGKILL)
+        read_all(proc.fd)
+        for _ in range(100):
+            if not proc.isalive():
+                break
+            time.sleep(0.01)
+        assert not proc.isalive()
+    finally:
+        proc.close()
+
+
+def test_missing_command(helper):
+    with pytest.raises(FileNotFoundError):
+        helper.spawn(["terminado-no-such-command"])
+
+
+def test_restarts_helper(helper):
+    helper._proc.kill()
+    helper._proc.wait()
+    proc = helper.spawn(["true"])
+    proc.close()
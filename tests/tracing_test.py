@@ -0,0 +1,36 @@
+# tracing_test.py -- Unit tests for the input latency trace
+
+# Copyright (c) Jupyter Development Team
+# Distributed under the terms of the Simplified BSD License.
+
+import pytest
+
+from terminado.tracing import LatencyTrace
+
+
+def test_stages():
+    trace = LatencyTrace()
+    trace.received(1.0)
+    trace.queued(5, 1.5)
+    trace.queued(8, 2.0)  # Not received on a websocket
+    trace.written(5, 3.0)
+    trace.output(4.0)
+    # The second message is not written yet, so can't have been echoed
+    assert list(trace.samples["total"]) == [3.0]
+    trace.written(8, 5.0)
+    trace.output(7.0)
+    assert list(trace.samples["queue"]) == [0.5, 0.0]
+    assert list(trace.samples["write"]) == [1.5, 3.0]
+    assert list(trace.samples["echo"]) == [1.0, 2.0]
+    assert list(trace.samples["total"]) == [3.0, 5.0]
+
+
+def test_percentiles():
+    trace = LatencyTrace(samples=100)
+    for i in range(200):
+        trace.round_trip(i / 1000)
+    report = trace.percentiles()
+    assert list(report) == ["rtt"]
+    assert report["rtt"]["count"] == 100
+    assert report["rtt"]["p50"] == pytest.approx(0.15)
+    assert report["rtt"]["p99"] == pytest.approx(0.199)